@@ -0,0 +1,95 @@
+import json
+
+from django.conf import settings
+from django.db import connections
+
+from books.models import BookCounter
+
+
+class ListCount:
+    """
+        Number shown in list headers, '1234' or '~1.2M' if estimated.
+    """
+
+    UNITS = ((1_000_000_000, 'B'), (1_000_000, 'M'), (1_000, 'K'))
+
+    def __init__(self, value, is_estimate=False):
+        self.value = value
+        self.is_estimate = is_estimate
+
+    def __str__(self):
+        if not self.is_estimate:
+            return str(self.value)
+
+        for size, unit in self.UNITS:
+            if self.value >= size:
+                number = f'{self.value / size:.1f}'.removesuffix('.0')
+                return f'~{number}{unit}'
+        return f'~{self.value}'
+
+    def __int__(self):
+        return self.value
+
+    def __eq__(self, other):
+        if isinstance(other, ListCount):
+            return (self.value, self.is_estimate) == (other.value, other.is_estimate)
+        return self.value == other
+
+
+def counter_count(scope, key=''):
+    """
+        Exact count kept in BookCounter, one indexed query.
+        key may be an expression, e.g. subquery of the user id by username.
+    """
+
+    if not hasattr(key, 'resolve_expression'):
+        key = str(key)
+    count = BookCounter.objects.filter(scope=scope, key=key).values_list(
+        'count', flat=True).first()
+    return ListCount(count or 0)
+
+
+def planner_estimate(queryset):
+    """
+        Rows PostgreSQL expects the query to return, without running it.
+        Whole table - pg_class.reltuples(updated by VACUUM/ANALYZE),
+        filtered query - 'Plan Rows' of EXPLAIN.
+        None if not PostgreSQL or the table was never analyzed.
+        https://wiki.postgresql.org/wiki/Count_estimate
+    """
+
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 - never analyzed.
+        if row and row[0] >= 0:
+            return int(row[0])
+        return None
+
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimated_count(queryset, threshold=None):
+    """
+        Exact COUNT(*) limited to threshold + 1 rows, so it never reads more than that.
+        Above the threshold the planner estimate is used.
+    """
+
+    threshold = threshold or settings.BOOK_COUNT_ESTIMATE_THRESHOLD
+    count = queryset.order_by()[:threshold + 1].count()
+    if count <= threshold:
+        return ListCount(count)
+
+    estimate = planner_estimate(queryset)
+    if estimate is None:
+        return ListCount(queryset.count())
+    # planner may guess lower than the rows already counted.
+    return ListCount(max(estimate, count), is_estimate=True)
@@ -1,10 +1,11 @@
 from django import forms
-from django.utils.text import slugify
+from library_project.utils import ImageUploadMixin
 
 from books.models import Book, Comment
 
 
-class BookForm(forms.ModelForm):
+class BookForm(ImageUploadMixin, forms.ModelForm):
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['image'].widget.attrs['class'] = 'form-control'
@@ -12,7 +13,8 @@ class BookForm(forms.ModelForm):
 
     class Meta:
         model = Book
-        exclude = ('date_posted', 'slug', 'posted_by')
+        exclude = ('date_posted', 'slug', 'posted_by', 'image_status', 'image_version',
+                   'image_width')
         help_texts = {
             'author': 'If your author does not exist, contact site.',
         }
@@ -24,13 +26,16 @@ class BookForm(forms.ModelForm):
         cleaned_data = super().clean()
         title = cleaned_data.get('title')
         author = cleaned_data.get('author')
-        possible_slug = slugify(f"{title} {author}")
-        if possible_slug in Book.objects.values_list('slug', flat=True):
+        # same title(in any case) and author, not the slug - slugs of long titles are cut
+        # to the same base, Book.save numbers them(allocate_slug).
+        if title and author and Book.objects.filter(
+                title__iexact=title, author=author).exclude(pk=self.instance.pk).exists():
             raise forms.ValidationError(
                 'Book with given title and author already exists!')
 
 
-class UpdateBookForm(forms.ModelForm):
+class UpdateBookForm(ImageUploadMixin, forms.ModelForm):
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['image'].widget.attrs['class'] = 'form-control'
@@ -38,7 +43,8 @@ class UpdateBookForm(forms.ModelForm):
 
     class Meta:
         model = Book
-        exclude = ('date_posted', 'slug', 'posted_by')
+        exclude = ('date_posted', 'slug', 'posted_by', 'image_status', 'image_version',
+                   'image_width')
 
 
 class CommentForm(forms.ModelForm):
@@ -66,7 +72,8 @@ class BookOrderForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.fields['order_by'].label = "Sort By"
 
-    author_choice = ['author__first_name', 'author__last_name']
+    # Book.author_name, first and last name of the author.
+    author_choice = ['author_name']
 
     CHOICES = (
         ('-date_posted', 'Date added(newest)'),
@@ -92,3 +99,14 @@ class BookOrderForm(forms.Form):
         if order_by not in params:
             raise forms.ValidationError('Invalid Order Paramater.')
         return order_by
+
+
+class SearchForm(forms.Form):
+    QUERY_MAX_LENGTH = 200
+
+    # ?q= - the same name as in the search field of the navbar.
+    q = forms.CharField(max_length=QUERY_MAX_LENGTH, label='Search')
+    genre = forms.ChoiceField(
+        choices=[('', 'All genres')] + Book.GENRE_CHOICES,
+        required=False,
+    )
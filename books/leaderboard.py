@@ -0,0 +1,16 @@
+# Ties are ordered by title, then id - the same order as the leaderboard indexes(Book.Meta).
+LEADERBOARD_ORDER = ('-likes_count', 'title', 'id')
+
+
+def most_liked(queryset, limit, genre=None):
+    """
+        Top 'limit' liked books, of all books or of one genre.
+        Book.likes_count is changed on every like(books/signals.py),
+        so this reads the first rows of a partial index(book_leaderboard_idx,
+        book_genre_leaderboard_idx), no likes are counted.
+        Books without likes are not ranked.
+    """
+
+    if genre:
+        queryset = queryset.filter(genre=genre)
+    return queryset.filter(likes_count__gt=0).order_by(*LEADERBOARD_ORDER)[:limit]
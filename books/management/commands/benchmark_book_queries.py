@@ -0,0 +1,192 @@
+import ast
+import json
+import time
+
+from books.forms import BookOrderForm
+from books.leaderboard import most_liked
+from books.models import Author, Book
+from books.pagination import KeysetPaginator
+from books.views import (AuthorBookListView, BookListView, FavouritesView,
+                         GenreBookListView, MyBookListView,
+                         ProfileBookListView, RecommendedBookListView,
+                         book_cards_query)
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from users.models import ProfileFavouriteBooks
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+        Seed a large library, EXPLAIN the page query of every book list view
+        with every BookOrderForm order and the leaderboards, and fail if any of them reads
+        the whole books table(Seq Scan) instead of an index or sorts the rows.
+        Everything runs in a transaction which is rolled back at the end.
+
+        python manage.py benchmark_book_queries --books 200000 --analyze
+    """
+
+    help = 'Check with EXPLAIN that book list queries use indexes.'
+
+    PAGE_SIZE = BookListView.paginate_by
+
+    # the order is not read from an index, all matching rows are sorted for every page.
+    SORT_NODES = ('Sort', 'Incremental Sort')
+
+    # Saved books of one user are found through ProfileFavouriteBooks, only their saved order
+    # is an index(favourite_user_created_idx), other orders sort the books of the user.
+    SORTED_ORDERS = {'favourites'}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--books', type=int, default=100_000,
+            help='Number of seeded books.')
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Run the queries(EXPLAIN ANALYZE) and print their time.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN plans are checked on PostgreSQL only.')
+
+        self.analyze = options['analyze']
+        try:
+            with transaction.atomic():
+                self.seed(options['books'])
+                failed = self.benchmark()
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failed:
+            raise CommandError(
+                f'{len(failed)} queries read the whole table or sort: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('All book list queries use indexes.'))
+
+    def seed(self, books_count):
+        started = time.monotonic()
+        self.users = User.objects.bulk_create(
+            User(username=f'benchmark-user-{index}') for index in range(100))
+        authors = Author.objects.bulk_create(
+            Author(first_name=f'First{index}', last_name=f'Last{index}',
+                   image='https://example.com/author.jpg',
+                   birth_date='2000-01-01', biography='Biography')
+            for index in range(max(books_count // 20, 1)))
+        genres = [choice[0] for choice in Book.GENRE_CHOICES]
+        now = timezone.now()
+
+        # bulk_create skips save(), counters and images are not needed here.
+        Book.objects.bulk_create(
+            (Book(title=f'Title {index}', author=authors[index % len(authors)],
+                  author_name=str(authors[index % len(authors)]),
+                  language=f'Language {index % 30}', genre=genres[index % len(genres)],
+                  description='Description', slug=f'benchmark-book-{index}',
+                  date_posted=now - timezone.timedelta(minutes=index),
+                  likes_count=index % 50,
+                  posted_by=self.users[index % len(self.users)])
+             for index in range(books_count)),
+            batch_size=5000)
+        self.books = list(Book.objects.order_by('pk').values_list('pk', flat=True)[:50])
+        ProfileFavouriteBooks.objects.bulk_create(
+            ProfileFavouriteBooks(user_id=self.users[0].pk, book_id=book_id)
+            for book_id in self.books)
+        self.author = authors[0]
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE books_book, books_author, users_profilefavouritebooks')
+        self.stdout.write(
+            f'Seeded {books_count} books in {time.monotonic() - started:.1f}s.')
+
+    def views(self):
+        """ (name, view class, url kwargs) of every book list view. """
+
+        user = self.users[0]
+        return [
+            ('library', BookListView, {}),
+            ('genre', GenreBookListView, {'genre': Book.GENRE_COMEDY}),
+            ('author', AuthorBookListView, {'pk': self.author.pk, 'author': str(self.author)}),
+            ('profile', ProfileBookListView, {'profile': user.username}),
+            ('my_books', MyBookListView, {}),
+            ('favourites', FavouritesView, {}),
+        ]
+
+    def get_queryset(self, view_class, kwargs, order_by):
+        request = RequestFactory().get('/', {'order_by': order_by} if order_by else {})
+        request.user = self.users[0]
+        view = view_class()
+        view.setup(request, **kwargs)
+        view.order_by = order_by
+        return view.get_queryset()
+
+    def page_queries(self, queryset):
+        """ First page and a page in the middle(cursor) as the keyset paginator runs them. """
+
+        paginator = KeysetPaginator(queryset, self.PAGE_SIZE)
+        ordered = queryset.order_by(*paginator.ordering)
+        middle = ordered[ordered.count() // 2:][:1]
+        yield 'first', ordered[:self.PAGE_SIZE + 1]
+        for book in middle:
+            values = [paginator.field_value(book, field) for field in paginator.ordering]
+            yield 'middle', ordered.filter(paginator.keyset_filter(values))[:self.PAGE_SIZE + 1]
+
+    def plan_nodes(self, plan):
+        yield plan
+        for child in plan.get('Plans', []):
+            yield from self.plan_nodes(child)
+
+    def explain(self, queryset, allow_sort=False):
+        options = {'format': 'json', 'analyze': self.analyze}
+        result = json.loads(queryset.explain(**options))[0]
+        nodes = list(self.plan_nodes(result['Plan']))
+        full_scans = [node for node in nodes
+                      if node['Node Type'] == 'Seq Scan'
+                      and node.get('Relation Name') == Book._meta.db_table
+                      or node['Node Type'] in self.SORT_NODES and not allow_sort]
+        scans = sorted({node['Node Type'] for node in nodes
+                        if 'Scan' in node['Node Type'] or node['Node Type'] in self.SORT_NODES})
+        return full_scans, scans, result.get('Execution Time')
+
+    def leaderboard_queries(self):
+        queryset = book_cards_query(Book.objects.all())
+        yield 'leaderboard', most_liked(queryset, RecommendedBookListView.max_top)
+        for genre, _ in Book.GENRE_CHOICES:
+            yield f'leaderboard {genre}', most_liked(queryset, RecommendedBookListView.top, genre)
+
+    def benchmark(self):
+        failed = []
+        for label, query in self.leaderboard_queries():
+            full_scans, scans, execution_time = self.explain(query)
+            failed += self.report(label, full_scans, scans, execution_time)
+
+        for name, view_class, kwargs in self.views():
+            # None - order of the view without ?order_by, e.g. saved order of favourites.
+            for order_by in [None] + [choice for choice, _ in BookOrderForm.CHOICES]:
+                if order_by is None:
+                    ordering = ['default']
+                elif order_by.startswith('['):
+                    ordering = ast.literal_eval(order_by)
+                else:
+                    ordering = [order_by]
+                queryset = self.get_queryset(view_class, kwargs, order_by)
+                allow_sort = order_by is not None and name in self.SORTED_ORDERS
+                for page, query in self.page_queries(queryset):
+                    label = f'{name} {"/".join(ordering)} {page}'
+                    full_scans, scans, execution_time = self.explain(query, allow_sort)
+                    failed += self.report(label, full_scans, scans, execution_time)
+        return failed
+
+    def report(self, label, full_scans, scans, execution_time):
+        """ Print the result of one query, returns [label] if it failed. """
+
+        timing = f' {execution_time:.2f}ms' if execution_time is not None else ''
+        if full_scans:
+            self.stdout.write(self.style.ERROR(f'FAIL {label}: {", ".join(scans)}{timing}'))
+            return [label]
+        self.stdout.write(f'ok   {label}: {", ".join(scans)}{timing}')
+        return []
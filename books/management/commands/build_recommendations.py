@@ -0,0 +1,160 @@
+from itertools import chain
+from multiprocessing import Pool
+
+import numpy as np
+from books.models import Book, SimilarBook
+from books.similarity import (init_worker, item_matrix, related_rows,
+                              top_neighbours)
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.models import Profile, ProfileFavouriteBooks
+
+
+class Command(BaseCommand):
+    """
+        Users who liked or saved this book also liked...
+        1. Likes and saves are streamed from the DB into a sparse books x users matrix,
+           16 bytes per interaction, nothing is loaded as model instances.
+        2. Cosine similarity of every book with all others is computed in blocks of
+           --block-size books in a process pool, memory of a block doesn't depend on
+           the number of books.
+        3. --neighbours best neighbours of every book replace its SimilarBook rows.
+
+        --incremental - only books with changed likes or saves(Book.neighbours_stale)
+        and books related to them, e.g. every hour from cron.
+
+        python manage.py build_recommendations --workers 4
+        python manage.py build_recommendations --incremental
+    """
+
+    help = 'Compute similar books from likes and saves for personalized recommendations.'
+
+    SOURCE = SimilarBook.SOURCE_LIKES
+    # Book flag of the books to compute again with --incremental.
+    STALE_FIELD = 'neighbours_stale'
+    NOTHING_CHANGED = 'No books with changed likes or saves.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours', type=int, default=20,
+            help='Similar books stored for every book.')
+        parser.add_argument(
+            '--min-score', type=float, default=0.05,
+            help='Cosine similarity below this is not stored.')
+        parser.add_argument(
+            '--block-size', type=int, default=500,
+            help='Books computed at once by a worker.')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of processes, defaults to the number of CPUs.')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only books changed since the last run.')
+
+    def handle(self, *args, **options):
+        stale = self.take_stale_books()
+        if options['incremental'] and not stale:
+            self.stdout.write(self.NOTHING_CHANGED)
+            return
+
+        try:
+            computed = self.build(stale if options['incremental'] else None, options)
+        except BaseException:
+            # computed again by the next run.
+            if stale:
+                Book.objects.filter(pk__in=stale).update(**{self.STALE_FIELD: True})
+            raise
+
+        self.stdout.write(f'Computed neighbours of {computed} books.')
+
+    def take_stale_books(self):
+        """
+            Reset the flags before computing, changes made meanwhile set them again
+            and are computed by the next run.
+        """
+        with transaction.atomic():
+            stale = list(
+                Book.objects.select_for_update()
+                .filter(**{self.STALE_FIELD: True})
+                .values_list('pk', flat=True))
+            Book.objects.filter(pk__in=stale).update(**{self.STALE_FIELD: False})
+        return stale
+
+    def load_matrix(self):
+        """
+            (book ids, matrix) - likes and saves of every book(row) by every user(column).
+        """
+
+        likes = Profile.likes.through.objects.values_list('profile_id', 'book_id')
+        saves = ProfileFavouriteBooks.objects.values_list('user_id', 'book_id')
+        rows = chain(likes.iterator(chunk_size=20000), saves.iterator(chunk_size=20000))
+        pairs = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+        if not len(pairs):
+            return pairs[:, 1], None
+        return item_matrix(pairs[:, 0], pairs[:, 1])
+
+    def rows_to_compute(self, books, matrix, stale):
+        if stale is None:
+            return np.arange(len(books))
+
+        changed = np.flatnonzero(np.isin(books, stale))
+        rows = related_rows(matrix, changed)
+        return np.union1d(rows, self.previous_rows(books, stale))
+
+    def previous_rows(self, books, stale):
+        """ Books which had a changed book as a neighbour, they may not be similar anymore. """
+
+        previous = SimilarBook.objects.filter(
+            source=self.SOURCE, similar_book_id__in=stale).values_list('book_id', flat=True)
+        return np.flatnonzero(np.isin(books, list(previous)))
+
+    def follow_up_rows(self, stale, neighbour_rows):
+        """ Rows to compute after the first ones, given the neighbours found for them. """
+
+        return np.empty(0, int)
+
+    def build(self, stale, options):
+        books, matrix = self.load_matrix()
+        computed = 0
+
+        if len(books):
+            rows = self.rows_to_compute(books, matrix, stale)
+            with Pool(options['workers'], initializer=init_worker, initargs=(matrix,)) as pool:
+                neighbour_rows = self.compute(pool, books, rows, options)
+                more_rows = np.setdiff1d(self.follow_up_rows(stale, neighbour_rows), rows)
+                self.compute(pool, books, more_rows, options)
+            computed = len(rows) + len(more_rows)
+
+        self.delete_unused()
+        return computed
+
+    def compute(self, pool, books, rows, options):
+        """ Compute and save neighbours of the rows, returns rows of the neighbours. """
+
+        block_size = options['block_size']
+        tasks = [(rows[start:start + block_size], options['neighbours'], options['min_score'])
+                 for start in range(0, len(rows), block_size)]
+        neighbour_rows = [np.empty(0, int)]
+        computed = 0
+
+        for task, result in zip(tasks, pool.imap(top_neighbours, tasks)):
+            self.save_neighbours(books, task[0], *result)
+            neighbour_rows.append(result[1])
+            computed += len(task[0])
+            self.stdout.write(f'{computed}/{len(rows)} books.')
+        return np.unique(np.concatenate(neighbour_rows))
+
+    def delete_unused(self):
+        # books nobody likes or saves anymore.
+        SimilarBook.objects.filter(
+            source=self.SOURCE, book__likes_count=0, book__favourites_count=0).delete()
+
+    def save_neighbours(self, books, block_rows, rows, neighbours, scores):
+        with transaction.atomic():
+            SimilarBook.objects.filter(
+                source=self.SOURCE, book_id__in=books[block_rows].tolist()).delete()
+            SimilarBook.objects.bulk_create(
+                (SimilarBook(book_id=int(books[row]), similar_book_id=int(books[neighbour]),
+                             score=float(score), source=self.SOURCE)
+                 for row, neighbour, score in zip(rows, neighbours, scores)),
+                batch_size=5000)
@@ -0,0 +1,58 @@
+import numpy as np
+from books.models import Book, SimilarBook
+from books.similarity import book_terms, tfidf_matrix
+
+from .build_recommendations import Command as BuildRecommendationsCommand
+
+
+class Command(BuildRecommendationsCommand):
+    """
+        Similar books on the details page, by content.
+        1. Title, description, genre and language of every book are streamed from the DB
+           into a sparse TF-IDF matrix(books x terms).
+        2. Cosine similarity of every book with all others is computed in blocks in a process pool.
+        3. --neighbours best neighbours of every book replace its SimilarBook rows.
+
+        --incremental - new and edited books(Book.content_stale), books which had them
+        as neighbours and their new neighbours, e.g. every few minutes from cron.
+        Weights of the words change a little with every book, run it in full e.g. weekly.
+
+        python manage.py build_similar_books --workers 4
+        python manage.py build_similar_books --incremental
+    """
+
+    help = 'Compute similar books from title, description, genre and language.'
+
+    SOURCE = SimilarBook.SOURCE_CONTENT
+    STALE_FIELD = 'content_stale'
+    NOTHING_CHANGED = 'No new or edited books.'
+
+    def load_matrix(self):
+        books = []
+
+        def documents():
+            rows = Book.objects.values_list(
+                'pk', *Book.CONTENT_FIELDS).iterator(chunk_size=2000)
+            for pk, *content in rows:
+                books.append(pk)
+                yield book_terms(*content)
+
+        matrix = tfidf_matrix(documents())
+        return np.array(books, dtype=np.int64), matrix
+
+    def rows_to_compute(self, books, matrix, stale):
+        if stale is None:
+            return np.arange(len(books))
+
+        changed = np.flatnonzero(np.isin(books, stale))
+        return np.union1d(changed, self.previous_rows(books, stale))
+
+    def follow_up_rows(self, stale, neighbour_rows):
+        # similarity is symmetric, a changed book may be a new neighbour of its neighbours.
+        if stale is None:
+            return np.empty(0, int)
+        return neighbour_rows
+
+    def delete_unused(self):
+        # deleted books are deleted with their neighbours(CASCADE).
+        pass
@@ -0,0 +1,357 @@
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from books.models import Author, Book, BookCounter
+from books.slugs import allocate_slugs, book_slug
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from library_project.images import (image_processing_options,
+                                    image_processing_version, import_image)
+
+
+class RowError(Exception):
+    """ Row which can't be imported, args are the messages. """
+
+
+class Command(BaseCommand):
+    """
+        Import books from a CSV(with a header) or JSONL file, one book per row.
+        The file is read row by row, memory doesn't grow with its size.
+        For every batch in one transaction authors not found by name and books are inserted
+        with one bulk_create each, slugs allocated with one query(books/slugs.py)
+        and BookCounter changed with one query. A batch which fails leaves nothing behind.
+        Covers are copied into MEDIA_ROOT and processed in a process pool,
+        so imported books don't wait for 'manage.py process_images'.
+        A cover file shared by several rows is processed once.
+
+        bulk_create doesn't call Book.save, everything it does is done here per batch.
+        search_vector is written by the trigger, similar books are computed
+        by the next 'manage.py build_similar_books --incremental'(content_stale).
+
+        Rows which can't be imported are written to --errors in the JSONL format,
+        {"row": number, "errors": [...], "data": row}. The file can be imported again
+        after the rows in "data" are fixed, read_rows reads the rows from "data".
+        Progress is printed after every committed batch, an interrupted import
+        continues with --start-row.
+
+        python manage.py import_books books.csv --user admin --batch-size 2000 --workers 8
+        https://docs.djangoproject.com/en/4.0/ref/models/querysets/#bulk-create
+    """
+
+    help = 'Import books and their authors from a CSV or JSONL file.'
+
+    REQUIRED_FIELDS = ('title', 'author_first_name', 'author_last_name',
+                       'language', 'genre', 'description')
+    # author_* - only used when the author doesn't exist yet.
+    OPTIONAL_FIELDS = ('date_posted', 'cover',
+                       'author_image', 'author_birth_date', 'author_biography')
+    FIELDS = REQUIRED_FIELDS + OPTIONAL_FIELDS
+
+    # Set by the import, not validated per row.
+    BOOK_EXCLUDE = ('author', 'posted_by', 'slug', 'image')
+
+    # Author ids by name, cleared when full, so memory doesn't grow with the file.
+    AUTHOR_CACHE_SIZE = 100_000
+    # (name, width, error) of the covers by path, rows often share a cover.
+    COVER_CACHE_SIZE = 100_000
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, - for stdin.')
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help='Format of the file, by default by its extension(.jsonl, .json) or CSV.')
+        parser.add_argument(
+            '--user', required=True,
+            help='Username the books are posted by.')
+        parser.add_argument(
+            '--covers-dir',
+            help='Directory of relative cover paths, defaults to the directory of the file.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows inserted in one transaction.')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of processes for covers, defaults to the number of CPUs.')
+        parser.add_argument(
+            '--start-row', type=int, default=1,
+            help='Number of the first row to import(1 - first row after the CSV header).')
+        parser.add_argument(
+            '--errors',
+            help='Write rows which were not imported to this JSONL file, by default to stderr.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only validate the rows and check that covers exist, nothing is written.')
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        path = options['path']
+        file_format = options['format'] or (
+            'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        self.covers_dir = options['covers_dir'] or os.path.dirname(os.path.abspath(path))
+        self.dry_run = options['dry_run']
+        self.authors = {}
+        self.covers = {}
+        self.slug_length = Book._meta.get_field('slug').max_length
+        self.processing_options = image_processing_options()
+        self.imported = self.failed = self.new_authors = 0
+
+        errors = open(options['errors'], 'a', encoding='utf-8') if options['errors'] else None
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        pool = None if self.dry_run else Pool(processes=options['workers'])
+        try:
+            self.errors = errors
+            rows = self.read_rows(source, file_format)
+            self.import_rows(rows, options['start_row'], options['batch_size'], pool)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            if source is not sys.stdin:
+                source.close()
+            if errors:
+                errors.close()
+
+        action = 'would be imported' if self.dry_run else 'imported'
+        self.stdout.write(
+            f'{self.imported} books {action}, {self.new_authors} new authors, '
+            f'{self.failed} rows failed.')
+
+    # Keys of the lines written by report, the row is in 'data'.
+    ERROR_KEYS = {'row', 'errors', 'data'}
+
+    def read_rows(self, source, file_format):
+        """
+            (row number, row) of every row, invalid JSON lines are the line itself.
+            Lines of an --errors file are the rows in their 'data'.
+        """
+
+        if file_format == 'csv':
+            yield from enumerate(csv.DictReader(source), start=1)
+            return
+
+        for number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = line.rstrip('\n')
+            if isinstance(row, dict) and row.keys() == self.ERROR_KEYS:
+                row = row['data']
+            yield number, row
+
+    def import_rows(self, rows, start_row, batch_size, pool):
+        rows = itertools.dropwhile(lambda item: item[0] < start_row, rows)
+        started = time.monotonic()
+
+        while batch := list(itertools.islice(rows, batch_size)):
+            books = []
+            for number, row in batch:
+                try:
+                    books.append((number, row, self.parse_row(row)))
+                except RowError as error:
+                    self.report(number, row, error.args)
+
+            books = self.set_authors(books)
+            books = self.set_covers(books, pool)
+            self.new_authors += len({book.author_key for _, _, book in books
+                                     if book.author_key not in self.authors})
+            if not self.dry_run:
+                self.insert([book for _, _, book in books])
+            self.imported += len(books)
+
+            rate = self.imported / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'Rows up to {batch[-1][0]} done: {self.imported} books, '
+                f'{self.failed} failed ({rate:.0f} books/s).')
+
+    def parse_row(self, row):
+        """ Unsaved Book with author_key(names) and cover attributes, raises RowError. """
+
+        if not isinstance(row, dict):
+            raise RowError('Row is not a JSON object.')
+
+        values = {field: str(row.get(field) or '').strip() for field in self.FIELDS}
+        missing = [field for field in self.REQUIRED_FIELDS if not values[field]]
+        if missing:
+            raise RowError(*(f'{field}: This field is required.' for field in missing))
+
+        book = Book(
+            title=values['title'],
+            language=values['language'],
+            genre=values['genre'].upper(),
+            description=values['description'],
+            posted_by=self.user,
+        )
+        if values['date_posted']:
+            book.date_posted = values['date_posted']
+        self.clean(book, self.BOOK_EXCLUDE)
+        if timezone.is_naive(book.date_posted):
+            book.date_posted = timezone.make_aware(book.date_posted)
+
+        book.author_key = (values['author_first_name'], values['author_last_name'])
+        book.author_name = ' '.join(book.author_key)
+        book.new_author = Author(
+            first_name=values['author_first_name'],
+            last_name=values['author_last_name'],
+            image=values['author_image'],
+            birth_date=values['author_birth_date'] or None,
+            biography=values['author_biography'],
+        )
+        book.cover = values['cover']
+        return book
+
+    def clean(self, instance, exclude=(), prefix=''):
+        try:
+            instance.clean_fields(exclude=exclude)
+        except ValidationError as error:
+            raise RowError(*(f'{prefix}{field}: {message}'
+                             for field, messages in error.message_dict.items()
+                             for message in messages))
+
+    def set_authors(self, books):
+        """
+            Set author_id of the books, authors are looked up by name with one query
+            (author_name_idx). Authors which don't exist are validated here and created
+            with the books, check create_authors. Returns the books whose author exists or is valid.
+        """
+
+        missing = {book.author_key for _, _, book in books} - self.authors.keys()
+        if len(self.authors) + len(missing) > self.AUTHOR_CACHE_SIZE:
+            self.authors.clear()
+            missing = {book.author_key for _, _, book in books}
+
+        if missing:
+            first_names, last_names = zip(*missing)
+            existing = (
+                Author.objects
+                .filter(first_name__in=first_names, last_name__in=last_names)
+                .order_by('-pk')
+                .values_list('first_name', 'last_name', 'pk')
+            )
+            # oldest author of the name, if there are several.
+            for first_name, last_name, pk in existing:
+                if (first_name, last_name) in missing:
+                    self.authors[first_name, last_name] = pk
+
+        valid, new_authors = [], {}
+        for number, row, book in books:
+            if book.author_key in self.authors:
+                book.author_id = self.authors[book.author_key]
+            elif book.author_key not in new_authors:
+                try:
+                    self.clean(book.new_author, prefix='author_')
+                except RowError as error:
+                    self.report(number, row, error.args)
+                    continue
+                new_authors[book.author_key] = book.new_author
+            else:
+                # the validated author of the first row with the name.
+                book.new_author = new_authors[book.author_key]
+            valid.append((number, row, book))
+        return valid
+
+    def set_covers(self, books, pool):
+        """
+            Copy and process the covers in the pool, every cover file once per import,
+            books sharing it get the same result. Books without a cover get the default one.
+            Returns the books whose cover was processed.
+        """
+
+        covers = [(number, row, book, os.path.join(self.covers_dir, book.cover))
+                  for number, row, book in books if book.cover]
+        paths = list(dict.fromkeys(path for *_, path in covers if path not in self.covers))
+        if len(self.covers) + len(paths) > self.COVER_CACHE_SIZE:
+            self.covers.clear()
+            paths = list(dict.fromkeys(path for *_, path in covers))
+
+        if self.dry_run:
+            results = [(path, 0, None) if os.path.isfile(path)
+                       else (None, None, 'File does not exist.') for path in paths]
+        else:
+            directory = Book._meta.get_field('image').upload_to.directory
+            items = [(path, settings.MEDIA_ROOT, directory, self.processing_options)
+                     for path in paths]
+            results = pool.map(import_image, items, chunksize=16)
+        self.covers.update(zip(paths, results))
+
+        version = image_processing_version(self.processing_options)
+        failed = set()
+        for number, row, book, path in covers:
+            name, width, error = self.covers[path]
+            if error is not None:
+                self.report(number, row, [f'cover: Could not read or process {book.cover}: {error}'])
+                failed.add(number)
+                continue
+            book.image, book.image_width = name, width
+            book.image_status = Book.IMAGE_STATUS_READY
+            book.image_version = version
+        return [item for item in books if item[0] not in failed]
+
+    def insert(self, books):
+        """
+            bulk_create the new authors and the books and change the counters in one transaction,
+            a batch which fails leaves no authors without books.
+            Slugs taken by other books meanwhile are allocated again, check Book.save.
+        """
+
+        bases = [book_slug(book.title, book.author_name, self.slug_length)
+                 for book in books]
+        new_authors = {}
+        for book in books:
+            if book.author_key not in self.authors:
+                new_authors.setdefault(book.author_key, book.new_author)
+
+        for attempt in range(Book.SLUG_ATTEMPTS):
+            for book, slug in zip(books, allocate_slugs(Book.objects.all(), bases)):
+                book.slug = slug
+            try:
+                with transaction.atomic():
+                    self.create_authors(books, new_authors)
+                    Book.objects.bulk_create(books)
+                    BookCounter.add_counts(
+                        Counter(key for book in books for key in book.counter_keys()))
+            except IntegrityError:
+                if attempt == Book.SLUG_ATTEMPTS - 1:
+                    raise
+                continue
+            for key, author in new_authors.items():
+                self.authors[key] = author.pk
+            return
+
+    def create_authors(self, books, new_authors):
+        """
+            Insert the new authors(by name) and set author_id of their books.
+            Called again after a rolled back attempt, so ids of that attempt are cleared.
+        """
+
+        for author in new_authors.values():
+            author.pk = None
+        # ids are returned by INSERT ... RETURNING on PostgreSQL.
+        Author.objects.bulk_create(new_authors.values())
+        for book in books:
+            if book.author_key in new_authors:
+                book.author_id = new_authors[book.author_key].pk
+
+    def report(self, number, row, messages):
+        self.failed += 1
+        if self.errors:
+            self.errors.write(json.dumps(
+                {'row': number, 'errors': list(messages), 'data': row}) + '\n')
+        else:
+            for message in messages:
+                self.stderr.write(f'Row {number}: {message}')
@@ -0,0 +1,17 @@
+from books.models import BookCounter
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+        Book counters are updated by Book.save and post_delete,
+        run this after books were changed in another way(update(), raw SQL, loaddata).
+
+        python manage.py rebuild_book_counts
+    """
+
+    help = 'Count the books of the library, every genre, author and user again.'
+
+    def handle(self, *args, **options):
+        counters = BookCounter.rebuild()
+        self.stdout.write(f'Rebuilt {counters} book counters.')
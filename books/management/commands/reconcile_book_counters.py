@@ -0,0 +1,87 @@
+from books.models import Book, Comment
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from users.models import Profile, ProfileFavouriteBooks
+
+
+def count_rows(model):
+    """ Rows of model pointing at the outer book, 0 if none. """
+
+    rows = (
+        model.objects
+        .filter(book_id=OuterRef('pk'))
+        .order_by()
+        .values('book_id')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+class Command(BaseCommand):
+    """
+        Book counter columns are changed by signals(books/signals.py).
+        Rows written with bulk_create, update() or raw SQL are not counted,
+        this counts them again in batches of books.
+        Only books with wrong counters are updated.
+
+        python manage.py reconcile_book_counters --batch-size 5000
+    """
+
+    help = 'Fix likes_count, favourites_count and comments_count of all books.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Books checked in one transaction.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only print the number of books with wrong counters.')
+
+    def actual_counts(self):
+        return {
+            'likes_count': count_rows(Profile.likes.through),
+            'favourites_count': count_rows(ProfileFavouriteBooks),
+            'comments_count': count_rows(Comment),
+        }
+
+    def drifted_books(self, book_ids):
+        actual_counts = {f'actual_{field}': count
+                         for field, count in self.actual_counts().items()}
+        drifted = Q()
+        for field in Book.COUNTER_FIELDS:
+            drifted |= ~Q(**{field: F(f'actual_{field}')})
+
+        return list(
+            Book.objects
+            .filter(pk__in=book_ids)
+            .annotate(**actual_counts)
+            .filter(drifted)
+            .values_list('pk', flat=True)
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = fixed = 0
+        last_pk = 0
+
+        while True:
+            book_ids = list(
+                Book.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size])
+            if not book_ids:
+                break
+            last_pk = book_ids[-1]
+            checked += len(book_ids)
+
+            with transaction.atomic():
+                drifted = self.drifted_books(book_ids)
+                if drifted and not options['dry_run']:
+                    # counted again in the UPDATE, changes since the check are included.
+                    Book.objects.filter(pk__in=drifted).update(**self.actual_counts())
+            fixed += len(drifted)
+
+        action = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(f'Checked {checked} books, {fixed} {action}.')
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_alter_book_author'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='image_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='READY', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_book_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='image_version',
+            field=models.CharField(blank=True, max_length=12),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_books(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    BookCounter = apps.get_model('books', 'BookCounter')
+
+    counters = [BookCounter(scope='ALL', key='', count=Book.objects.count())]
+    for scope, field in (('GENRE', 'genre'), ('AUTHOR', 'author_id'), ('USER', 'posted_by_id')):
+        rows = Book.objects.order_by().values(field).annotate(count=Count('pk'))
+        counters += [BookCounter(scope=scope, key=str(row[field]), count=row['count'])
+                     for row in rows]
+    BookCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0020_alter_book_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('ALL', 'All'), ('GENRE', 'Genre'), ('AUTHOR', 'Author'), ('USER', 'User')], max_length=6)),
+                ('key', models.CharField(blank=True, max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bookcounter',
+            constraint=models.UniqueConstraint(fields=('scope', 'key'), name='unique_book_counter'),
+        ),
+        migrations.RunPython(count_books, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Config must match books.search.SEARCH_CONFIG.
+# Title is weighted A, author name B, description C for ranking.
+# Author is read by id, so renaming an author updates the vectors of their books.
+INSTALL_TRIGGERS = """
+CREATE OR REPLACE FUNCTION books_search_vector(title text, description text, author_id bigint)
+RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(
+            (SELECT first_name || ' ' || last_name FROM books_author WHERE id = author_id), '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION books_book_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := books_search_vector(NEW.title, NEW.description, NEW.author_id);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+-- search_vector in the column list - save() writes the loaded value back, it must be recomputed.
+-- Updates of other columns only(e.g. counters) don't touch it.
+CREATE TRIGGER books_book_search_vector
+BEFORE INSERT OR UPDATE OF title, description, author_id, search_vector ON books_book
+FOR EACH ROW EXECUTE PROCEDURE books_book_search_vector_trigger();
+
+CREATE OR REPLACE FUNCTION books_author_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE books_book
+    SET search_vector = books_search_vector(title, description, author_id)
+    WHERE author_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_author_search_vector
+AFTER UPDATE OF first_name, last_name ON books_author
+FOR EACH ROW
+WHEN (OLD.first_name IS DISTINCT FROM NEW.first_name OR OLD.last_name IS DISTINCT FROM NEW.last_name)
+EXECUTE PROCEDURE books_author_search_vector_trigger();
+
+UPDATE books_book SET search_vector = books_search_vector(title, description, author_id);
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS books_author_search_vector ON books_author;
+DROP TRIGGER IF EXISTS books_book_search_vector ON books_book;
+DROP FUNCTION IF EXISTS books_author_search_vector_trigger();
+DROP FUNCTION IF EXISTS books_book_search_vector_trigger();
+DROP FUNCTION IF EXISTS books_search_vector(text, text, bigint);
+"""
+
+
+def install_triggers(apps, schema_editor):
+    # other databases search with icontains, check books/search.py.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(INSTALL_TRIGGERS)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0022_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+        ),
+        migrations.RunPython(install_triggers, drop_triggers),
+    ]
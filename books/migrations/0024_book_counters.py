@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+COUNT_EXISTING = """
+UPDATE books_book SET
+    likes_count = (SELECT COUNT(*) FROM users_profile_likes WHERE book_id = books_book.id),
+    favourites_count = (SELECT COUNT(*) FROM users_profilefavouritebooks WHERE book_id = books_book.id),
+    comments_count = (SELECT COUNT(*) FROM books_comment WHERE book_id = books_book.id)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0023_book_search_vector'),
+        ('users', '0013_alter_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='favourites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(COUNT_EXISTING, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0024_book_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('likes_count__gt', 0)), fields=['-likes_count', 'title', 'id'], name='book_leaderboard_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('likes_count__gt', 0)), fields=['genre', '-likes_count', 'title', 'id'], name='book_genre_leaderboard_idx'),
+        ),
+    ]
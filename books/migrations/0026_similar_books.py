@@ -0,0 +1,45 @@
+# Generated by Django 4.1 on 2026-10-18 18:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0025_leaderboard_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarBook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('source', models.CharField(choices=[('LIKES', 'Likes')], max_length=5)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='neighbours_stale',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('neighbours_stale', True)), fields=['id'], name='book_neighbours_stale_idx'),
+        ),
+        migrations.AddField(
+            model_name='similarbook',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='books.book'),
+        ),
+        migrations.AddField(
+            model_name='similarbook',
+            name='similar_book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='books.book'),
+        ),
+        migrations.AddConstraint(
+            model_name='similarbook',
+            constraint=models.UniqueConstraint(fields=('source', 'book', 'similar_book'), name='unique_similar_book'),
+        ),
+    ]
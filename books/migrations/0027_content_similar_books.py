@@ -0,0 +1,27 @@
+# Generated by Django 4.1 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0026_similar_books'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='content_stale',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='similarbook',
+            name='source',
+            field=models.CharField(choices=[('LIKES', 'Likes'), ('CONTENT', 'Content')], max_length=7),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('content_stale', True)), fields=['id'], name='book_content_stale_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0027_content_similar_books'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['book', '-date_posted', '-id'], name='comment_book_date_idx'),
+        ),
+    ]
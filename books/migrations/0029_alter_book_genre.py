@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0028_comment_book_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='genre',
+            field=models.CharField(choices=[('ART', 'Art'), ('BIOGRAPHY', 'Biography'), ('COMEDY', 'Comedy'), ('CLASSIC', 'Classic'), ('HEALTH', 'Health'), ('HISTORY', 'History'), ('THRILLER', 'Thriller'), ('OTHER', 'Other')], max_length=9),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0029_alter_book_genre'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='image_width',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
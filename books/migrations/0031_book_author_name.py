@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+# search_vector trigger doesn't fire, author_name is not one of its columns.
+COPY_AUTHOR_NAMES = """
+UPDATE books_book SET author_name = books_author.first_name || ' ' || books_author.last_name
+FROM books_author
+WHERE books_author.id = books_book.author_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0030_book_image_width'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='author_name',
+            field=models.CharField(default='', editable=False, max_length=101),
+        ),
+        migrations.RunSQL(COPY_AUTHOR_NAMES, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'id'], name='book_author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['genre', 'author_name', 'id'], name='book_genre_author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'author_name', 'id'], name='book_author_author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'language', 'id'], name='book_author_language_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['posted_by', 'author_name', 'id'], name='book_user_author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['posted_by', 'language', 'id'], name='book_user_language_idx'),
+        ),
+    ]
@@ -1,10 +1,15 @@
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinLengthValidator
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.functions import Greatest
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.text import slugify
-from library_project.utils import is_image_resizable
+from library_project.utils import HashedUploadTo, is_default_image
+from website.models import MediaDeletion
+
+from books.slugs import allocate_slug, book_slug
 
 
 class CommonFields(models.Model):
@@ -27,6 +32,142 @@ class CommonFields(models.Model):
         ordering = ['-date_posted']
 
 
+class TrackedFields(models.Model):
+    """
+        Remember values of 'tracked_fields' as loaded from the DB,
+        so that save() can skip work for fields which haven't changed.
+        https://docs.djangoproject.com/en/4.0/ref/models/instances/#customizing-model-loading
+    """
+
+    tracked_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked_values()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_tracked_values()
+
+    def _tracked_value(self, attname):
+        value = getattr(self, attname)
+        # FieldFile -> compare by name
+        return getattr(value, 'name', value)
+
+    def _remember_tracked_values(self):
+        deferred_fields = self.get_deferred_fields()
+        self._loaded_values = {
+            field.attname: self._tracked_value(field.attname)
+            for field in map(self._meta.get_field, self.tracked_fields)
+            if field.attname not in deferred_fields
+        }
+
+    def has_changed(self, field_name):
+        """
+            Check if field differs from the value loaded from the DB.
+            Every field of a new instance has changed,
+            deferred field which was never loaded hasn't, save() does not write it.
+        """
+        if self._state.adding:
+            return True
+
+        attname = self._meta.get_field(field_name).attname
+        if attname not in self._loaded_values:
+            return attname not in self.get_deferred_fields()
+
+        value = getattr(self, attname)
+        # new upload, not yet saved to storage.
+        if getattr(value, '_committed', True) is False:
+            return True
+        return self._tracked_value(attname) != self._loaded_values[attname]
+
+
+class ProcessedImageFields(TrackedFields):
+    """
+        Processing state of an uploaded image.
+        Resizing is done by the 'process_images' workers after the row is committed,
+        until then templates show the default image (check image_url property).
+        Replaced and deleted images are queued for 'manage.py collect_media'.
+        Subclasses define the 'image' field itself.
+    """
+
+    tracked_fields = ('image',)
+
+    IMAGE_STATUS_PENDING = 'PENDING'
+    IMAGE_STATUS_PROCESSING = 'PROCESSING'
+    IMAGE_STATUS_READY = 'READY'
+    IMAGE_STATUS_FAILED = 'FAILED'
+
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_STATUS_PENDING, 'Pending'),
+        (IMAGE_STATUS_PROCESSING, 'Processing'),
+        (IMAGE_STATUS_READY, 'Ready'),
+        (IMAGE_STATUS_FAILED, 'Failed'),
+    ]
+
+    image_status = models.CharField(
+        max_length=max(len(choices[0]) for choices in IMAGE_STATUS_CHOICES),
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_STATUS_READY,
+    )
+
+    # Options the image was processed with, check image_processing_version.
+    image_version = models.CharField(max_length=12, blank=True)
+
+    # Width of the processed image, variants exist only up to it(check image_tags.py).
+    image_width = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        replaced_image = None
+        if not self._state.adding and self.has_changed('image'):
+            replaced_image = self._loaded_values.get('image')
+
+        super().save(*args, **kwargs)
+
+        if replaced_image:
+            MediaDeletion.schedule(replaced_image)
+
+    def queue_image_processing(self):
+        """
+            Mark a changed image for the background workers.
+            Unchanged images and default images are never processed.
+            Called before saving, so the job is visible to workers only after commit.
+        """
+        if not self.has_changed('image'):
+            return
+
+        if is_default_image(self.image):
+            self.image_status = self.IMAGE_STATUS_READY
+        else:
+            self.image_status = self.IMAGE_STATUS_PENDING
+
+    def versioned_url(self, url):
+        """
+            Processed files keep their name when processed again(reprocess_images),
+            version in the query string makes browsers download them again.
+        """
+        if self.image_version:
+            return f'{url}?v={self.image_version}'
+        return url
+
+    @property
+    def image_url(self):
+        """ Url of the processed image or of the default image as placeholder. """
+
+        if self.image_status == self.IMAGE_STATUS_READY:
+            return self.versioned_url(self.image.url)
+        default_image = self._meta.get_field('image').default
+        return self.image.storage.url(default_image)
+
+
 class Author(models.Model):
     FIRST_NAME_MAX_LENGTH = 50
     LAST_NAME_MAX_LENGTH = 50
@@ -50,14 +191,137 @@ class Author(models.Model):
 
     biography = models.TextField()
 
+    class Meta:
+        indexes = [
+            # BookOrderForm 'Author' choice.
+            models.Index(fields=['first_name', 'last_name', 'id'],
+                         name='author_name_idx'),
+        ]
+
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
+    def save(self, *args, **kwargs):
+        """ Books keep a copy of the name for the Author order, check Book.author_name. """
+
+        super().save(*args, **kwargs)
+        self.book_set.exclude(author_name=str(self)).update(author_name=str(self))
+
     @property
     def full_name(self):
         return self.first_name + ' ' + self.last_name
 
-class Book(CommonFields):
+
+class BookCounter(models.Model):
+    """
+        Number of books of the whole library, of a genre, an author or a user,
+        headers of the book lists read it instead of COUNT(*).
+        Kept up to date by Book.save and the post_delete signal(books/signals.py),
+        'manage.py rebuild_book_counts' recounts all of them.
+    """
+
+    SCOPE_ALL = 'ALL'
+    SCOPE_GENRE = 'GENRE'
+    SCOPE_AUTHOR = 'AUTHOR'
+    SCOPE_USER = 'USER'
+
+    SCOPE_CHOICES = [
+        (SCOPE_ALL, 'All'),
+        (SCOPE_GENRE, 'Genre'),
+        (SCOPE_AUTHOR, 'Author'),
+        (SCOPE_USER, 'User'),
+    ]
+
+    scope = models.CharField(
+        max_length=max(len(choices[0]) for choices in SCOPE_CHOICES),
+        choices=SCOPE_CHOICES,
+    )
+
+    # genre, author id or user id, empty for SCOPE_ALL.
+    key = models.CharField(max_length=20, blank=True)
+
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'key'], name='unique_book_counter'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.key}: {self.count}'
+
+    @classmethod
+    def change(cls, keys, delta):
+        """
+            Add delta to counters of (scope, key) pairs.
+            UPDATE with F() so concurrent saves don't overwrite each other,
+            missing counter means there were no books yet.
+            https://docs.djangoproject.com/en/4.0/ref/models/expressions/#f-expressions
+        """
+        for scope, key in keys:
+            updated = cls.objects.filter(scope=scope, key=key).update(
+                count=models.F('count') + delta)
+            if not updated:
+                counter, created = cls.objects.get_or_create(
+                    scope=scope, key=key, defaults={'count': delta})
+                if not created:
+                    cls.objects.filter(pk=counter.pk).update(
+                        count=models.F('count') + delta)
+
+    @classmethod
+    def add_counts(cls, counts):
+        """
+            Add counts({(scope, key): delta}) in one INSERT ... ON CONFLICT,
+            e.g. after bulk_create of many books. Keys are sorted, so concurrent
+            calls lock the counters in the same order.
+            https://www.postgresql.org/docs/current/sql-insert.html#SQL-ON-CONFLICT
+        """
+        if not counts:
+            return
+        scopes, keys, deltas = zip(*((scope, key, delta)
+                                     for (scope, key), delta in sorted(counts.items())))
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (scope, key, count)
+                SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::bigint[])
+                ON CONFLICT (scope, key) DO UPDATE SET count = {table}.count + EXCLUDED.count
+            """, [list(scopes), list(keys), list(deltas)])
+
+    @classmethod
+    def rebuild(cls):
+        """
+            Count all books again, e.g. after they were changed with update() or raw SQL,
+            which don't call save() or send signals.
+            Returns the number of counters.
+        """
+        counters = [cls(scope=cls.SCOPE_ALL, key='', count=Book.objects.count())]
+        for scope, field in ((cls.SCOPE_GENRE, 'genre'),
+                             (cls.SCOPE_AUTHOR, 'author_id'),
+                             (cls.SCOPE_USER, 'posted_by_id')):
+            rows = Book.objects.order_by().values(field).annotate(count=models.Count('pk'))
+            counters += [cls(scope=scope, key=str(row[field]), count=row['count'])
+                         for row in rows]
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(counters)
+        return len(counters)
+
+
+class BookManager(models.Manager):
+    """
+        search_vector is only read by PostgreSQL(search filter and rank, GIN index),
+        so it's deferred for every query of books, also for related managers(author.book_set).
+        https://docs.djangoproject.com/en/4.0/topics/db/managers/#modifying-a-manager-s-initial-queryset
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
+class Book(CommonFields, ProcessedImageFields):
     TITLE_MIN_LENGTH = 2
     TITLE_MAX_LENGTH = 150
 
@@ -96,6 +360,14 @@ class Book(CommonFields):
 
     author = models.ForeignKey(Author, on_delete=models.CASCADE)
 
+    # str(author), so that the Author order(BookOrderForm) is read from an index of books,
+    # an order by columns of the joined author is always sorted. Set by save and Author.save.
+    author_name = models.CharField(
+        max_length=Author.FIRST_NAME_MAX_LENGTH + 1 + Author.LAST_NAME_MAX_LENGTH,
+        editable=False,
+        default='',
+    )
+
     language = models.CharField(
         max_length=LANGUAGE_MAX_LENGTH,
         validators=[MinLengthValidator(LANGUAGE_MIN_LENGTH)]
@@ -110,26 +382,188 @@ class Book(CommonFields):
 
     image = models.ImageField(
         default='default_book.jpg',
-        upload_to='books_pics',
+        upload_to=HashedUploadTo('books_pics'),
     )
 
     # https://learndjango.com/tutorials/django-slug-tutorial
     slug = models.SlugField(unique=True)
 
+    # Denormalized counts for list cards and details, changed with F() by books/signals.py,
+    # 'manage.py reconcile_book_counters' fixes drift. Not written by save().
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    favourites_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('likes_count', 'favourites_count', 'comments_count')
+
+    # Likes or saves changed since the neighbours of the book were computed,
+    # 'manage.py build_recommendations --incremental' computes only those again.
+    neighbours_stale = models.BooleanField(default=False, editable=False)
+
+    # Title, description, genre or language changed since the similar books were computed,
+    # 'manage.py build_similar_books --incremental' computes only those again.
+    content_stale = models.BooleanField(default=True, editable=False)
+
+    CONTENT_FIELDS = ('title', 'description', 'genre', 'language')
+
+    # Slug taken by another book between allocating and saving, check save method.
+    SLUG_ATTEMPTS = 3
+
+    # Changed with update() only, save() could write back an old value.
+    # content_stale is saved only when the content changed, check save method.
+    NOT_SAVED_FIELDS = COUNTER_FIELDS + ('neighbours_stale', 'content_stale')
+
+    # title, author name and description for full text search(books/search.py),
+    # written by a PostgreSQL trigger, check migration 0023_book_search_vector.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = BookManager()
+
+    # slug depends on title and author, BookCounter on author, genre and posted_by,
+    # similar books on CONTENT_FIELDS, check save method.
+    tracked_fields = ('title', 'author', 'genre', 'image', 'description', 'language',
+                      'posted_by')
+
+    class Meta(CommonFields.Meta):
+        """
+            An index for every filter(views) + order(BookOrderForm) of the book lists,
+            'id' is the tie-breaker of the keyset pagination(books/pagination.py).
+            Indexes are read backwards for descending order, e.g. -date_posted, -id.
+            'manage.py benchmark_book_queries' checks that the queries use them
+            and don't sort.
+            https://docs.djangoproject.com/en/4.0/ref/models/indexes/
+        """
+        indexes = [
+            models.Index(fields=['date_posted', 'id'], name='book_date_idx'),
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+            models.Index(fields=['author_name', 'id'], name='book_author_name_idx'),
+            models.Index(fields=['language', 'id'], name='book_language_idx'),
+            models.Index(fields=['genre', 'date_posted', 'id'], name='book_genre_date_idx'),
+            models.Index(fields=['genre', 'title', 'id'], name='book_genre_title_idx'),
+            models.Index(fields=['genre', 'author_name', 'id'],
+                         name='book_genre_author_name_idx'),
+            models.Index(fields=['genre', 'language', 'id'], name='book_genre_language_idx'),
+            models.Index(fields=['author', 'date_posted', 'id'], name='book_author_date_idx'),
+            models.Index(fields=['author', 'title', 'id'], name='book_author_title_idx'),
+            models.Index(fields=['author', 'author_name', 'id'],
+                         name='book_author_author_name_idx'),
+            models.Index(fields=['author', 'language', 'id'], name='book_author_language_idx'),
+            models.Index(fields=['posted_by', 'date_posted', 'id'], name='book_user_date_idx'),
+            models.Index(fields=['posted_by', 'title', 'id'], name='book_user_title_idx'),
+            models.Index(fields=['posted_by', 'author_name', 'id'],
+                         name='book_user_author_name_idx'),
+            models.Index(fields=['posted_by', 'language', 'id'], name='book_user_language_idx'),
+            GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+            # most liked books(books/leaderboard.py), books without likes are not in them.
+            models.Index(fields=['-likes_count', 'title', 'id'], name='book_leaderboard_idx',
+                         condition=models.Q(likes_count__gt=0)),
+            models.Index(fields=['genre', '-likes_count', 'title', 'id'],
+                         name='book_genre_leaderboard_idx',
+                         condition=models.Q(likes_count__gt=0)),
+            models.Index(fields=['id'], name='book_neighbours_stale_idx',
+                         condition=models.Q(neighbours_stale=True)),
+            models.Index(fields=['id'], name='book_content_stale_idx',
+                         condition=models.Q(content_stale=True)),
+        ]
+
     def save(self, *args, **kwargs):
         """
-            Overriding save method to resize uploaded image if needed,
+            Overriding save method to queue uploaded image for resizing,
             no need an image to be more than 400x500 px.
+            Resizing is done by 'manage.py process_images', not in the request.
 
-            Using title and author , making slug being less likely to match with another slug.
-            slugify docs -> https://docs.djangoproject.com/en/4.0/ref/utils/#django.utils.text.slugify
+            Slug is recomputed only if title or author changed(books/slugs.py),
+            str(self.author) may query the author.
+            If another book took the slug meanwhile(unique index), the next free one is used.
 
             https://stackoverflow.com/questions/65267519/how-to-update-str-and-slug-everytime-after-djangos-model-update
         """
 
-        self.slug = slugify(f"{self.title} {self.author}")
-        super().save(*args, **kwargs)
-        is_image_resizable(self.image.path)
+        slug_changed = self.has_changed('title') or self.has_changed('author')
+        if self.has_changed('author'):
+            self.author_name = str(self.author)
+        if slug_changed:
+            self.slug = self.allocate_slug()
+        self.queue_image_processing()
+        content_changed = any(map(self.has_changed, self.CONTENT_FIELDS))
+        if content_changed:
+            self.content_stale = True
+
+        new_keys = self.counter_keys()
+        if self._state.adding:
+            old_keys = set()
+        else:
+            old_keys = self.counter_keys(
+                author_id=self._loaded_values.get('author_id', self.author_id),
+                genre=self._loaded_values.get('genre', self.genre),
+                posted_by_id=self._loaded_values.get('posted_by_id', self.posted_by_id))
+
+        if not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            # counters may have changed since the book was loaded.
+            deferred_fields = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.NOT_SAVED_FIELDS
+                and field.attname not in deferred_fields
+            ]
+            if content_changed:
+                kwargs['update_fields'].append('content_stale')
+
+        if not slug_changed:
+            return self.save_with_counters(old_keys, new_keys, *args, **kwargs)
+
+        for attempt in range(self.SLUG_ATTEMPTS):
+            try:
+                # savepoint, the transaction is usable after a failed INSERT.
+                with transaction.atomic():
+                    return self.save_with_counters(old_keys, new_keys, *args, **kwargs)
+            except IntegrityError:
+                if attempt == self.SLUG_ATTEMPTS - 1 or not self.other_books().filter(
+                        slug=self.slug).exists():
+                    raise
+                self.slug = self.allocate_slug()
+
+    def save_with_counters(self, old_keys, new_keys, *args, **kwargs):
+        if new_keys == old_keys:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            BookCounter.change(new_keys - old_keys, 1)
+            BookCounter.change(old_keys - new_keys, -1)
+
+    def other_books(self):
+        return Book.objects.exclude(pk=self.pk) if self.pk else Book.objects.all()
+
+    def allocate_slug(self):
+        max_length = self._meta.get_field('slug').max_length
+        return allocate_slug(self.other_books(), book_slug(self.title, self.author, max_length))
+
+    @classmethod
+    def change_counter(cls, field, book_ids, delta, **values):
+        """
+            Add delta to a counter of the books in one UPDATE,
+            F() - the database adds it, concurrent changes are not lost.
+            values - other fields set in the same UPDATE.
+            https://docs.djangoproject.com/en/4.0/ref/models/expressions/#f-expressions
+        """
+        cls.objects.filter(pk__in=book_ids).update(
+            **{field: Greatest(models.F(field) + delta, 0)}, **values)
+
+    def counter_keys(self, author_id=None, genre=None, posted_by_id=None):
+        """
+            BookCounter (scope, key) pairs the book is counted in,
+            with the given values instead of the current ones(as loaded, check save method).
+        """
+
+        return {
+            (BookCounter.SCOPE_ALL, ''),
+            (BookCounter.SCOPE_GENRE, genre or self.genre),
+            (BookCounter.SCOPE_AUTHOR, str(author_id or self.author_id)),
+            (BookCounter.SCOPE_USER, str(posted_by_id or self.posted_by_id)),
+        }
 
     def get_absolute_url(self):
         """
@@ -146,6 +580,44 @@ class Book(CommonFields):
         return self.title
 
 
+class SimilarBook(models.Model):
+    """
+        Nearest neighbours of a book with their similarity score(0-1), computed offline
+        by 'manage.py build_recommendations'(LIKES) and 'manage.py build_similar_books'(CONTENT).
+        Recommendations for a user sum the scores of the neighbours
+        of the books they liked or saved, check books/recommendations.py.
+        Similar books on the details page are the CONTENT neighbours.
+    """
+
+    # collaborative filtering - users who liked this book also liked...
+    SOURCE_LIKES = 'LIKES'
+    # TF-IDF of title, description, genre and language.
+    SOURCE_CONTENT = 'CONTENT'
+
+    SOURCE_CHOICES = [
+        (SOURCE_LIKES, 'Likes'),
+        (SOURCE_CONTENT, 'Content'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbours')
+    similar_book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+    source = models.CharField(
+        max_length=max(len(choices[0]) for choices in SOURCE_CHOICES),
+        choices=SOURCE_CHOICES,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'book', 'similar_book'], name='unique_similar_book'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} ~ {self.similar_book_id} ({self.source} {self.score:.2f})'
+
+
 class Comment(CommonFields):
     CONTENT_MIN_LENGTH = 5
 
@@ -153,5 +625,11 @@ class Comment(CommonFields):
     content = models.TextField(
         validators=[MinLengthValidator(CONTENT_MIN_LENGTH)])
 
+    class Meta(CommonFields.Meta):
+        indexes = [
+            # comments of a book, newest first, keyset pages(books.views.comments_page).
+            models.Index(fields=['book', '-date_posted', '-id'], name='comment_book_date_idx'),
+        ]
+
     def __str__(self):
         return self.content
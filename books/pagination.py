@@ -0,0 +1,181 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Model, Q
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def _json_default(value):
+    # DjangoJSONEncoder cuts microseconds, the cursor needs exact values.
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} can not be used in a cursor.')
+
+
+class KeysetPage:
+    """
+        Part of django.core.paginator.Page interface used by the templates,
+        pages have cursors instead of numbers.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Page of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1], 'next')
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0], 'previous')
+
+
+class KeysetPaginator:
+    """
+        Pages are found with WHERE on the values of the ordering fields of the last(first) row
+        of the current page, instead of OFFSET. With an index on the ordering,
+        every page costs the same as the first one.
+        pk is added to the ordering as a tie-breaker, so rows with equal values are not skipped.
+        Ordering fields must not be NULL.
+        https://use-the-index-luke.com/no-offset
+
+        Cursor - urlsafe base64 of JSON {'o': ordering, 'd': direction, 'v': values}.
+    """
+
+    DIRECTIONS = ('next', 'previous')
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = self.get_ordering(object_list, ordering)
+
+    @staticmethod
+    def get_ordering(queryset, ordering=None):
+        """ Given ordering, ordering of the query or model Meta ordering, ending with pk. """
+
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        if not any(field.lstrip('-') in ('pk', queryset.model._meta.pk.name) for field in ordering):
+            # same direction as the last field, e.g. newest first for '-date_posted'.
+            is_descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-pk' if is_descending else 'pk')
+        return ordering
+
+    @property
+    def count(self):
+        """ Only for templates showing the total, pages don't need it. """
+
+        if not hasattr(self, '_count'):
+            self._count = self.object_list.count()
+        return self._count
+
+    def field_value(self, obj, field):
+        value = obj
+        for attr in field.lstrip('-').split('__'):
+            value = getattr(value, attr)
+        if isinstance(value, Model):
+            value = value.pk
+        return value
+
+    def encode_cursor(self, obj, direction):
+        values = [self.field_value(obj, field) for field in self.ordering]
+        data = json.dumps(
+            {'o': self.ordering, 'd': direction, 'v': values},
+            default=_json_default, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """ Returns (direction, values), raises InvalidCursor if cursor was changed. """
+
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            ordering, direction, values = data['o'], data['d'], data['v']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise InvalidCursor('Invalid cursor.')
+
+        # cursor of another order(sorting was changed).
+        if ordering != self.ordering or direction not in self.DIRECTIONS \
+                or not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor('Invalid cursor.')
+        return direction, values
+
+    def keyset_filter(self, values, forward=True):
+        """
+            (a, b, pk) after (x, y, z):
+            a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)
+            with < for descending fields. Reversed for previous pages.
+            AND a >= x is redundant, but lets the index scan start at x
+            instead of filtering all rows before it.
+        """
+
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            is_descending = field.startswith('-')
+            lookup = 'lt' if is_descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+
+        first_field = self.ordering[0]
+        lookup = 'lte' if first_field.startswith('-') == forward else 'gte'
+        return Q(**{f'{first_field.lstrip("-")}__{lookup}': values[0]}) & condition
+
+    def page(self, cursor=None):
+        queryset = self.object_list.order_by(*self.ordering)
+        forward = True
+
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+            forward = direction == 'next'
+            try:
+                queryset = queryset.filter(self.keyset_filter(values, forward))
+            except (ValidationError, ValueError, TypeError):
+                raise InvalidCursor('Invalid cursor.')
+
+        if not forward:
+            queryset = queryset.reverse()
+
+        # one more row tells if there is another page, without COUNT.
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            return KeysetPage(rows, self, has_next=has_more, has_previous=bool(cursor))
+
+        rows.reverse()
+        return KeysetPage(rows, self, has_next=True, has_previous=has_more)
@@ -0,0 +1,26 @@
+from django.db.models import Q, Sum
+from users.models import Profile, ProfileFavouriteBooks
+
+from books.models import SimilarBook
+
+
+def recommended_books(queryset, user_id, limit):
+    """
+        Books similar to the books the user liked or saved, best first, in one query.
+        Score of a book - sum of its similarity(SimilarBook, 'manage.py build_recommendations')
+        to each of the user's books. Books the user already liked or saved are left out.
+    """
+
+    liked = Profile.likes.through.objects.filter(profile_id=user_id).values('book_id')
+    saved = ProfileFavouriteBooks.objects.filter(user_id=user_id).values('book_id')
+
+    return (
+        queryset
+        # one filter() call - one join, the conditions are for the same SimilarBook row.
+        .filter(Q(similar_to__book__in=liked) | Q(similar_to__book__in=saved),
+                similar_to__source=SimilarBook.SOURCE_LIKES)
+        .exclude(pk__in=liked)
+        .exclude(pk__in=saved)
+        .annotate(score=Sum('similar_to__score'))
+        .order_by('-score', 'title')[:limit]
+    )
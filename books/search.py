@@ -0,0 +1,37 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+# Text search configuration of the search_vector trigger(migration 0023_book_search_vector),
+# the query must be parsed with the same one.
+SEARCH_CONFIG = 'english'
+
+
+def search_books(queryset, text):
+    """
+        Books matching the text, annotated with 'rank' and ordered by it(best first).
+        PostgreSQL - the GIN indexed search_vector, text in web search syntax:
+        words, "quoted phrases", or, -excluded.
+        https://docs.djangoproject.com/en/4.0/ref/contrib/postgres/search/
+
+        Other databases(development) - every word in title, description or author name,
+        all books have the same rank.
+    """
+
+    if connections[queryset.db].vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        # ts_rank returns real, double precision keeps its exact value in the keyset cursor.
+        rank = Cast(SearchRank(F('search_vector'), query), output_field=FloatField())
+        return queryset.filter(search_vector=query).annotate(rank=rank).order_by('-rank')
+
+    condition = Q()
+    for word in text.split():
+        condition &= (
+            Q(title__icontains=word)
+            | Q(description__icontains=word)
+            | Q(author__first_name__icontains=word)
+            | Q(author__last_name__icontains=word)
+        )
+    return queryset.filter(condition).annotate(
+        rank=Value(0.0, output_field=FloatField())).order_by('-rank')
@@ -0,0 +1,88 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from users.models import Profile, ProfileFavouriteBooks
+
+from .models import Book, BookCounter, Comment
+
+ProfileLikes = Profile.likes.through
+
+
+# post_delete is sent for every book deleted by CASCADE too(user or author deleted).
+@receiver(post_delete, sender=Book)
+def decrease_book_counters(sender, instance, **kwargs):
+    BookCounter.change(instance.counter_keys(), -1)
+
+
+# Book counter columns(likes_count, favourites_count, comments_count).
+# ProfileFavouriteBooks and Comment rows removed by delete() or CASCADE send post_delete.
+# Likes are an auto-created M2M table, Django sends no post_delete for its rows,
+# they are counted from m2m_changed and from pre_delete of Profile(CASCADE).
+# Changed likes and saves mark the book for 'manage.py build_recommendations --incremental'.
+# https://docs.djangoproject.com/en/4.0/ref/signals/#m2m-changed
+
+def liked_book_ids(instance, reverse, pk_set=None):
+    """ book_id of the like rows that remove(pk_set) or clear(None) will delete. """
+
+    if reverse:
+        rows = ProfileLikes.objects.filter(book_id=instance.pk)
+        if pk_set is not None:
+            rows = rows.filter(profile_id__in=pk_set)
+    else:
+        rows = ProfileLikes.objects.filter(profile_id=instance.pk)
+        if pk_set is not None:
+            rows = rows.filter(book_id__in=pk_set)
+    return list(rows.values_list('book_id', flat=True))
+
+
+@receiver(m2m_changed, sender=ProfileLikes)
+def count_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        # pk_set - only ids which were not added before.
+        if reverse:
+            # book.likes.add(*profiles)
+            Book.change_counter('likes_count', [instance.pk], len(pk_set), neighbours_stale=True)
+        else:
+            # profile.likes.add(*books)
+            Book.change_counter('likes_count', pk_set, 1, neighbours_stale=True)
+
+    elif action in ('pre_remove', 'pre_clear'):
+        # pk_set of remove() may contain books which were not liked.
+        instance._removed_likes = liked_book_ids(
+            instance, reverse, pk_set if action == 'pre_remove' else None)
+
+    elif action in ('post_remove', 'post_clear'):
+        book_ids = instance.__dict__.pop('_removed_likes', [])
+        if reverse and book_ids:
+            Book.change_counter(
+                'likes_count', [instance.pk], -len(book_ids), neighbours_stale=True)
+        elif book_ids:
+            Book.change_counter('likes_count', book_ids, -1, neighbours_stale=True)
+
+
+@receiver(pre_delete, sender=Profile)
+def count_likes_of_deleted_profile(sender, instance, **kwargs):
+    Book.change_counter(
+        'likes_count', liked_book_ids(instance, reverse=False), -1, neighbours_stale=True)
+
+
+@receiver(post_save, sender=ProfileFavouriteBooks)
+def count_added_favourite(sender, instance, created, **kwargs):
+    if created:
+        Book.change_counter('favourites_count', [instance.book_id], 1, neighbours_stale=True)
+
+
+@receiver(post_delete, sender=ProfileFavouriteBooks)
+def count_removed_favourite(sender, instance, **kwargs):
+    Book.change_counter('favourites_count', [instance.book_id], -1, neighbours_stale=True)
+
+
+@receiver(post_save, sender=Comment)
+def count_added_comment(sender, instance, created, **kwargs):
+    if created:
+        Book.change_counter('comments_count', [instance.book_id], 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_removed_comment(sender, instance, **kwargs):
+    Book.change_counter('comments_count', [instance.book_id], -1)
@@ -0,0 +1,129 @@
+import re
+
+import numpy as np
+from scipy import sparse
+
+# Item-to-item cosine similarity with sparse matrices, used by 'manage.py build_recommendations'.
+# No Django here, the functions run in worker processes.
+# https://docs.scipy.org/doc/scipy/reference/sparse.html
+
+# words of at least 2 letters, any alphabet.
+WORD_PATTERN = re.compile(r'[^\W\d_]{2,}')
+
+# set in every worker process by init_worker.
+_items = None
+_items_t = None
+
+
+def item_matrix(user_ids, book_ids):
+    """
+        Books x users matrix of interactions(liked or saved = 1),
+        rows normalized to unit length, so that a dot product of two rows is their cosine.
+        Returns (book ids of the rows, matrix).
+    """
+
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    books, book_index = np.unique(book_ids, return_inverse=True)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(book_index), dtype=np.float32), (book_index, user_index)),
+        shape=(len(books), len(users)))
+    # liked and saved is still one interaction.
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+
+    return books, normalize_rows(matrix)
+
+
+def normalize_rows(matrix):
+    """ Rows divided by their length, empty rows stay empty. """
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def book_terms(title, description, genre, language):
+    """
+        Terms of a book for TF-IDF, lowercase words of title and description,
+        genre and language are a term each, so that they are not mixed with words.
+    """
+
+    words = WORD_PATTERN.findall(f'{title} {description}'.lower())
+    return words + [f'genre:{genre}', f'language:{language.strip().lower()}']
+
+
+def tfidf_matrix(documents):
+    """
+        documents - iterable of term lists, e.g. book_terms.
+        Documents x terms matrix of sublinear tf * smoothed idf,
+        rows normalized to unit length, so that a dot product of two rows is their cosine.
+        https://en.wikipedia.org/wiki/Tf%E2%80%93idf
+    """
+
+    vocabulary = {}
+    indices, indptr = [], [0]
+    for terms in documents:
+        indices.extend(vocabulary.setdefault(term, len(vocabulary)) for term in terms)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), indices, indptr),
+        shape=(len(indptr) - 1, len(vocabulary)))
+    matrix.sum_duplicates()
+    # a word repeated 10 times is not 10 times more important.
+    matrix.data = 1 + np.log(matrix.data)
+
+    document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    idf = np.log((1 + matrix.shape[0]) / (1 + document_frequency)) + 1
+    return normalize_rows(matrix.multiply(idf.astype(np.float32)).tocsr())
+
+
+def related_rows(matrix, rows):
+    """ Rows sharing at least one user with given rows(their similarities changed). """
+
+    users = np.unique(matrix[rows].indices)
+    if not len(users):
+        return np.asarray(rows)
+    related = np.unique(matrix.tocsc()[:, users].indices)
+    return np.union1d(related, rows)
+
+
+def init_worker(items):
+    global _items, _items_t
+    _items = items
+    _items_t = items.T.tocsr()
+
+
+def top_neighbours(task):
+    """
+        task - (rows, k, min_score).
+        Cosine of the rows with all books, block by block so that memory is bounded
+        by the number of rows, not by the number of books.
+        Returns arrays (row, neighbour row, score), k best neighbours of every row.
+    """
+
+    rows, k, min_score = task
+    scores = _items[rows].dot(_items_t).tocsr()
+
+    result_rows, result_neighbours, result_scores = [], [], []
+    for position, row in enumerate(rows):
+        start, end = scores.indptr[position], scores.indptr[position + 1]
+        neighbours = scores.indices[start:end]
+        values = scores.data[start:end]
+
+        keep = (neighbours != row) & (values >= min_score)
+        neighbours, values = neighbours[keep], values[keep]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            neighbours, values = neighbours[best], values[best]
+
+        order = np.argsort(-values, kind='stable')
+        result_rows.append(np.full(len(order), row))
+        result_neighbours.append(neighbours[order])
+        result_scores.append(values[order])
+
+    if not result_rows:
+        return np.empty(0, int), np.empty(0, int), np.empty(0, np.float32)
+    return (np.concatenate(result_rows), np.concatenate(result_neighbours),
+            np.concatenate(result_scores))
@@ -0,0 +1,78 @@
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.text import slugify
+
+# room for '-99999' at the end of the longest slug.
+SUFFIX_ROOM = 6
+
+# Slugs from base to base + '.' in byte order(varchar_pattern_ops, the slug_like index)
+# are base and base-..., '-' is the only slug character before '.'.
+# One index range scan per base, then the unique index for the queryset's rows.
+# ARRAY() runs once, IN (subquery) would be planned as a join reading the whole table.
+TAKEN_SLUGS_SQL = """
+    {table}.slug = ANY(ARRAY(
+        SELECT book.slug
+        FROM unnest(%s::varchar[]) AS base(slug)
+        CROSS JOIN LATERAL (
+            SELECT slug FROM {table}
+            WHERE slug ~>=~ base.slug AND slug ~<~ (base.slug || '.')
+        ) AS book
+    ))
+"""
+
+
+def book_slug(title, author, max_length=50):
+    """
+        Slug of a book without a suffix, title and author making it less likely
+        to match with another slug, cut so that a suffix still fits.
+        https://docs.djangoproject.com/en/4.0/ref/utils/#django.utils.text.slugify
+    """
+
+    return slugify(f'{title} {author}')[:max_length - SUFFIX_ROOM].strip('-')
+
+
+def allocate_slugs(queryset, bases):
+    """
+        Free slug for every base, in order: the base itself or base-N after the highest N taken,
+        base repeated in bases gets the next N. queryset - books the slugs must differ from.
+        One query on the slug indexes, no matter how many books or bases there are,
+        e.g. a batch of 'manage.py import_books'.
+        The unique index is still the source of truth, two requests may get the same slug,
+        check Book.save.
+    """
+
+    unique_bases = set(bases)
+    highest = {}
+    taken = queryset.filter(taken_slugs(queryset, unique_bases)).order_by()
+    for slug in taken.values_list('slug', flat=True).iterator():
+        if slug in unique_bases:
+            highest[slug] = max(highest.get(slug, 0), 1)
+        base, _, suffix = slug.rpartition('-')
+        if base in unique_bases and suffix.isdigit():
+            highest[base] = max(highest.get(base, 0), int(suffix))
+
+    slugs = []
+    for base in bases:
+        number = highest.get(base, 0) + 1
+        highest[base] = number
+        slugs.append(base if number == 1 else f'{base}-{number}')
+    return slugs
+
+
+def taken_slugs(queryset, bases):
+    """ Condition matching the bases and base-... slugs. """
+
+    if connections[queryset.db].vendor == 'postgresql':
+        table = connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)
+        return RawSQL(TAKEN_SLUGS_SQL.format(table=table), [list(bases)],
+                      output_field=BooleanField())
+
+    taken = Q(slug__in=bases)
+    for base in bases:
+        taken |= Q(slug__startswith=f'{base}-')
+    return taken
+
+
+def allocate_slug(queryset, base):
+    return allocate_slugs(queryset, [base])[0]
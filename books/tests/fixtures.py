@@ -0,0 +1,37 @@
+"""
+    Objects shared by the TestCases of books, called from setUpTestData.
+    Only the fields a test checks are passed, the rest are the same for every test.
+    https://docs.djangoproject.com/en/4.0/topics/testing/tools/#django.test.TestCase.setUpTestData
+"""
+
+from books.models import Author, Book
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+PASSWORD = '12345'
+AUTHOR_IMAGE = 'https://upload.wikimedia.org/wikipedia/commons/5/5c/JSJoseSaramago.jpg'
+
+
+def create_user(username='testuser'):
+    return User.objects.create_user(username=username, password=PASSWORD)
+
+
+def create_author(first_name='Gordon', last_name='Ramsay'):
+    return Author.objects.create(
+        first_name=first_name,
+        last_name=last_name,
+        image=AUTHOR_IMAGE,
+        birth_date='2022-03-09',
+        biography='Biography'
+    )
+
+
+def create_book(author, posted_by, title='Title', **fields):
+    fields = {
+        'language': 'Bulgarian',
+        'genre': 'COMEDY',
+        'description': 'Description',
+        'date_posted': timezone.now(),
+        **fields,
+    }
+    return Book.objects.create(title=title, author=author, posted_by=posted_by, **fields)
@@ -0,0 +1,314 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from books.models import Author, Book, BookCounter, SimilarBook
+from books.tests.fixtures import create_author, create_book, create_user
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+
+IMPORT_MEDIA_ROOT = tempfile.mkdtemp()
+IMPORT_ORIGINALS_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=IMPORT_MEDIA_ROOT, IMAGE_ORIGINALS_ROOT=IMPORT_ORIGINALS_ROOT)
+class TestImportBooks(TestCase):
+    """
+        'manage.py import_books', books and authors are written with bulk_create,
+        everything Book.save does is done by the command.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('importer')
+        cls.author = create_author('Frank', 'Herbert')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(IMPORT_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(IMPORT_ORIGINALS_ROOT, ignore_errors=True)
+
+    def row(self, **values):
+        return {
+            'title': 'Dune', 'author_first_name': 'Frank', 'author_last_name': 'Herbert',
+            'language': 'English', 'genre': 'classic', 'description': 'Description',
+            **values,
+        }
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory, 'books.csv')
+        fields = list(dict.fromkeys(field for row in rows for field in row))
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def import_books(self, path, *args):
+        output = StringIO()
+        call_command('import_books', path, '--user', 'importer', '--workers', '1',
+                     *args, stdout=output, stderr=output)
+        return output.getvalue()
+
+    def test_import_csv(self):
+        new_author = {'author_first_name': 'Ursula', 'author_last_name': 'Le Guin',
+                      'author_image': 'https://example.com/ursula.jpg',
+                      'author_birth_date': '1929-10-21', 'author_biography': 'Biography'}
+        path = self.write_csv([
+            self.row(),
+            self.row(),
+            self.row(title='Earthsea', **new_author),
+            self.row(title='The Dispossessed', **new_author),
+        ])
+
+        output = self.import_books(path, '--batch-size', '3')
+
+        self.assertIn('4 books imported, 1 new authors, 0 rows failed.', output)
+        self.assertEqual(Author.objects.filter(last_name='Le Guin').count(), 1)
+        self.assertEqual(
+            sorted(Book.objects.filter(author=self.author).values_list('slug', flat=True)),
+            ['dune-frank-herbert', 'dune-frank-herbert-2'])
+        book = Book.objects.get(title='Earthsea')
+        self.assertEqual(book.genre, Book.GENRE_CLASSIC)
+        self.assertEqual(book.posted_by, self.user)
+        self.assertTrue(book.content_stale)
+        self.assertIsNotNone(book.search_vector)
+        self.assertEqual(
+            BookCounter.objects.get(scope=BookCounter.SCOPE_AUTHOR, key=str(book.author_id)).count, 2)
+        self.assertEqual(BookCounter.objects.get(scope=BookCounter.SCOPE_ALL).count, 4)
+
+    def test_failed_batch_leaves_no_new_authors(self):
+        path = self.write_csv([self.row(title='Earthsea', author_first_name='Ursula',
+                                        author_last_name='Le Guin',
+                                        author_image='https://example.com/ursula.jpg',
+                                        author_birth_date='1929-10-21',
+                                        author_biography='Biography')])
+
+        with patch('books.models.BookCounter.add_counts', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.import_books(path)
+
+        self.assertFalse(Author.objects.filter(last_name='Le Guin').exists())
+        self.assertFalse(Book.objects.exists())
+
+    def test_cover_is_copied_and_processed(self):
+        Image.new('RGB', (800, 1000), 'white').save(os.path.join(self.directory, 'dune.jpg'))
+        path = self.write_csv([self.row(cover='dune.jpg')])
+
+        self.import_books(path)
+
+        book = Book.objects.get()
+        self.assertTrue(book.image.name.startswith('books_pics/dune.'))
+        self.assertEqual(book.image_status, Book.IMAGE_STATUS_READY)
+        with Image.open(book.image.path) as image:
+            self.assertLessEqual(image.height, 500)
+
+    def test_shared_cover_is_processed_once(self):
+        Image.new('RGB', (800, 1000), 'white').save(os.path.join(self.directory, 'dune.jpg'))
+        path = self.write_csv([self.row(title=title, cover='dune.jpg')
+                               for title in ('Dune', 'Dune Messiah', 'Children of Dune')])
+
+        with patch('books.management.commands.import_books.Pool') as pool:
+            pool.return_value.map.side_effect = lambda function, items, chunksize: list(map(function, items))
+            self.import_books(path, '--batch-size', '2')
+
+        items = [item for call in pool.return_value.map.call_args_list for item in call.args[1]]
+        self.assertEqual(len(items), 1)
+        self.assertEqual(len(set(Book.objects.values_list('image', flat=True))), 1)
+        self.assertEqual(Book.objects.filter(image_status=Book.IMAGE_STATUS_READY).count(), 3)
+
+    def test_invalid_rows_are_reported(self):
+        errors_path = os.path.join(self.directory, 'errors.jsonl')
+        path = self.write_csv([
+            self.row(genre='poetry'),
+            self.row(title=''),
+            self.row(author_first_name='Unknown'),
+            self.row(cover='missing.jpg'),
+            self.row(),
+        ])
+
+        output = self.import_books(path, '--errors', errors_path)
+
+        self.assertIn('1 books imported, 0 new authors, 4 rows failed.', output)
+        with open(errors_path, encoding='utf-8') as file:
+            errors = [json.loads(line) for line in file]
+        self.assertEqual([error['row'] for error in errors], [1, 2, 3, 4])
+        self.assertIn('genre', errors[0]['errors'][0])
+        self.assertEqual(errors[1]['errors'], ['title: This field is required.'])
+        self.assertIn('author_image', ' '.join(errors[2]['errors']))
+        self.assertIn('No such file', errors[3]['errors'][0])
+        self.assertEqual(errors[0]['data']['genre'], 'poetry')
+
+    def test_fixed_errors_file_is_imported_again(self):
+        errors_path = os.path.join(self.directory, 'errors.jsonl')
+        path = self.write_csv([self.row(genre='poetry'), self.row(title='Children of Dune')])
+        self.import_books(path, '--errors', errors_path)
+
+        with open(errors_path, encoding='utf-8') as file:
+            errors = [json.loads(line) for line in file]
+        errors[0]['data']['genre'] = 'classic'
+        fixed_path = os.path.join(self.directory, 'fixed.jsonl')
+        with open(fixed_path, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(error) + '\n' for error in errors)
+
+        output = self.import_books(fixed_path)
+
+        self.assertIn('1 books imported, 0 new authors, 0 rows failed.', output)
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)),
+                         ['Children of Dune', 'Dune'])
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write_csv([self.row(), self.row(title='')])
+        counters = list(BookCounter.objects.values_list('scope', 'key', 'count'))
+
+        output = self.import_books(path, '--dry-run')
+
+        self.assertIn('1 books would be imported, 0 new authors, 1 rows failed.', output)
+        self.assertFalse(Book.objects.exists())
+        self.assertEqual(list(BookCounter.objects.values_list('scope', 'key', 'count')), counters)
+
+    def test_import_jsonl_from_start_row(self):
+        path = os.path.join(self.directory, 'books.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(self.row(title='First')) + '\n')
+            file.write('not json\n')
+            file.write(json.dumps(self.row(title='Third')) + '\n')
+
+        output = self.import_books(path, '--start-row', '2')
+
+        self.assertIn('Row 2: Row is not a JSON object.', output)
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Third'])
+
+
+class TestReconcileBookCounters(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.book = create_book(create_author(), cls.user)
+
+    def counters(self):
+        return Book.objects.values_list(*Book.COUNTER_FIELDS).get(pk=self.book.pk)
+
+    def test_reconcile_fixes_drift(self):
+        self.user.profile.likes.add(self.book)
+        Book.objects.filter(pk=self.book.pk).update(likes_count=5, comments_count=3)
+
+        output = StringIO()
+        call_command('reconcile_book_counters', stdout=output)
+
+        self.assertIn('Checked 1 books, 1 fixed.', output.getvalue())
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+
+class TestBuildRecommendations(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        author = create_author()
+        cls.books = {title: create_book(author, cls.user, title, genre='ART') for title in 'ABCDE'}
+        cls.profiles = [create_user(f'user{index}').profile for index in range(3)]
+        # user0 and user1 like A and B, user1 also C, user2 - D only.
+        for profile, titles in zip(cls.profiles, ('AB', 'ABC', 'D')):
+            profile.likes.add(*[cls.books[title] for title in titles])
+        cls.user.profile.likes.add(cls.books['A'])
+
+    def build(self, *args):
+        out = StringIO()
+        call_command('build_recommendations', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def neighbours(self, title):
+        return list(SimilarBook.objects.filter(book=self.books[title])
+                    .order_by('-score', 'similar_book__title')
+                    .values_list('similar_book__title', flat=True))
+
+    def test_similar_books_are_stored_best_first(self):
+        self.build()
+
+        self.assertEqual(self.neighbours('A'), ['B', 'C'])
+        # C shares user1 with both, B has fewer other users than A.
+        self.assertEqual(self.neighbours('C'), ['B', 'A'])
+        self.assertEqual(self.neighbours('D'), [])
+        self.assertEqual(self.neighbours('E'), [])
+
+    def test_incremental_only_computes_changed_books(self):
+        self.build()
+        Book.objects.update(neighbours_stale=False)
+        self.profiles[2].likes.add(self.books['E'])
+
+        output = self.build('--incremental')
+
+        self.assertIn('Computed neighbours of 2 books.', output)
+        self.assertEqual(self.neighbours('D'), ['E'])
+        self.assertEqual(self.neighbours('A'), ['B', 'C'])
+        self.assertFalse(Book.objects.filter(neighbours_stale=True).exists())
+        self.assertIn('No books with changed likes or saves.', self.build('--incremental'))
+
+    def test_incremental_removes_books_without_likes(self):
+        self.build()
+        self.books['C'].likes.clear()
+
+        self.build('--incremental')
+
+        self.assertEqual(self.neighbours('C'), [])
+        self.assertEqual(self.neighbours('A'), ['B'])
+
+
+class TestBuildSimilarBooks(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        author = create_author()
+        cls.books = {
+            title: create_book(
+                author, cls.user, title, language='English', genre=genre, description=description)
+            for title, genre, description in (
+                ('Dune', 'ART', 'Spice and sand worms on a desert planet.'),
+                ('Dune Messiah', 'ART', 'The emperor of the desert planet and the spice.'),
+                ('Kitchen', 'COMEDY', 'Recipes for a busy kitchen.'),
+                ('Pastry', 'COMEDY', 'Recipes for cakes and bread.'),
+            )
+        }
+
+    def build(self, *args):
+        out = StringIO()
+        call_command('build_similar_books', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def neighbours(self, title):
+        return list(SimilarBook.objects.filter(
+            book=self.books[title], source=SimilarBook.SOURCE_CONTENT)
+            .order_by('-score').values_list('similar_book__title', flat=True))
+
+    def test_books_with_similar_content_are_neighbours(self):
+        self.build()
+
+        self.assertEqual(self.neighbours('Dune')[0], 'Dune Messiah')
+        self.assertEqual(self.neighbours('Kitchen')[0], 'Pastry')
+        self.assertNotIn('Dune', self.neighbours('Dune'))
+
+    def test_incremental_computes_edited_books_and_their_neighbours(self):
+        self.build()
+        book = Book.objects.get(pk=self.books['Kitchen'].pk)
+        book.description = 'Spice recipes from the desert planet.'
+        book.save()
+
+        self.build('--incremental')
+
+        self.assertIn('Kitchen', self.neighbours('Dune'))
+        self.assertIn('Dune', self.neighbours('Kitchen'))
+        self.assertIn('No new or edited books.', self.build('--incremental'))
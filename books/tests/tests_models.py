@@ -1,7 +1,9 @@
-from books.models import Author, Book, Comment
+from books.models import Author, Book, BookCounter, Comment
+from books.tests.fixtures import create_author, create_book, create_user
 from django.contrib.auth.models import User
 from django.test import TestCase
 from django.utils import timezone
+from users.models import ProfileFavouriteBooks
 
 
 class TestBookModels(TestCase):
@@ -42,5 +44,152 @@ class TestBookModels(TestCase):
     def test_get_absolute_url(self):
         self.assertEqual(
             self.book.get_absolute_url(),
-            '/books/book/1/title-test-gordon-ramsay/'
+            f'/books/book/{self.book.pk}/title-test-gordon-ramsay/'
         )
+
+    def test_save_without_title_or_author_change_keeps_slug(self):
+        """
+            Only UPDATE query, author is not fetched for the slug
+            and image is not queued again.
+        """
+        book = Book.objects.get(pk=self.book.pk)
+        book.description = 'Description Updated'
+
+        with self.assertNumQueries(1):
+            book.save()
+        self.assertEqual(book.slug, 'title-test-gordon-ramsay')
+        self.assertEqual(book.image_status, Book.IMAGE_STATUS_READY)
+
+    def test_save_with_title_change_updates_slug(self):
+        book = Book.objects.get(pk=self.book.pk)
+        book.title = 'Title Updated'
+        book.save()
+
+        self.assertEqual(book.slug, 'title-updated-gordon-ramsay')
+
+
+class TestBookCounter(TestCase):
+    """
+        BookCounter rows, kept by Book.save and post_delete.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.authors = [create_author(f'First{index}', f'Last{index}') for index in range(2)]
+        cls.books = [
+            create_book(cls.authors[index % 2], cls.user, f'Title {index}',
+                        genre=['COMEDY', 'HISTORY'][index % 2])
+            for index in range(3)
+        ]
+
+    def counter(self, scope, key=''):
+        return BookCounter.objects.get(scope=scope, key=str(key)).count
+
+    def test_created_books_are_counted(self):
+        self.assertEqual(self.counter(BookCounter.SCOPE_ALL), 3)
+        self.assertEqual(self.counter(BookCounter.SCOPE_GENRE, 'COMEDY'), 2)
+        self.assertEqual(self.counter(BookCounter.SCOPE_AUTHOR, self.authors[1].pk), 1)
+        self.assertEqual(self.counter(BookCounter.SCOPE_USER, self.user.pk), 3)
+
+    def test_changed_genre_and_author_move_counts(self):
+        book = Book.objects.get(pk=self.books[0].pk)
+        book.genre = 'HISTORY'
+        book.author = self.authors[1]
+        book.save()
+
+        self.assertEqual(self.counter(BookCounter.SCOPE_GENRE, 'COMEDY'), 1)
+        self.assertEqual(self.counter(BookCounter.SCOPE_GENRE, 'HISTORY'), 2)
+        self.assertEqual(self.counter(BookCounter.SCOPE_AUTHOR, self.authors[0].pk), 1)
+        self.assertEqual(self.counter(BookCounter.SCOPE_AUTHOR, self.authors[1].pk), 2)
+        self.assertEqual(self.counter(BookCounter.SCOPE_ALL), 3)
+
+    def test_reassigned_book_moves_user_count(self):
+        other_user = create_user('otheruser')
+        # as saved by BookAdmin.
+        book = Book.objects.get(pk=self.books[0].pk)
+        book.posted_by = other_user
+        book.save()
+
+        self.assertEqual(self.counter(BookCounter.SCOPE_USER, self.user.pk), 2)
+        self.assertEqual(self.counter(BookCounter.SCOPE_USER, other_user.pk), 1)
+        self.assertEqual(self.counter(BookCounter.SCOPE_ALL), 3)
+
+    def test_deleted_books_are_not_counted(self):
+        self.books[0].delete()
+        # CASCADE
+        self.authors[1].delete()
+
+        self.assertEqual(self.counter(BookCounter.SCOPE_ALL), 1)
+        self.assertEqual(self.counter(BookCounter.SCOPE_USER, self.user.pk), 1)
+
+    def test_rebuild_restores_counts(self):
+        Book.objects.filter(pk=self.books[0].pk).update(genre='HISTORY')
+
+        self.assertEqual(BookCounter.rebuild(), 6)
+        self.assertEqual(self.counter(BookCounter.SCOPE_GENRE, 'HISTORY'), 2)
+
+
+class TestCounterColumns(TestCase):
+    """
+        likes_count, favourites_count and comments_count of Book, books/signals.py.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.other_user = create_user('otheruser')
+        cls.book = create_book(create_author(), cls.user)
+
+    def counters(self):
+        return Book.objects.values_list(*Book.COUNTER_FIELDS).get(pk=self.book.pk)
+
+    def test_likes_added_from_book_side(self):
+        self.book.likes.add(self.user.profile, self.other_user.profile)
+        # already liked, not counted again.
+        self.user.profile.likes.add(self.book)
+
+        self.assertEqual(self.counters(), (2, 0, 0))
+
+    def test_deleted_user_is_not_counted(self):
+        profile = self.other_user.profile
+        profile.likes.add(self.book)
+        ProfileFavouriteBooks.objects.create(user=profile, book=self.book)
+        Comment.objects.create(book=self.book, posted_by=self.other_user, content='Nice book')
+
+        self.other_user.delete()
+
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_save_does_not_overwrite_counters(self):
+        book = Book.objects.get(pk=self.book.pk)
+        self.user.profile.likes.add(self.book)
+
+        book.description = 'Description Updated'
+        book.save()
+
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+
+class TestContentStale(TestCase):
+    """
+        content_stale marks books for build_similar_books --incremental.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.book = create_book(create_author(), cls.user, 'Kitchen', language='English',
+                               description='Recipes for a busy kitchen.')
+
+    def test_only_content_changes_mark_book_stale(self):
+        Book.objects.update(content_stale=False)
+
+        book = Book.objects.get(pk=self.book.pk)
+        book.posted_by = create_user('otheruser')
+        book.save()
+        self.assertFalse(Book.objects.get(pk=book.pk).content_stale)
+
+        book.description = 'A desert planet without spice.'
+        book.save()
+        self.assertTrue(Book.objects.get(pk=book.pk).content_stale)
@@ -0,0 +1,83 @@
+from unittest.mock import patch
+
+from books.forms import BookForm
+from books.models import Book
+from books.slugs import allocate_slugs
+from books.tests.fixtures import create_author, create_book, create_user
+from django.test import TestCase
+
+
+class TestSlugAllocation(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.author = create_author('Frank', 'Herbert')
+
+    def create_book(self, title='Dune'):
+        return create_book(self.author, self.user, title, language='English', genre='ART')
+
+    def test_same_title_and_author_get_numbered_slugs(self):
+        slugs = [self.create_book().slug for _ in range(3)]
+
+        self.assertEqual(slugs, ['dune-frank-herbert', 'dune-frank-herbert-2', 'dune-frank-herbert-3'])
+
+    def test_allocate_slugs_in_one_query(self):
+        self.create_book()
+        Book.objects.filter(pk=self.create_book().pk).update(slug='dune-frank-herbert-7')
+
+        with self.assertNumQueries(1):
+            slugs = allocate_slugs(
+                Book.objects.all(), ['dune-frank-herbert', 'other', 'dune-frank-herbert'])
+
+        self.assertEqual(slugs, ['dune-frank-herbert-8', 'other', 'dune-frank-herbert-9'])
+
+    def test_editing_keeps_own_slug(self):
+        book = self.create_book()
+        book.title = 'Dune'
+        book.author = self.author
+        book.description = 'Changed'
+        book.save()
+
+        self.assertEqual(book.slug, 'dune-frank-herbert')
+
+    def test_long_title_fits_slug_field(self):
+        book = self.create_book('A very long title ' * 5)
+        other = self.create_book('A very long title ' * 5)
+
+        max_length = Book._meta.get_field('slug').max_length
+        self.assertLessEqual(len(book.slug), max_length)
+        self.assertEqual(other.slug, f'{book.slug}-2')
+
+    def test_slug_taken_meanwhile_gets_next_one(self):
+        self.create_book()
+
+        # as if another request saved the same slug after it was allocated.
+        with patch('books.models.allocate_slug', side_effect=['dune-frank-herbert', 'dune-frank-herbert-2']):
+            book = self.create_book()
+
+        self.assertEqual(Book.objects.get(pk=book.pk).slug, 'dune-frank-herbert-2')
+
+    def test_form_rejects_existing_title_and_author(self):
+        self.create_book()
+        form = BookForm(data={'title': 'Dune', 'author': self.author.pk})
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('Book with given title and author already exists!', form.non_field_errors())
+
+    def test_form_accepts_long_titles_with_same_slug_base(self):
+        prefix = 'A very long title ' * 5
+        book = self.create_book(prefix + 'Volume One')
+        form = BookForm(data={'title': prefix + 'Volume Two', 'author': self.author.pk})
+
+        form.is_valid()
+        self.assertNotIn('Book with given title and author already exists!', form.non_field_errors())
+        other = self.create_book(prefix + 'Volume Two')
+        self.assertEqual(other.slug, f'{book.slug}-2')
+
+    def test_form_rejects_existing_title_in_other_case(self):
+        self.create_book()
+        form = BookForm(data={'title': 'DUNE', 'author': self.author.pk})
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('Book with given title and author already exists!', form.non_field_errors())
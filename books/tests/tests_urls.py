@@ -17,15 +17,10 @@ class TestBookUrls(TestCase):
 
         All the tests in this module use the client (belonging to our TestCase's derived class).
 
-        tests_models.py creates first book in setUpTestData.
-        So, in this module setUpTestData. 
-
-        setUpTestData deletes everything created in the module form which is used,
-        so here the book is with pk=2.
+        Books of other modules are rolled back, but not their ids,
+        so urls are built from the pk of the book created in setUpTestData.
     """
 
-    BOOK_KWARGS = {'pk': 2, 'slug': 'title-author'}
-
     @classmethod
     def setUpTestData(cls):
         """ 
@@ -56,6 +51,8 @@ class TestBookUrls(TestCase):
             posted_by=cls.user
         )
 
+        cls.BOOK_KWARGS = {'pk': cls.book.pk, 'slug': 'title-author'}
+
     # URL RESOVLES
 
     def test_recommended_books_url_is_resolved(self):
@@ -84,7 +81,7 @@ class TestBookUrls(TestCase):
         self.assertEquals(resolver_match.func.view_class, GenreBookListView)
 
     def test_author_books_url_is_resolved(self):
-        url = reverse('author_books', kwargs={'pk': 1, 'author': 'Gordon Ramsay'})
+        url = reverse('author_books', kwargs={'pk': self.author.pk, 'author': 'Gordon Ramsay'})
         resolver_match = resolve(url)
 
         self.assertEquals(resolver_match.func.view_class, AuthorBookListView)
@@ -221,7 +218,7 @@ class TestBookUrls(TestCase):
         self.client.login(username='testuser', password='12345')
 
         response = self.client.get(
-            reverse('author_books', kwargs={'pk': 1, 'author': 'Gordon Ramsay'}))
+            reverse('author_books', kwargs={'pk': self.author.pk, 'author': 'Gordon Ramsay'}))
         self.assertEqual(response.status_code, 200)
 
     def test_author_books_url_response_not_logged_in(self):
@@ -230,7 +227,7 @@ class TestBookUrls(TestCase):
         """
 
         response = self.client.get(
-            reverse('author_books', kwargs={'pk': 1, 'author': 'Gordon Ramsay'}))
+            reverse('author_books', kwargs={'pk': self.author.pk, 'author': 'Gordon Ramsay'}))
         self.assertEqual(response.status_code, 200)
 
     def test_books_create_url_response_logged_in(self):
@@ -1,19 +1,25 @@
+import ast
+from datetime import timedelta
+from io import StringIO
+
+from books.counts import ListCount, estimated_count
+from books.forms import BookOrderForm
 from books.models import Author, Book, Comment
+from books.pagination import InvalidCursor, KeysetPaginator
+from books.tests.fixtures import create_author, create_book, create_user
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
+from users.models import ProfileFavouriteBooks
 
 
 class TestBookViews(TestCase):
     """
         All the tests in this module use the client (belonging to our TestCase's derived class).
-        If test TestCase is runned independently, pk:2 in setUp urls will throw Fails,
-        Because in tests_urls.py is creating a book first.
-        So here a second book is being created. And if this is run with
-        command 'python manage.py test books/tests/tests_views.py' will throw error, because
-        then will become the first book('tests_urls.py' has not been run).
-        That's why run all tests together, not independently
+        Books of other modules are rolled back, but not their ids,
+        so urls are built from the pk of the book created in setUpTestData.
 
     """
 
@@ -58,10 +64,8 @@ class TestBookViews(TestCase):
     def setUp(self):
         """
             This function runs before every single test method.
-            PK:2 , because in test_views, the first book was created,
-            setUpTestData class method(above), deletes books from other TestCases(modules).
         """
-        BOOK_KWARGS = {'pk': 3, 'slug': 'title-author'}
+        BOOK_KWARGS = {'pk': self.book.pk, 'slug': 'title-author'}
 
         self.my_books_url = reverse('my_books')
         self.books_create_url = reverse('books_create')
@@ -394,3 +398,624 @@ class TestBookViews(TestCase):
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Book.objects.count(), 0)
+
+
+class TestBookViewsQueryBudgets(TestCase):
+    """
+        Number of queries of every book list view must not depend on the number of books.
+        If a budget fails, check for N+1 queries in the templates(e.g. book.author),
+        and use book_cards_query in the view.
+        https://docs.djangoproject.com/en/4.0/topics/testing/tools/#django.test.TransactionTestCase.assertNumQueries
+    """
+
+    # session, user with profile and groups(UserContextBackend), count, books
+    LOGGED_IN_BUDGET = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.authors = [create_author(f'First{index}', f'Last{index}') for index in range(4)]
+        cls.books = [create_book(author, cls.user, f'Title {index}')
+                     for index, author in enumerate(cls.authors)]
+
+        profile = cls.user.profile
+        profile.likes.add(*cls.books)
+        for book in cls.books:
+            ProfileFavouriteBooks.objects.create(
+                user_id=profile.user_id, book_id=book.id)
+
+    def setUp(self):
+        self.client.login(username='testuser', password='12345')
+
+    def test_books_library_query_budget(self):
+        self.client.logout()
+        # count, books
+        with self.assertNumQueries(2):
+            self.client.get(reverse('books_library'))
+
+    def test_books_library_ordered_by_author_query_budget(self):
+        with self.assertNumQueries(self.LOGGED_IN_BUDGET):
+            self.client.get(reverse('books_library'), {'order_by': "['author_name']"})
+
+    def test_my_books_query_budget(self):
+        with self.assertNumQueries(self.LOGGED_IN_BUDGET):
+            self.client.get(reverse('my_books'))
+
+    def test_favourites_query_budget(self):
+        with self.assertNumQueries(self.LOGGED_IN_BUDGET):
+            self.client.get(reverse('profile_favourites'))
+
+    def test_genre_books_query_budget(self):
+        with self.assertNumQueries(self.LOGGED_IN_BUDGET):
+            self.client.get(reverse('genre_books', kwargs={'genre': 'COMEDY'}))
+
+    def test_author_books_query_budget(self):
+        author = self.authors[0]
+        with self.assertNumQueries(self.LOGGED_IN_BUDGET):
+            self.client.get(reverse(
+                'author_books', kwargs={'pk': author.pk, 'author': author}))
+
+    def test_profile_books_query_budget(self):
+        with self.assertNumQueries(self.LOGGED_IN_BUDGET):
+            self.client.get(reverse(
+                'profile_books', kwargs={'profile': 'testuser'}))
+
+    def test_book_details_query_budget_does_not_depend_on_comments(self):
+        book = self.books[0]
+        url = reverse('books_details', kwargs={'pk': book.pk, 'slug': book.slug})
+        users = [User.objects.create_user(username=f'commenter{index}', password='12345')
+                 for index in range(3)]
+
+        # session, user with profile and groups, book with like/save state,
+        # comments with authors and avatars, similar books
+        for comments_count in (1, 4):
+            Comment.objects.bulk_create(
+                Comment(book=book, posted_by=users[index % len(users)], content='Comment')
+                for index in range(comments_count))
+            with self.assertNumQueries(5):
+                response = self.client.get(url)
+            self.assertTrue(response.context['has_user_liked_book'])
+            self.assertTrue(response.context['has_user_saved_book'])
+
+    def test_book_update_loads_book_once(self):
+        book = self.books[0]
+        response = self.client.get(
+            reverse('books_update', kwargs={'pk': book.pk, 'slug': book.slug}))
+
+        # test_func and UpdateView share the object.
+        identity_map = response.wsgi_request.identity_map
+        self.assertEqual((identity_map.loads, identity_map.hits), (1, 1))
+
+    def test_comment_delete_loads_comment_and_book_once(self):
+        self.user.is_superuser = True
+        self.user.save()
+        book = self.books[0]
+        comment = Comment.objects.create(book=book, posted_by=self.user, content='Comment')
+        url = reverse('books_comment_delete',
+                      kwargs={'pk': book.pk, 'slug': book.slug, 'id': comment.pk})
+
+        # session, user with profile and groups, comment with book
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.context['book'], book)
+
+    def test_recommended_books_query_budget(self):
+        # session, user with profile and groups, books, recommended for you
+        with self.assertNumQueries(4):
+            self.client.get(reverse('recommended_books'))
+
+
+class TestKeysetPaginator(TestCase):
+    """
+        Walking all pages forward and back must return the same books
+        in the same order as the whole ordered query, for every sort choice.
+        Books share titles, languages, dates and authors, so the pk tie-breaker is needed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = create_user()
+        authors = [create_author(first_name, last_name)
+                   for first_name, last_name in (('Ann', 'Lee'), ('Ann', 'Bell'), ('Bob', 'Lee'))]
+        now = timezone.now()
+        for index in range(11):
+            create_book(
+                authors[index % 3], user, f'Title {index % 4}',
+                language=['Bulgarian', 'English'][index % 2],
+                # same date for pairs of books.
+                date_posted=now - timedelta(days=index // 2))
+
+    def walk_forward(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def walk_back(self, paginator, last_page):
+        pages = [last_page]
+        while pages[-1].has_previous():
+            pages.append(paginator.page(pages[-1].previous_cursor))
+        return pages[::-1]
+
+    def test_pages_match_ordered_query_for_every_choice(self):
+        for choice, _ in BookOrderForm.CHOICES:
+            with self.subTest(order_by=choice):
+                ordering = ast.literal_eval(choice) if choice.startswith('[') else [choice]
+                queryset = Book.objects.order_by(*ordering)
+                expected = list(queryset.order_by(
+                    *KeysetPaginator.get_ordering(queryset)))
+
+                paginator = KeysetPaginator(queryset, 3)
+                pages = self.walk_forward(paginator)
+                self.assertEqual(
+                    [book for page in pages for book in page], expected)
+                self.assertFalse(pages[0].has_previous())
+
+                back = self.walk_back(paginator, pages[-1])
+                self.assertEqual(
+                    [book for page in back for book in page], expected)
+
+    def test_author_order_follows_renamed_author(self):
+        author = Author.objects.get(first_name='Bob')
+        author.first_name = 'Aaron'
+        author.save()
+
+        first = Book.objects.order_by('author_name', 'pk').first()
+        self.assertEqual(first.author_name, 'Aaron Lee')
+        self.assertEqual(first.author, author)
+
+    def test_default_ordering_gets_pk_tie_breaker(self):
+        self.assertEqual(
+            KeysetPaginator.get_ordering(Book.objects.all()),
+            ['-date_posted', '-pk'])
+
+    def test_deep_page_costs_one_query(self):
+        paginator = KeysetPaginator(Book.objects.all(), 2)
+        pages = self.walk_forward(paginator)
+
+        with self.assertNumQueries(1):
+            paginator.page(pages[-2].next_cursor)
+
+    def test_changed_cursor_is_invalid(self):
+        paginator = KeysetPaginator(Book.objects.order_by('title'), 2)
+        cursor = paginator.page().next_cursor
+
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+        # cursor of another sort order.
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(Book.objects.order_by('language'), 2).page(cursor)
+
+
+@override_settings(BOOK_LIST_PAGINATION='keyset')
+class TestKeysetPaginationView(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = create_user()
+        author = create_author()
+        for index in range(5):
+            create_book(author, user, f'Title {index}')
+
+    def test_next_link_keeps_order(self):
+        response = self.client.get(
+            reverse('books_library'), {'order_by': 'title'})
+        page = response.context['page_obj']
+
+        self.assertEqual([book.title for book in page], ['Title 0', 'Title 1'])
+        self.assertContains(
+            response, f'order_by=title&amp;cursor={page.next_cursor}')
+
+        response = self.client.get(reverse('books_library'), {
+            'order_by': 'title', 'cursor': page.next_cursor})
+        self.assertEqual(
+            [book.title for book in response.context['books']], ['Title 2', 'Title 3'])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(reverse('books_library'), {'page_size': 3})
+        self.assertEqual(len(response.context['books']), 3)
+
+        response = self.client.get(reverse('books_library'), {'page_size': 1000})
+        self.assertEqual(len(response.context['books']), 5)
+        self.assertEqual(response.context['view'].get_paginate_by(None), 50)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse('books_library'), {'cursor': 'abc'})
+
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(BOOK_LIST_PAGINATION='offset')
+    def test_offset_mode_uses_page_numbers(self):
+        response = self.client.get(reverse('books_library'), {'page': 3})
+
+        self.assertEqual(response.context['page_obj'].number, 3)
+        self.assertEqual(len(response.context['books']), 1)
+
+
+class TestListCounts(TestCase):
+    """
+        Headers of book lists read BookCounter.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.authors = [create_author(f'First{index}', f'Last{index}') for index in range(2)]
+        cls.books = [
+            create_book(cls.authors[index % 2], cls.user, f'Title {index}',
+                        genre=['COMEDY', 'HISTORY'][index % 2])
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        self.client.login(username='testuser', password='12345')
+
+    def test_headers_show_counts(self):
+        for url, count in (
+            (reverse('books_library'), 3),
+            (reverse('genre_books', kwargs={'genre': 'HISTORY'}), 1),
+            (reverse('profile_books', kwargs={'profile': 'testuser'}), 3),
+            (reverse('my_books'), 3),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.context['books_count'], ListCount(count))
+                self.assertContains(response, f'({count})')
+
+    def test_large_list_shows_estimate(self):
+        count = estimated_count(Book.objects.filter(genre='COMEDY'), threshold=1)
+
+        self.assertTrue(count.is_estimate)
+        self.assertGreaterEqual(count.value, 2)
+        self.assertTrue(str(count).startswith('~'))
+
+    def test_estimate_format(self):
+        self.assertEqual(str(ListCount(1_234_567, is_estimate=True)), '~1.2M')
+        self.assertEqual(str(ListCount(12_000, is_estimate=True)), '~12K')
+        self.assertEqual(str(ListCount(1_234_567)), '1234567')
+
+
+class TestSearchBookListView(TestCase):
+    """
+        search_vector is written by a PostgreSQL trigger(migration 0023_book_search_vector).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = create_user()
+        cls.author = create_author('Jose', 'Saramago')
+        other_author = create_author()
+        books = (
+            ('Blindness', cls.author, 'CLASSIC', 'A city goes blind.'),
+            ('Cooking', other_author, 'OTHER', 'Recipes for a blind tasting.'),
+            ('Kitchen Nightmares', other_author, 'COMEDY', 'Restaurants.'),
+        )
+        cls.books = {}
+        for title, author, genre, description in books:
+            cls.books[title] = create_book(
+                author, user, title, language='English', genre=genre, description=description)
+
+    def search(self, **params):
+        response = self.client.get(reverse('books_search'), params)
+        return [book.title for book in response.context['books']]
+
+    def test_title_match_ranks_before_description_match(self):
+        self.assertEqual(self.search(q='blind'), ['Blindness', 'Cooking'])
+
+    def test_search_by_author_name(self):
+        self.assertEqual(self.search(q='saramago'), ['Blindness'])
+
+    def test_renamed_author_is_found_by_new_name(self):
+        self.author.last_name = 'Silva'
+        self.author.save()
+
+        self.assertEqual(self.search(q='saramago'), [])
+        self.assertEqual(self.search(q='silva'), ['Blindness'])
+
+    def test_changed_title_is_found(self):
+        book = Book.objects.get(pk=self.books['Kitchen Nightmares'].pk)
+        book.title = 'Hell Kitchen'
+        book.save()
+
+        self.assertEqual(self.search(q='hell'), ['Hell Kitchen'])
+
+    def test_search_vector_is_not_loaded(self):
+        book = Book.objects.get(pk=self.books['Blindness'].pk)
+        related = self.author.book_set.get()
+
+        self.assertIn('search_vector', book.get_deferred_fields())
+        self.assertIn('search_vector', related.get_deferred_fields())
+
+    def test_search_in_genre(self):
+        self.assertEqual(self.search(q='blind', genre='OTHER'), ['Cooking'])
+
+    def test_search_with_order(self):
+        self.assertEqual(
+            self.search(q='blind', order_by='-date_posted'), ['Cooking', 'Blindness'])
+
+    def test_ranked_results_are_paginated_with_cursor(self):
+        response = self.client.get(
+            reverse('books_search'), {'q': 'blind', 'page_size': 1})
+        page = response.context['page_obj']
+        self.assertContains(response, f'q=blind&amp;page_size=1&amp;cursor={page.next_cursor}')
+
+        self.assertEqual(
+            self.search(q='blind', page_size=1, cursor=page.next_cursor), ['Cooking'])
+
+    def test_empty_search_finds_nothing(self):
+        response = self.client.get(reverse('books_search'), {'q': ''})
+
+        self.assertContains(response, 'No Books Found !')
+
+
+class TestCounterColumns(TestCase):
+    """
+        likes_count, favourites_count and comments_count changed by the views.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.other_user = create_user('otheruser')
+        cls.book = create_book(create_author(), cls.user)
+
+    def setUp(self):
+        self.client.login(username='testuser', password='12345')
+
+    def counters(self):
+        return Book.objects.values_list(*Book.COUNTER_FIELDS).get(pk=self.book.pk)
+
+    def test_like_and_unlike(self):
+        url = reverse('profile_like_book', kwargs={'pk': self.book.pk})
+
+        self.client.post(url, {'liked': 'true'})
+        self.assertEqual(self.counters(), (1, 0, 0))
+        self.assertTrue(self.user.profile.likes.filter(pk=self.book.pk).exists())
+        self.client.post(url, {'liked': 'false'})
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_save_and_unsave(self):
+        url = reverse('profile_save_book', kwargs={'pk': self.book.pk})
+
+        self.client.post(url, {'saved': 'true'})
+        self.assertEqual(self.counters(), (0, 1, 0))
+        self.client.post(url, {'saved': 'false'})
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_repeated_like_is_counted_once(self):
+        url = reverse('profile_like_book', kwargs={'pk': self.book.pk})
+
+        # one statement - session, user with profile and groups, like with counter.
+        with self.assertNumQueries(3):
+            response = self.client.post(url, {'liked': 'true'}, HTTP_ACCEPT='application/json')
+        second = self.client.post(url, {'liked': 'true'}, HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.json(), {'liked': True, 'count': 1})
+        self.assertEqual(second.json(), {'liked': True, 'count': 1})
+        self.assertEqual(self.counters(), (1, 0, 0))
+        self.assertTrue(Book.objects.get(pk=self.book.pk).neighbours_stale)
+
+    def test_repeated_save_is_stored_once(self):
+        url = reverse('profile_save_book', kwargs={'pk': self.book.pk})
+
+        for _ in range(2):
+            response = self.client.post(url, {'saved': 'true'}, HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.json(), {'saved': True, 'count': 1})
+        self.assertEqual(ProfileFavouriteBooks.objects.filter(book=self.book).count(), 1)
+
+    def test_favourites_listed_last_saved_first(self):
+        older = Book.objects.create(
+            title='Older', author=self.book.author, language='Bulgarian', genre='COMEDY',
+            description='Description', date_posted=timezone.now(), posted_by=self.user)
+        now = timezone.now()
+        ProfileFavouriteBooks.objects.create(
+            user_id=self.user.pk, book=self.book, created_at=now - timedelta(days=1))
+        ProfileFavouriteBooks.objects.create(
+            user_id=self.user.pk, book=older, created_at=now)
+
+        response = self.client.get(reverse('profile_favourites'))
+
+        self.assertEqual([book.pk for book in response.context['books']], [older.pk, self.book.pk])
+
+    def test_favourite_str_does_not_query(self):
+        ProfileFavouriteBooks.objects.create(user_id=self.user.pk, book=self.book)
+        favourite = ProfileFavouriteBooks.objects.get()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(str(favourite), f'{self.user.pk} Profile | {self.book.pk} Book')
+
+    def test_toggle_without_javascript_redirects_to_book(self):
+        response = self.client.post(
+            reverse('profile_save_book', kwargs={'pk': self.book.pk}), {'saved': 'true'})
+
+        self.assertRedirects(response, self.book.get_absolute_url())
+
+    def test_toggle_requires_post_and_state(self):
+        url = reverse('profile_like_book', kwargs={'pk': self.book.pk})
+
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.post(
+            reverse('profile_like_book', kwargs={'pk': self.book.pk + 100}),
+            {'liked': 'true'}).status_code, 404)
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_comment_and_delete_comment(self):
+        self.client.post(self.book.get_absolute_url(), {'content': 'Nice book'})
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+        comment = Comment.objects.get()
+        # deleted by an admin(check is_user_admin_or_comment_owner).
+        User.objects.filter(pk=self.user.pk).update(is_superuser=True)
+        self.client.post(reverse('books_comment_delete', kwargs={
+            'pk': self.book.pk, 'slug': self.book.slug, 'id': comment.pk}))
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_details_read_likes_column(self):
+        self.user.profile.likes.add(self.book)
+
+        response = self.client.get(self.book.get_absolute_url())
+
+        self.assertEqual(response.context['number_of_likes'], 1)
+
+
+class TestLeaderboard(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        author = create_author()
+        profiles = [cls.user.profile] + [create_user(f'user{index}').profile for index in range(3)]
+        # (title, genre, likes)
+        for title, genre, likes in (('A', 'ART', 1), ('B', 'ART', 3), ('C', 'COMEDY', 2),
+                                    ('D', 'COMEDY', 4), ('E', 'COMEDY', 0)):
+            book = create_book(author, cls.user, title, genre=genre)
+            book.likes.add(*profiles[:likes])
+
+    def setUp(self):
+        self.client.login(username='testuser', password='12345')
+
+    def leaderboard(self, **params):
+        response = self.client.get(reverse('recommended_books'), params)
+        return [(book.title, book.likes_count) for book in response.context['books']]
+
+    def test_top_three(self):
+        self.assertEqual(self.leaderboard(), [('D', 4), ('B', 3), ('C', 2)])
+
+    def test_top_n_skips_books_without_likes(self):
+        self.assertEqual(
+            self.leaderboard(top=10), [('D', 4), ('B', 3), ('C', 2), ('A', 1)])
+
+    def test_genre_leaderboard(self):
+        self.assertEqual(self.leaderboard(genre='ART'), [('B', 3), ('A', 1)])
+
+    def test_unknown_genre_shows_all_books(self):
+        self.assertEqual(self.leaderboard(genre='NOPE', top=1), [('D', 4)])
+
+    def test_unlike_moves_book_down(self):
+        book = Book.objects.get(title='D')
+        book.likes.clear()
+
+        self.assertEqual(self.leaderboard(), [('B', 3), ('C', 2), ('A', 1)])
+
+
+class TestRecommendations(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        author = create_author()
+        cls.books = {title: create_book(author, cls.user, title, genre='ART') for title in 'ABCDE'}
+        cls.profiles = [create_user(f'user{index}').profile for index in range(3)]
+        # user0 and user1 like A and B, user1 also C, user2 - D only.
+        for profile, titles in zip(cls.profiles, ('AB', 'ABC', 'D')):
+            profile.likes.add(*[cls.books[title] for title in titles])
+        cls.user.profile.likes.add(cls.books['A'])
+
+    def setUp(self):
+        self.client.login(username='testuser', password='12345')
+
+    def build(self, *args):
+        out = StringIO()
+        call_command('build_recommendations', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def recommended(self):
+        response = self.client.get(reverse('recommended_books'))
+        return [book.title for book in response.context['recommended_for_you']]
+
+    def test_recommends_similar_books_not_already_liked(self):
+        self.build()
+
+        self.assertEqual(self.recommended(), ['B', 'C'])
+
+    def test_saved_books_are_used_and_left_out(self):
+        ProfileFavouriteBooks.objects.create(user=self.user.profile, book=self.books['B'])
+        self.build()
+
+        self.assertEqual(self.recommended(), ['C'])
+
+
+class TestSimilarBooks(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        author = create_author()
+        cls.books = {
+            title: create_book(
+                author, cls.user, title, language='English', genre=genre, description=description)
+            for title, genre, description in (
+                ('Dune', 'ART', 'Spice and sand worms on a desert planet.'),
+                ('Dune Messiah', 'ART', 'The emperor of the desert planet and the spice.'),
+                ('Kitchen', 'COMEDY', 'Recipes for a busy kitchen.'),
+                ('Pastry', 'COMEDY', 'Recipes for cakes and bread.'),
+            )
+        }
+
+    def build(self, *args):
+        out = StringIO()
+        call_command('build_similar_books', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_details_view_shows_similar_books(self):
+        self.build()
+        book = self.books['Dune']
+
+        response = self.client.get(
+            reverse('books_details', kwargs={'pk': book.pk, 'slug': book.slug}))
+
+        similar_books = [similar.title for similar in response.context['similar_books']]
+        self.assertEqual(similar_books[0], 'Dune Messiah')
+        self.assertContains(response, 'Similar books')
+
+
+class TestCommentPages(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.book = create_book(create_author(), cls.user)
+        now = timezone.now()
+        # two comments at the same time, the id breaks the tie.
+        cls.comments = Comment.objects.bulk_create(
+            Comment(book=cls.book, posted_by=cls.user, content=f'Comment {index}',
+                    date_posted=now - timedelta(minutes=index // 2))
+            for index in range(25))
+        cls.details_url = reverse(
+            'books_details', kwargs={'pk': cls.book.pk, 'slug': cls.book.slug})
+        cls.comments_url = reverse(
+            'books_comments', kwargs={'pk': cls.book.pk, 'slug': cls.book.slug})
+
+    def expected_order(self):
+        return list(self.book.comment_set.order_by('-date_posted', '-id')
+                    .values_list('content', flat=True))
+
+    def test_details_renders_first_page(self):
+        response = self.client.get(self.details_url)
+
+        page = response.context['comments']
+        self.assertEqual([comment.content for comment in page], self.expected_order()[:10])
+        self.assertTrue(page.has_next())
+        self.assertContains(response, 'id="more-comments"')
+
+    def test_next_pages_as_json_fragments(self):
+        page = self.client.get(self.details_url).context['comments']
+        contents = [comment.content for comment in page]
+        cursor = page.next_cursor
+
+        while cursor:
+            response = self.client.get(self.comments_url, {'cursor': cursor})
+            self.assertEqual(response['Content-Type'], 'application/json')
+            data = response.json()
+            contents += [comment.content for comment in response.context['comments']]
+            self.assertIn('class="comment', data['html'])
+            cursor = data['next_cursor']
+
+        self.assertEqual(contents, self.expected_order())
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(self.comments_url, {'cursor': 'nope'})
+
+        self.assertEqual(response.status_code, 404)
@@ -2,9 +2,9 @@ from django.urls import include, path
 
 from .views import (AuthorBookListView, AuthorView, BookCreateView, BookDeleteView,
                     BookDetailsView, BookListView, BookUpdateView,
-                    CommentDeleteView, FavouritesView, GenreBookListView,
-                    MyBookListView, ProfileBookListView,
-                    RecommendedBookListView)
+                    CommentDeleteView, CommentListView, FavouritesView,
+                    GenreBookListView, MyBookListView, ProfileBookListView,
+                    RecommendedBookListView, SearchBookListView)
 
 urlpatterns = [
     path('library/', BookListView.as_view(), name='books_library'),
@@ -12,6 +12,7 @@ urlpatterns = [
     path('recommended/', RecommendedBookListView.as_view(),
          name='recommended_books'),
     path('favourites/', FavouritesView.as_view(), name='profile_favourites'),
+    path('search/', SearchBookListView.as_view(), name='books_search'),
     path('<str:profile>-books/', ProfileBookListView.as_view(), name='profile_books'),
     path('<int:pk>/<str:author>/books/', AuthorBookListView.as_view(), name='author_books'),
     path('<int:pk>/<str:author>/author/', AuthorView.as_view(), name='author'),
@@ -25,6 +26,7 @@ urlpatterns = [
         path('', BookDetailsView.as_view(), name='books_details'),
         path('update/', BookUpdateView.as_view(), name='books_update'),
         path('delete/', BookDeleteView.as_view(), name='books_delete'),
+        path('comments/', CommentListView.as_view(), name='books_comments'),
         path('comment/<int:id>/update/', BookDetailsView.as_view(),
              name='books_comment_update'),
         path('comment/<int:id>/delete/', CommentDeleteView.as_view(),
@@ -1,22 +1,68 @@
 import ast
 
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth.models import User
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.db.models import Count
+from django.core.paginator import InvalidPage
+from django.db import transaction
+from django.db.models import CharField, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
-                                  UpdateView)
+                                  UpdateView, View)
 from django.views.generic.edit import FormMixin
-from library_project.utils import (delete_profile_or_book_image,
-                                   is_user_admin_or_book_owner,
+from library_project.identity import IdentityMapMixin, request_object
+from library_project.utils import (is_user_admin_or_book_owner,
                                    is_user_admin_or_comment_owner)
-from users.models import ProfileFavouriteBooks
+from users.models import Profile, ProfileFavouriteBooks
 
-from books.forms import BookForm, BookOrderForm, CommentForm, UpdateBookForm
+from books.counts import counter_count, estimated_count
+from books.forms import (BookForm, BookOrderForm, CommentForm, SearchForm,
+                         UpdateBookForm)
+from books.leaderboard import most_liked
+from books.pagination import KeysetPaginator
+from books.recommendations import recommended_books
+from books.search import search_books
 
-from .models import Author, Book, Comment
+from .models import Author, Book, BookCounter, Comment, SimilarBook
+
+
+# Fields shown on book cards(book_list.html, recommended_book_list.html),
+# description and the rest are not loaded.
+# posted_by(id only) - user.book_set sets it on every book, deferred it would be queried.
+# date_posted, language - BookOrderForm choices, the keyset cursor is made of them.
+BOOK_CARD_FIELDS = (
+    'title', 'slug', 'image', 'image_status', 'image_version', 'image_width', 'posted_by',
+    'date_posted', 'language', 'author_name',
+    'author', 'author__first_name', 'author__last_name',
+    *Book.COUNTER_FIELDS,
+)
+
+
+def book_cards_query(query):
+    """
+        Shared by all book list views.
+        Author is joined, so {{ book.author }} doesn't query for every card.
+        https://docs.djangoproject.com/en/4.0/ref/models/querysets/#select-related
+        https://docs.djangoproject.com/en/4.0/ref/models/querysets/#only
+    """
+    return query.select_related('author').only(*BOOK_CARD_FIELDS)
+
+
+def comments_page(book, cursor=None, per_page=10):
+    """
+        Comments of the book, newest first, with their authors and avatars.
+        Keyset page(cursor instead of OFFSET) on comment_book_date_idx,
+        every page is as fast as the first one, however many comments there are.
+    """
+    comments = book.comment_set.select_related('posted_by__profile')
+    return KeysetPaginator(comments, per_page, ordering=['-date_posted']).page(cursor)
 
 
 def return_query_and_order_if_needed(order_by, query):
@@ -38,8 +84,9 @@ class BookListView(FormMixin, ListView):
     template_name = 'books/book_list.html'
     # change object_list variable for template use
     context_object_name = 'books'
-    # pagination
+    # pagination, ?page_size= up to max_paginate_by.
     paginate_by = 2
+    max_paginate_by = 50
 
     def get(self, request, *args, **kwargs):
         form_class = self.get_form_class()
@@ -56,24 +103,75 @@ class BookListView(FormMixin, ListView):
             check CommonFields model Meta class in books/models.py.
             If view has order_by property (in get method *checks if passed form is valid),
             order query. Else return query by default.
+            Subclasses filter the books in get_books_query.
         """
-        # If bug happens, remove super() call and UNcomment the query.
-        query = super().get_queryset()
-        # query = Book.objects.all()
+        query = book_cards_query(self.get_books_query())
 
         return return_query_and_order_if_needed(self.order_by, query)
 
+    def get_books_query(self):
+        # Book.objects.all()
+        return super().get_queryset()
+
+    def get_books_count(self):
+        """
+            Number in the header, check books/counts.py.
+            Views with a BookCounter return the exact count,
+            others count up to a threshold and estimate above it.
+        """
+        return counter_count(BookCounter.SCOPE_ALL)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['books_count'] = self.get_books_count()
+
+        # GET parameters kept by the pagination links(order, page size, search).
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        params.pop('page', None)
+        context['pagination_query'] = f'{params.urlencode()}&' if params else ''
+        return context
+
+    def get_paginate_by(self, queryset):
+        try:
+            page_size = int(self.request.GET.get('page_size', self.paginate_by))
+        except ValueError:
+            page_size = self.paginate_by
+        return max(1, min(page_size, self.max_paginate_by))
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+            BOOK_LIST_PAGINATION = 'keyset' - ?cursor= instead of ?page=,
+            deep pages cost the same as the first one, check books/pagination.py.
+        """
+        if settings.BOOK_LIST_PAGINATION != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
 
 class FavouritesView(LoginRequiredMixin, BookListView):
-    def get_queryset(self):
-        profile = self.request.user.profile
-        # profile.favourites -> ManyRelatedManager
-        saved_books = ProfileFavouriteBooks.objects.filter(
-            user_id=profile.user_id)
-        books_ids = saved_books.values_list('book_id', flat=True)
-        saved_books = Book.objects.filter(pk__in=books_ids)
+    def get_books_query(self):
+        """
+            Saved books joined with ProfileFavouriteBooks, last saved first by default.
+            Keyset pages on (saved_at, book id) read favourite_user_created_idx backwards.
+        """
+        # profile.user_id is the user's id, no need to query the profile.
+        return (
+            Book.objects
+            .filter(profilefavouritebooks__user_id=self.request.user.id)
+            # same join as the filter, one row per saved book.
+            .annotate(saved_at=F('profilefavouritebooks__created_at'))
+            .order_by('-saved_at')
+        )
 
-        return return_query_and_order_if_needed(self.order_by, saved_books)
+    def get_books_count(self):
+        return estimated_count(self.get_books_query())
 
 
 class RecommendedBookListView(LoginRequiredMixin, ListView):
@@ -81,6 +179,31 @@ class RecommendedBookListView(LoginRequiredMixin, ListView):
     template_name = 'books/recommended_book_list.html'
     # change object_list variable for template use
     context_object_name = 'books'
+    # ?top= books, up to max_top, ?genre= leaderboard of one genre.
+    top = 3
+    max_top = 100
+
+    def get_top(self):
+        try:
+            top = int(self.request.GET.get('top', self.top))
+        except ValueError:
+            top = self.top
+        return max(1, min(top, self.max_top))
+
+    def get_genre(self):
+        genre = self.request.GET.get('genre')
+        if genre in [choices[0] for choices in Book.GENRE_CHOICES]:
+            return genre
+        return None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['genre'] = self.get_genre()
+        context['genres'] = Book.GENRE_CHOICES
+        # similar to the user's liked and saved books, 'manage.py build_recommendations'.
+        context['recommended_for_you'] = recommended_books(
+            book_cards_query(Book.objects.all()), self.request.user.pk, self.top)
+        return context
 
     def get_queryset(self):
         """
@@ -116,21 +239,39 @@ class RecommendedBookListView(LoginRequiredMixin, ListView):
         """
 
         # CHECK DOCS in this function!
-        first_three_most_liked_book_ids = Book.likes.through.objects.values_list(
-            'book_id', flat=True).annotate(likes_count=Count('book_id')).order_by('-likes_count', 'book_id__title')[:3]
+        # The grouping above is kept in Book.likes_count(books/signals.py),
+        # the leaderboard is one indexed read, check books/leaderboard.py.
+        return most_liked(
+            book_cards_query(Book.objects.all()), self.get_top(), self.get_genre())
+
+
+class SearchBookListView(BookListView):
+    """
+        Full text search(books/search.py), in all books or in one genre.
+        Best matches first, unless another order is chosen in BookOrderForm.
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.search_form = SearchForm(request.GET)
+        return super().get(request, *args, **kwargs)
 
-        # https://stackoverflow.com/questions/9304908/how-can-i-filter-a-django-query-with-a-list-of-values
-        three_most_liked_books = Book.objects.filter(
-            pk__in=list(first_three_most_liked_book_ids))
+    def get_books_query(self):
+        if not self.search_form.is_valid():
+            return Book.objects.none()
 
-        # https://stackoverflow.com/questions/4916851/django-get-a-queryset-from-array-of-ids-in-specific-order
-        # DB QUERIES OBJECTS AND SAVE IT WHEN FIRST IS READY ! NO ORDER IN DB QUERY
-        three_most_liked_books = dict(
-            [(obj.id, obj) for obj in three_most_liked_books])
-        three_most_liked_books_sorted = [
-            three_most_liked_books[id] for id in first_three_most_liked_book_ids]
+        books = Book.objects.all()
+        genre = self.search_form.cleaned_data['genre']
+        if genre:
+            books = books.filter(genre=genre)
+        return search_books(books, self.search_form.cleaned_data['q'])
 
-        return three_most_liked_books_sorted
+    def get_books_count(self):
+        return estimated_count(self.get_books_query())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['search_form'] = self.search_form
+        return context
 
 
 class GenreBookListView(LoginRequiredMixin, BookListView):
@@ -146,43 +287,50 @@ class GenreBookListView(LoginRequiredMixin, BookListView):
 
         return super().get(request, *args, **kwargs)
 
-    def get_queryset(self):
+    def get_books_query(self):
         genre = self.kwargs.get('genre')
-        genre_books = Book.objects.filter(
-            genre=genre)
 
-        return return_query_and_order_if_needed(self.order_by, genre_books)
+        return Book.objects.filter(genre=genre)
+
+    def get_books_count(self):
+        return counter_count(BookCounter.SCOPE_GENRE, self.kwargs.get('genre'))
 
 
 class AuthorBookListView(BookListView):
-    def get_queryset(self):
+    def get_books_query(self):
         # first_name, last_name = self.kwargs.get('author').split(' ')
         author_id = self.kwargs.get('pk')
         # author = Author.objects.filter(first_name=first_name, last_name=last_name).first()
-        author_books = Book.objects.filter(
-            author_id=author_id)
 
-        return return_query_and_order_if_needed(self.order_by, author_books)
+        return Book.objects.filter(author_id=author_id)
+
+    def get_books_count(self):
+        return counter_count(BookCounter.SCOPE_AUTHOR, self.kwargs.get('pk'))
 
 
 class ProfileBookListView(LoginRequiredMixin, BookListView):
-    def get_queryset(self):
+    def get_books_query(self):
         profile_username = self.kwargs.get('profile')
-        profile_books = Book.objects.filter(
-            posted_by__username=profile_username)
 
-        return return_query_and_order_if_needed(self.order_by, profile_books)
+        return Book.objects.filter(posted_by__username=profile_username)
+
+    def get_books_count(self):
+        # counters are kept by user id, found in the same query.
+        user_id = User.objects.filter(
+            username=self.kwargs.get('profile')).values('pk')
+        return counter_count(
+            BookCounter.SCOPE_USER, Cast(Subquery(user_id), output_field=CharField()))
 
 
 class MyBookListView(LoginRequiredMixin, BookListView):
 
-    def get_queryset(self):
+    def get_books_query(self):
         # foreignkey -> reverse_many_to_one_manager method(all()),
-        user_books = self.request.user.book_set.all()
-        # user_books = Book.objects.filter(
-        # posted_by=self.request.user.pk)
+        # same as Book.objects.filter(posted_by=self.request.user.pk)
+        return self.request.user.book_set.all()
 
-        return return_query_and_order_if_needed(self.order_by, user_books)
+    def get_books_count(self):
+        return counter_count(BookCounter.SCOPE_USER, self.request.user.pk)
 
 
 class BookCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
@@ -203,29 +351,43 @@ class BookCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
         return super().form_valid(form)
 
 
-class BookDetailsView(FormMixin, DetailView):
+# comment and Book.comments_count(books/signals.py) are saved together.
+@method_decorator(transaction.atomic, name='post')
+class BookDetailsView(IdentityMapMixin, FormMixin, DetailView):
     """
         https://stackoverflow.com/questions/45659986/django-implementing-a-form-within-a-generic-detailview
     """
     model = Book
     template_name = 'books/book_details.html'
     form_class = CommentForm
+    similar_books_count = 4
+
+    def get_queryset(self):
+        """
+            Book with its author, poster and the like/save state of the user in one query,
+            number of likes is a counter column(Book.likes_count).
+        """
+        queryset = Book.objects.select_related('author', 'posted_by')
+        user = self.request.user
+        if user.is_authenticated:
+            # profile.user_id is the user's id, no need to query the profile.
+            queryset = queryset.annotate(
+                has_user_liked_book=Exists(Profile.likes.through.objects.filter(
+                    profile_id=user.pk, book_id=OuterRef('pk'))),
+                has_user_saved_book=Exists(ProfileFavouriteBooks.objects.filter(
+                    user_id=user.pk, book_id=OuterRef('pk'))),
+            )
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         book = self.object
-        context["comments"] = book.comment_set.all()
+        # first page, the next ones are loaded on scroll from CommentListView.
+        context["comments"] = comments_page(book)
 
         if self.request.user.is_authenticated:
-            profile = self.request.user.profile
-
-            context["has_user_saved_book"] = ProfileFavouriteBooks.objects.filter(
-                user_id=profile.user_id,
-                book_id=book.id
-            ).exists()
-
-            context["has_user_liked_book"] = profile.likes.filter(
-                id=book.id).exists()
+            context["has_user_saved_book"] = book.has_user_saved_book
+            context["has_user_liked_book"] = book.has_user_liked_book
 
             # self.form_invalid(form) *in post method* returns
             # self.render_to_response(self.get_context_data(form=form))
@@ -240,10 +402,17 @@ class BookDetailsView(FormMixin, DetailView):
             # if clicked to update, comment id should be in kwargs,
             # so we fill the form with given comment.
             if self.request.method == 'GET' and 'id' in self.kwargs:
-                comment = get_object_or_404(Comment, pk=self.kwargs.get('id'))
+                comment = request_object(self.request, Comment, self.kwargs.get('id'))
                 context['form'] = CommentForm(instance=comment)
 
-        context["number_of_likes"] = book.likes.count()
+        # counter column, check Book.likes_count.
+        context["number_of_likes"] = book.likes_count
+
+        # precomputed by 'manage.py build_similar_books', one query on unique_similar_book index.
+        context["similar_books"] = book_cards_query(Book.objects.filter(
+            similar_to__book=book,
+            similar_to__source=SimilarBook.SOURCE_CONTENT,
+        )).order_by('-similar_to__score', 'title')[:self.similar_books_count]
 
         return context
 
@@ -254,7 +423,7 @@ class BookDetailsView(FormMixin, DetailView):
         if comment_id:
             # WHEM COMMENT button is clicked and comment already exists(update).
             # https://stackoverflow.com/questions/55729316/create-form-and-update-using-same-view-in-django
-            comment = get_object_or_404(Comment, pk=comment_id)
+            comment = request_object(request, Comment, comment_id)
             form = CommentForm(request.POST, instance=comment)
         else:
             # if comment does not exist , we create it,
@@ -292,20 +461,17 @@ class BookDetailsView(FormMixin, DetailView):
         return redirect(self.object.get_absolute_url())
 
 
-class BookUpdateView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, UpdateView):
+class BookUpdateView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin,
+                     IdentityMapMixin, UpdateView):
     model = Book
     form_class = UpdateBookForm
     success_message = 'Book "%(title)s" was updated successfully!'
 
-    def form_valid(self, form):
-        delete_profile_or_book_image(instance=self.object, form=form)
-        return super().form_valid(form)
-
     def test_func(self):
         return is_user_admin_or_book_owner(self)
 
 
-class BookDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class BookDeleteView(LoginRequiredMixin, UserPassesTestMixin, IdentityMapMixin, DeleteView):
     model = Book
 
     def get_success_url(self):
@@ -316,12 +482,29 @@ class BookDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     def test_func(self):
         return is_user_admin_or_book_owner(self)
 
-    def form_valid(self, form):
-        delete_profile_or_book_image(instance=self.object)
-        return super().form_valid(form)
 
+class CommentListView(View):
+    """
+        Next page of comments for the details page, loaded on scroll.
+        JSON {'html': rendered comments, 'next_cursor': cursor of the page after or null}.
+    """
+
+    template_name = 'books/comment_list.html'
+
+    def get(self, request, *args, **kwargs):
+        book = get_object_or_404(Book.objects.only('slug'), pk=kwargs['pk'])
+        try:
+            page = comments_page(book, request.GET.get('cursor'))
+        except InvalidPage:
+            raise Http404('Invalid cursor.')
 
-class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+        html = render_to_string(
+            self.template_name, {'comments': page, 'object': book}, request=request)
+        return JsonResponse({'html': html, 'next_cursor': page.next_cursor})
+
+
+@method_decorator(transaction.atomic, name='post')
+class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, IdentityMapMixin, DeleteView):
     model = Comment
     # https://stackoverflow.com/questions/50502552/django-deleteview-not-finding-db-object
     pk_url_kwarg = 'id'
@@ -334,9 +517,13 @@ class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     def test_func(self):
         return is_user_admin_or_comment_owner(self)
 
+    def get_queryset(self):
+        # book of the confirmation page in the same query.
+        return super().get_queryset().select_related('book')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['book'] = get_object_or_404(Book, pk=self.kwargs.get('pk'))
+        context['book'] = self.object.book
         return context
 
 
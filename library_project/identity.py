@@ -0,0 +1,88 @@
+import logging
+
+from django.shortcuts import get_object_or_404
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityMap:
+    """
+        Objects loaded during one request, so that views and permission helpers
+        (e.g. test_func and get_object of UpdateView) load every row once.
+        Key is the primary key and the SQL of the queryset, the same row loaded
+        with other fields or annotations is another object.
+        https://martinfowler.com/eaaCatalog/identityMap.html
+    """
+
+    def __init__(self):
+        self.objects = {}
+        # instrumentation, queries run and queries saved.
+        self.loads = 0
+        self.hits = 0
+
+    def key(self, queryset, pk):
+        return (queryset.model, str(pk), str(queryset.query))
+
+    def get(self, queryset, pk):
+        """ Object of queryset with pk, Http404 if there is none. """
+
+        key = self.key(queryset, pk)
+        if key in self.objects:
+            self.hits += 1
+            return self.objects[key]
+
+        self.loads += 1
+        obj = self.objects[key] = get_object_or_404(queryset, pk=pk)
+        return obj
+
+
+def identity_map(request):
+    """ IdentityMap of the request, created on first use. """
+
+    if not hasattr(request, 'identity_map'):
+        request.identity_map = IdentityMap()
+    return request.identity_map
+
+
+def request_object(request, queryset, pk):
+    """ get_object_or_404(queryset, pk=pk), loaded once per request. """
+
+    if not hasattr(queryset, 'query'):
+        # model
+        queryset = queryset._default_manager.all()
+    return identity_map(request).get(queryset, pk)
+
+
+class IdentityMapMixin:
+    """
+        SingleObjectMixin.get_object through the identity map of the request.
+        Objects looked up by slug are not cached.
+    """
+
+    def get_object(self, queryset=None):
+        pk = self.kwargs.get(self.pk_url_kwarg)
+        if pk is None:
+            return super().get_object(queryset)
+        if queryset is None:
+            queryset = self.get_queryset()
+        return request_object(self.request, queryset, pk)
+
+
+class IdentityMapMiddleware:
+    """
+        Logs how many repeated lookups the identity map saved(logger library_project.identity,
+        DEBUG level), e.g. with LOGGING = {'loggers': {'library_project.identity': {'level': 'DEBUG'}}}.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if hasattr(request, 'identity_map'):
+            logger.debug(
+                '%s %s: %d objects loaded, %d repeated lookups saved.',
+                request.method, request.path,
+                request.identity_map.loads, request.identity_map.hits)
+        return response
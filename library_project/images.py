@@ -0,0 +1,199 @@
+import hashlib
+import os
+import shutil
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from library_project.utils import (copy_file, create_image_variants,
+                                   file_chunks, hashed_name,
+                                   is_image_resizable, original_path)
+
+
+def image_processing_options():
+    """
+        Settings used by process_image.
+        Passed to the worker processes as an argument, they may not have Django configured.
+    """
+
+    return {
+        'size': tuple(settings.IMAGE_SIZE),
+        'widths': list(settings.IMAGE_VARIANT_WIDTHS),
+        'extensions': list(settings.IMAGE_VARIANT_FORMATS),
+        'max_pixels': settings.IMAGE_MAX_PIXELS,
+        'media_root': settings.MEDIA_ROOT,
+        'originals_root': settings.IMAGE_ORIGINALS_ROOT,
+    }
+
+
+def image_processing_version(options):
+    """
+        Short hash of the options which change the output files.
+        Stored with every processed image, so 'manage.py reprocess_images'
+        knows which images are already up to date.
+    """
+
+    output = (options['size'], options['widths'], options['extensions'])
+    return hashlib.sha1(repr(output).encode()).hexdigest()[:12]
+
+
+def process_image(path, options):
+    """
+        Runs in the worker processes, returns the width of the processed image.
+        The upload is kept outside MEDIA_ROOT(check original_path) and the image is always
+        made from it, so processing again with other settings doesn't resize an already
+        resized copy. Images processed before the uploads were kept use the processed file
+        as original.
+    """
+
+    name = os.path.relpath(path, options['media_root'])
+    original = original_path(name, options['originals_root'])
+    if not os.path.exists(original):
+        copy_file(path, original)
+
+    # same extension, Pillow saves in the format of the file name.
+    root, extension = os.path.splitext(path)
+    temporary_path = f'{root}.{os.getpid()}.tmp{extension}'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        shutil.copyfile(original, temporary_path)
+        is_image_resizable(temporary_path, options['max_pixels'], options['size'])
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return create_image_variants(path, options['widths'], options['extensions'])
+
+
+def reprocess_image(item):
+    """
+        Multiprocessing pool version of process_image, item is (name, path, options).
+        Returns (name, width of the image, None) or (name, None, error message) if it failed.
+    """
+
+    name, path, options = item
+    try:
+        return name, process_image(path, options), None
+    except Exception as error:
+        return name, None, str(error) or error.__class__.__name__
+
+
+def import_image(item):
+    """
+        Multiprocessing pool version for imports('manage.py import_books'),
+        item is (source path, media root, directory, options).
+        Copies the file under a hashed name(check HashedUploadTo) as the original
+        and processes it into media root. Same file imported again gets the same name.
+        Returns (name of the stored file, its width, None)
+        or (None, None, error message) if it could not be read or processed.
+    """
+
+    source, media_root, directory, options = item
+    try:
+        name = hashed_name(directory, os.path.basename(source), file_chunks(source))
+        path = os.path.join(media_root, name)
+        copy_file(source, original_path(name, options['originals_root']))
+        return name, process_image(path, options), None
+    except Exception as error:
+        return None, None, str(error) or error.__class__.__name__
+
+
+def claim_pending_images(model, limit):
+    """
+        Take up to 'limit' pending images of given model and mark them as processing.
+        skip_locked lets several workers run at the same time without taking the same rows.
+        https://docs.djangoproject.com/en/4.0/ref/models/querysets/#select-for-update
+    """
+
+    with transaction.atomic():
+        pks = list(
+            model.objects
+            .select_for_update(skip_locked=True)
+            .filter(image_status=model.IMAGE_STATUS_PENDING)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        model.objects.filter(pk__in=pks).update(
+            image_status=model.IMAGE_STATUS_PROCESSING)
+
+    # only fields needed to find the file on disk.
+    return list(model.objects.filter(pk__in=pks).only('pk', 'image'))
+
+
+def process_pending_images(model, executor, batch_size):
+    """
+        Resize one batch of pending images and create their variants
+        in the executor's processes.
+        Statuses are written with update(), so save() does not queue them again.
+        Returns the number of processed images.
+    """
+
+    options = image_processing_options()
+    instances = claim_pending_images(model, batch_size)
+    futures = {
+        (instance.pk, instance.image.name): executor.submit(
+            process_image, instance.image.path, options)
+        for instance in instances
+    }
+
+    ready, failed = [], []
+    for (pk, name), future in futures.items():
+        if future.exception() is None:
+            ready.append((pk, name, future.result()))
+        else:
+            failed.append((pk, name))
+
+    save_processing_results(model, ready, failed, options)
+
+    return len(instances)
+
+
+def claimed_images(model, claimed, status):
+    """
+        Rows of claimed (pk, image name) pairs which still have given status and image.
+        A row whose image was replaced meanwhile is PENDING again with another name,
+        it's left for the next run instead of being marked with the old image's result.
+    """
+
+    condition = Q(pk__in=[])
+    for pk, name in claimed:
+        condition |= Q(pk=pk, image=name)
+    return model.objects.filter(condition, image_status=status)
+
+
+def save_ready_images(model, ready, status, options):
+    """
+        Mark claimed images with given status as processed, ready are (pk, image name, width).
+        One UPDATE per width, all images of IMAGE_SIZE have the same one.
+    """
+
+    by_width = defaultdict(list)
+    for pk, name, width in ready:
+        by_width[width].append((pk, name))
+
+    version = image_processing_version(options)
+    for width, claimed in by_width.items():
+        claimed_images(model, claimed, status).update(
+            image_status=model.IMAGE_STATUS_READY, image_version=version, image_width=width)
+
+
+def save_processing_results(model, ready, failed, options):
+    """
+        UPDATE queries for the whole batch,
+        ready are (pk, image name, width), failed are (pk, image name).
+    """
+
+    save_ready_images(model, ready, model.IMAGE_STATUS_PROCESSING, options)
+    claimed_images(model, failed, model.IMAGE_STATUS_PROCESSING).update(
+        image_status=model.IMAGE_STATUS_FAILED)
+
+
+def requeue_images(model):
+    """ Put failed and interrupted images back in the queue. """
+
+    return model.objects.filter(
+        image_status__in=[model.IMAGE_STATUS_PROCESSING,
+                          model.IMAGE_STATUS_FAILED]
+    ).update(image_status=model.IMAGE_STATUS_PENDING)
@@ -61,6 +61,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'library_project.identity.IdentityMapMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -145,9 +146,50 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # /media/books_pics/image_name.jpg
 MEDIA_URL = 'media/'
 
+# How uploaded files are sent by website.views.serve_media.
+# None - Django streams the file(development),
+# 'x-accel-redirect' - nginx, MEDIA_SENDFILE_PREFIX is an internal location pointing at MEDIA_ROOT,
+# 'x-sendfile' - apache mod_xsendfile, XSendFilePath limited to MEDIA_ROOT.
+# The front server must not send */originals/*(check README), serve_media refuses them.
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default=None)
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+# Cache time(seconds) of files without hash in the name, e.g. default images.
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
+# Uploads as they were before processing, images are processed again from them
+# ('manage.py reprocess_images'). They keep their EXIF(camera, GPS position),
+# so they must not be under MEDIA_ROOT or any other public directory.
+IMAGE_ORIGINALS_ROOT = config('IMAGE_ORIGINALS_ROOT', default=os.path.join(BASE_DIR, 'originals'))
+
+# Uploaded images are resized to this size(width, height) in px.
+IMAGE_SIZE = (368, 500)
+
+# Uploads with more pixels are rejected before decoding, 24 MP ~ 6000x4000 px.
+IMAGE_MAX_PIXELS = 24_000_000
+
+# Resized copies of uploaded images, created by 'manage.py process_images'.
+# Widths in px - 40 for comment/nav avatars, 368 for book details.
+IMAGE_VARIANT_WIDTHS = [40, 80, 184, 368]
+# Extensions of the formats, add 'avif' if installed Pillow can write it.
+IMAGE_VARIANT_FORMATS = ['webp']
+
+# Pagination of book lists, 'keyset'(?cursor=, no OFFSET) or 'offset'(?page=, numbered pages).
+BOOK_LIST_PAGINATION = 'keyset'
+
+# Book lists without a BookCounter count up to this many books exactly,
+# above it the header shows the PostgreSQL planner estimate, e.g. '~1.2M'.
+BOOK_COUNT_ESTIMATE_THRESHOLD = 10_000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
+# user, profile and group names in one query per request.
+# ModelBackend keeps sessions created before it was added valid.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.UserContextBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # redirect_authenticated_user
 LOGIN_REDIRECT_URL = 'website_home'
 
@@ -0,0 +1,286 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest.mock import Mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from library_project.images import (image_processing_options,
+                                    image_processing_version,
+                                    process_pending_images)
+from library_project.utils import original_path, variant_name
+from PIL import Image
+from users.forms import ProfileUpdateForm
+from users.models import Profile
+
+MEDIA_ROOT = tempfile.mkdtemp()
+ORIGINALS_ROOT = tempfile.mkdtemp()
+
+
+def create_uploaded_image(name='test.jpg', size=(800, 600)):
+    """ In-memory JPEG, as if sent by the user. """
+
+    content = BytesIO()
+    Image.new('RGB', size, 'white').save(content, 'JPEG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_ORIGINALS_ROOT=ORIGINALS_ROOT)
+class TestProfileImageProcessing(TestCase):
+    """
+        Images are resized by 'manage.py process_images', not in save().
+        ThreadPoolExecutor is used instead of the command's process pool,
+        so that tests don't spawn processes.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(ORIGINALS_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='12345')
+        self.profile = self.user.profile
+
+    def test_default_image_is_ready(self):
+        self.assertEqual(self.profile.image_status, Profile.IMAGE_STATUS_READY)
+        self.assertEqual(self.profile.image_url, '/media/default_user.jpg')
+
+    def test_uploaded_image_is_pending_until_processed(self):
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+
+        self.assertEqual(self.profile.image_status,
+                         Profile.IMAGE_STATUS_PENDING)
+        # placeholder until the worker resizes the image.
+        self.assertEqual(self.profile.image_url, '/media/default_user.jpg')
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            processed = process_pending_images(Profile, executor, 10)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(processed, 1)
+        self.assertEqual(self.profile.image_status, Profile.IMAGE_STATUS_READY)
+        self.assertEqual(
+            self.profile.image_url,
+            f'{self.profile.image.url}?v={self.profile.image_version}')
+        with Image.open(self.profile.image.path) as img:
+            self.assertEqual(img.size, (368, 500))
+
+    def test_broken_image_is_marked_failed(self):
+        self.profile.image = SimpleUploadedFile('broken.jpg', b'not an image')
+        self.profile.save()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.image_status,
+                         Profile.IMAGE_STATUS_FAILED)
+
+    def test_image_replaced_while_processing_stays_pending(self):
+        """ Worker saves results of the image it claimed, not of the new upload. """
+        self.profile.image = create_uploaded_image('first.jpg')
+        self.profile.save()
+
+        def replace_image(path, options):
+            profile = Profile.objects.get(pk=self.profile.pk)
+            profile.image = create_uploaded_image('second.jpg')
+            profile.save()
+
+        # runs in the test's transaction, threads have their own connection.
+        executor = Mock(submit=lambda function, *args: completed_future(replace_image(*args)))
+        process_pending_images(Profile, executor, 10)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.image_status, Profile.IMAGE_STATUS_PENDING)
+        self.assertTrue(self.profile.image.name.startswith('profile_pics/second.'))
+
+    @override_settings(IMAGE_VARIANT_WIDTHS=[40, 80], IMAGE_VARIANT_FORMATS=['webp'])
+    def test_processing_creates_variants_for_srcset(self):
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+        self.profile.refresh_from_db()
+
+        small_variant = variant_name(self.profile.image.path, 40, 'webp')
+        with Image.open(small_variant) as img:
+            self.assertEqual(img.format, 'WEBP')
+            self.assertEqual(img.width, 40)
+
+        html = Template(
+            '{% load image_tags %}{% responsive_image profile sizes="40px" %}'
+        ).render(Context({'profile': self.profile}))
+        self.assertIn('type="image/webp"', html)
+        variant_url = self.profile.image.storage.url(
+            variant_name(self.profile.image.name, 80, 'webp'))
+        self.assertIn(
+            f'{variant_url}?v={self.profile.image_version} 80w', html)
+
+    @override_settings(IMAGE_VARIANT_WIDTHS=[40, 368], IMAGE_VARIANT_FORMATS=['webp'])
+    def test_narrow_image_is_not_upscaled(self):
+        # height is already 500, the image keeps its width.
+        self.profile.image = create_uploaded_image(size=(200, 500))
+        self.profile.save()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+        self.profile.refresh_from_db()
+
+        self.assertEqual(self.profile.image_width, 200)
+        self.assertFalse(os.path.exists(variant_name(self.profile.image.path, 368, 'webp')))
+        html = Template(
+            '{% load image_tags %}{% responsive_image profile sizes="40px" %}'
+        ).render(Context({'profile': self.profile}))
+        self.assertIn('40w', html)
+        self.assertNotIn('368w', html)
+
+    def test_image_processed_before_variants_has_no_srcset(self):
+        """ Rows READY by default(before variants existed) have no image_version. """
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+        Profile.objects.filter(pk=self.profile.pk).update(
+            image_status=Profile.IMAGE_STATUS_READY, image_version='', image_width=0)
+        self.profile.refresh_from_db()
+
+        html = Template(
+            '{% load image_tags %}{% responsive_image profile sizes="40px" %}'
+        ).render(Context({'profile': self.profile}))
+
+        self.assertNotIn('<source', html)
+        self.assertIn(f'src="{self.profile.image.url}"', html)
+
+    def test_default_image_has_no_srcset(self):
+        html = Template(
+            '{% load image_tags %}{% responsive_image profile sizes="40px" %}'
+        ).render(Context({'profile': self.profile}))
+
+        self.assertNotIn('<source', html)
+        self.assertIn('src="/media/default_user.jpg"', html)
+
+    def test_unchanged_image_is_not_queued_again(self):
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+        Profile.objects.filter(pk=self.profile.pk).update(
+            image_status=Profile.IMAGE_STATUS_READY)
+
+        profile = Profile.objects.get(pk=self.profile.pk)
+        profile.save()
+
+        self.assertEqual(profile.image_status, Profile.IMAGE_STATUS_READY)
+
+    def test_upload_is_kept_outside_media_root(self):
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+
+        self.assertTrue(os.path.isfile(original_path(self.profile.image.name, ORIGINALS_ROOT)))
+        media_files = [os.path.relpath(os.path.join(directory, name), MEDIA_ROOT)
+                       for directory, _, names in os.walk(MEDIA_ROOT) for name in names]
+        self.assertFalse([name for name in media_files if 'originals' in name.split(os.sep)])
+
+    def test_reprocess_images_skips_up_to_date_images(self):
+        """
+            Image processed with old settings has another version.
+            Second run finds nothing to do.
+        """
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+        Profile.objects.filter(pk=self.profile.pk).update(
+            image_status=Profile.IMAGE_STATUS_READY, image_version='old')
+
+        output = StringIO()
+        call_command('reprocess_images', model=['profile'], workers=1, stdout=output)
+        self.profile.refresh_from_db()
+
+        self.assertIn('Profile: 1 images to reprocess.', output.getvalue())
+        self.assertEqual(self.profile.image_version,
+                         image_processing_version(image_processing_options()))
+
+        output = StringIO()
+        call_command('reprocess_images', model=['profile'], workers=1, stdout=output)
+        self.assertIn('Profile: 0 images to reprocess.', output.getvalue())
+
+    @override_settings(IMAGE_SIZE=(184, 250))
+    def test_reprocess_images_starts_from_the_upload(self):
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+        self.profile.refresh_from_db()
+        # the processed copy is lossy, the upload is kept as it was.
+        Image.new('RGB', (184, 250), 'black').save(self.profile.image.path)
+        with Image.open(original_path(self.profile.image.name, ORIGINALS_ROOT)) as img:
+            self.assertEqual(img.size, (800, 600))
+
+        with override_settings(IMAGE_SIZE=(368, 500)):
+            call_command('reprocess_images', model=['profile'], workers=1, stdout=StringIO())
+
+        with Image.open(self.profile.image.path) as img:
+            self.assertEqual(img.size, (368, 500))
+            self.assertEqual(img.convert('RGB').getpixel((0, 0)), (255, 255, 255))
+
+    def test_reprocess_failure_keeps_processed_image(self):
+        self.profile.image = create_uploaded_image()
+        self.profile.save()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+        Profile.objects.filter(pk=self.profile.pk).update(image_version='old')
+        with open(original_path(self.profile.image.name, ORIGINALS_ROOT), 'wb') as original:
+            original.write(b'not an image')
+
+        errors = StringIO()
+        call_command('reprocess_images', model=['profile'], workers=1,
+                     stdout=StringIO(), stderr=errors)
+        self.profile.refresh_from_db()
+
+        self.assertEqual(self.profile.image_status, Profile.IMAGE_STATUS_READY)
+        self.assertEqual(self.profile.image_version, 'old')
+        self.assertIn(f'Profile {self.profile.pk} {self.profile.image.name}:', errors.getvalue())
+
+
+def completed_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class TestImageUploadMixin(TestCase):
+    """
+        Upload checks of ImageUploadMixin, through ProfileUpdateForm.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='12345')
+
+    def test_image_within_limits_is_valid(self):
+        form = ProfileUpdateForm(
+            files={'image': create_uploaded_image(size=(100, 100))},
+            instance=self.user.profile)
+
+        self.assertTrue(form.is_valid())
+
+    @override_settings(IMAGE_MAX_PIXELS=5000)
+    def test_image_with_too_many_pixels_is_rejected(self):
+        form = ProfileUpdateForm(
+            files={'image': create_uploaded_image(size=(100, 100))},
+            instance=self.user.profile)
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('Max image resolution', form.errors['image'][0])
+
+    def test_form_without_new_upload_is_valid(self):
+        form = ProfileUpdateForm(data={}, instance=self.user.profile)
+
+        self.assertTrue(form.is_valid())
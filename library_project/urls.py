@@ -1,7 +1,7 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
+from website.views import serve_media
 
 
 urlpatterns = [
@@ -10,10 +10,11 @@ urlpatterns = [
     path('', include('website.urls'))
 ]
 
-# showing images in browser/development -
+# showing images in browser -
 # https://docs.djangoproject.com/en/4.0/howto/static-files/#serving-files-uploaded-by-a-user-during-development
 # https://youtu.be/FdVuKt_iuSI?list=PL-osiE80TeTtoQCKZ03TU5fNfx2UY6U4p&t=1248
-# add only in dev, check docs for production mode
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
+# in production serve_media hands the file to the front server, check MEDIA_SENDFILE.
+# settings.MEDIA_URL is returned with leading slash - '/media/'
+urlpatterns += [
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name='media'),
+]
@@ -1,25 +1,200 @@
+import glob
+import hashlib
 import os
+import re
+import shutil
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.deconstruct import deconstructible
 from PIL import Image
 
+DEFAULT_IMAGES = ('default_user.jpg', 'default_book.jpg')
+
+# Smaller copies of every processed image live next to it, in this directory.
+VARIANTS_DIRECTORY = 'variants'
+
+# Directory of uploads as they were before processing(settings.IMAGE_ORIGINALS_ROOT),
+# never served from MEDIA_ROOT, check website.views.serve_media.
+ORIGINALS_DIRECTORY = 'originals'
+
+# cover.3f2a9c0d1b7e.jpg, cover.3f2a9c0d1b7e-184w.webp - check HashedUploadTo.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}(-\d+w)?\.\w+$')
+
+
+@deconstructible
+class HashedUploadTo:
+    """
+        upload_to which adds a hash of the content to the file name,
+        cover.jpg -> books_pics/cover.3f2a9c0d1b7e.jpg
+        Same name means same upload, so browsers may cache the file forever(check serve_media).
+        Class instead of function, so that it can be used in migrations.
+        https://docs.djangoproject.com/en/4.0/ref/models/fields/#django.db.models.FileField.upload_to
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, instance, filename):
+        uploaded_file = instance.image
+        name = hashed_name(self.directory, filename, uploaded_file.chunks())
+        uploaded_file.seek(0)
+        return name
+
+    def __eq__(self, other):
+        return isinstance(other, HashedUploadTo) and self.directory == other.directory
+
+
+def hashed_name(directory, filename, chunks):
+    """ directory/stem.<hash of the chunks>.extension, check HashedUploadTo. """
+
+    content_hash = hashlib.sha256()
+    for chunk in chunks:
+        content_hash.update(chunk)
+
+    stem, extension = os.path.splitext(filename)
+    return os.path.join(directory, f'{stem}.{content_hash.hexdigest()[:12]}{extension.lower()}')
+
+
+def file_chunks(path, chunk_size=64 * 1024):
+    with open(path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+def is_hashed_name(name):
+    """ Check if file name contains hash of the content(immutable file). """
 
-def is_image_resizable(path):
-    """ Check if image has large resolution, if so, resize it. """
+    return HASHED_NAME.search(name) is not None
+
+
+def is_image_resizable(path, max_pixels=None, output_size=(368, 500)):
+    """
+        Check if image has large resolution, if so, resize it.
+        Image.open reads only the header, so pixel count is checked before decoding.
+        JPEGs are decoded directly at reduced scale(draft), other formats are
+        reduced in steps(reducing_gap), peak memory doesn't grow with the upload.
+        https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.draft
+    """
 
     with Image.open(path) as img:
-        if img.width != 368 and img.height != 500:
-            output_size = (368, 500)
+        if max_pixels and img.width * img.height > max_pixels:
+            raise ValueError(f'Image has more than {max_pixels} pixels.')
+
+        if img.width != output_size[0] and img.height != output_size[1]:
+            # JPEG only, decode at 1/2, 1/4 or 1/8 scale still larger than output size.
+            img.draft('RGB', output_size)
             # save width-height ratio.
-            img = img.resize(output_size)
+            img = img.resize(output_size, reducing_gap=3.0)
             img.save(path)
 
 
+def variant_name(name, width, extension):
+    """
+        Name(or path) of a resized copy of an image.
+        books_pics/cover.jpg -> books_pics/variants/cover-184w.webp
+    """
+
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, VARIANTS_DIRECTORY, f'{stem}-{width}w.{extension}')
+
+
+def original_path(name, originals_root):
+    """
+        Path of the uploaded file before it was processed.
+        Uploads keep their EXIF(camera, GPS position), so they are stored outside MEDIA_ROOT,
+        in settings.IMAGE_ORIGINALS_ROOT under the name of the processed image.
+        books_pics/cover.jpg -> <originals root>/books_pics/cover.jpg
+    """
+
+    return os.path.join(originals_root, name)
+
+
+def copy_file(source, destination):
+    """ Copied whole or not at all, a half copied file is never read. """
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temporary_path = f'{destination}.{os.getpid()}.tmp'
+    shutil.copyfile(source, temporary_path)
+    os.replace(temporary_path, destination)
+
+
+def create_image_variants(path, widths, extensions):
+    """
+        Save a copy of the image for every width in every format(by extension, e.g. 'webp'),
+        so that templates can offer the smallest file that fits (check image_tags.py).
+        Height keeps the width-height ratio of the image.
+        Widths larger than the image are skipped, they would only be upscaled copies.
+        Returns the width of the image.
+    """
+
+    os.makedirs(os.path.join(os.path.dirname(path), VARIANTS_DIRECTORY), exist_ok=True)
+    # '.webp' -> 'WEBP', formats which Pillow can write.
+    formats = Image.registered_extensions()
+
+    with Image.open(path) as img:
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        for width in widths:
+            if width > img.width:
+                continue
+            height = round(img.height * width / img.width)
+            variant = img.resize((width, height))
+            for extension in extensions:
+                # written whole or not at all, several workers may process the same file.
+                variant_path = variant_name(path, width, extension)
+                temporary_path = f'{variant_path}.{os.getpid()}.tmp'
+                try:
+                    variant.save(temporary_path, formats[f'.{extension}'], quality=80)
+                    os.replace(temporary_path, variant_path)
+                finally:
+                    if os.path.exists(temporary_path):
+                        os.remove(temporary_path)
+        return img.width
+
+
+def delete_image_variants(path):
+    """ Remove all resized copies of an image. """
+
+    for variant_path in glob.glob(variant_name(glob.escape(path), '*', '*')):
+        os.remove(variant_path)
+
+
+def is_default_image(image):
+    """ Check if image(or image name) is one of the shared default images. """
+
+    return getattr(image, 'name', image) in DEFAULT_IMAGES
+
+
+def user_group_names(user):
+    """
+        Names of the user's groups, queried once per request.
+        Users loaded by users.backends.UserContextBackend have them already.
+    """
+
+    if not hasattr(user, '_group_names'):
+        user._group_names = set(user.groups.values_list('name', flat=True))
+    return user._group_names
+
+
+def user_has_group(user, *group_names):
+    """ Check if user has at least one of the given groups. """
+
+    return not user_group_names(user).isdisjoint(group_names)
+
+
 def is_user_admin_or_book_owner(view):
-    """ Check if user is admin or owner of current book. """
+    """
+        Check if user is admin or owner of current book.
+        view.get_object() of IdentityMapMixin views is loaded once, the view reuses it.
+    """
 
     book = view.get_object()
     current_user = view.request.user
 
-    return current_user == book.posted_by or current_user.is_superuser or current_user.groups.filter(name='full-CRUD').exists()
+    return current_user == book.posted_by or current_user.is_superuser or user_has_group(current_user, 'full-CRUD')
 
 
 def is_user_admin_or_profile_owner(view):
@@ -32,7 +207,7 @@ def is_user_admin_or_profile_owner(view):
     #     # ONLY superuser can delete and modify his acc
     #     return False
 
-    return current_user == user or current_user.is_superuser or current_user.groups.filter(name='full-CRUD').exists()
+    return current_user == user or current_user.is_superuser or user_has_group(current_user, 'full-CRUD')
 
 
 def is_user_admin_or_comment_owner(view):
@@ -40,29 +215,49 @@ def is_user_admin_or_comment_owner(view):
     user = view.get_object()
     current_user = view.request.user
 
-    return current_user == user or current_user.is_superuser or current_user.groups.filter(name__in=['limited-CRUD', 'full-CRUD']).exists()
+    return current_user == user or current_user.is_superuser or user_has_group(current_user, 'limited-CRUD', 'full-CRUD')
+
+
+def megabytes_to_bytes(value):
+    return value * 1024 * 1024
+
+
+def validate_max_size_in_MB(max_size, value):
+    filesize = value.size
+    if filesize > megabytes_to_bytes(max_size):
+        raise ValidationError(f'Max file size is {max_size:.2f} MB')
 
 
-def delete_profile_or_book_image(instance=None, form=None):
+def validate_image_upload(value, max_size, max_pixels):
     """
-        When updating , instance doesn't have the previous image,
-        so that's why we use form if needed.
-        Check if image is default, so that we dont delete it,
-        Error Handling with if's instead of try/except blocks.
+        Shared by all forms with image upload, called in ImageUploadMixin.clean_image.
+        Only new uploads are checked, not the current or default image.
+        forms.ImageField has already opened the upload, which reads only the header,
+        so dimensions are known without decoding the pixels.
+        https://docs.djangoproject.com/en/4.0/ref/forms/fields/#imagefield
     """
-    if form:
-        image = form.initial.get('image')
-        current_image = instance.image
-        # check if image hasn't been changed, if not do not delete.
-        if image == current_image:
-            return
-    else:
-        image = instance.image
+    if not isinstance(value, UploadedFile):
+        return
 
-    if image.name != 'default_user.jpg' and image.name != 'default_book.jpg':
-        image_path = image.path
-        os.remove(image_path)
+    validate_max_size_in_MB(max_size, value)
 
+    width, height = value.image.size
+    if width * height > max_pixels:
+        raise ValidationError(
+            f'Max image resolution is {max_pixels / 1_000_000:.0f} megapixels.')
 
-def megabytes_to_bytes(value):
-    return value * 1024 * 1024
+
+class ImageUploadMixin:
+    """
+        clean_image of the forms with an image upload(book and profile forms).
+        IMAGE_MAX_SIZE in MB, pixels are limited by settings.IMAGE_MAX_PIXELS.
+    """
+
+    IMAGE_MAX_SIZE = 5
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # func raises exception
+        validate_image_upload(
+            image, self.IMAGE_MAX_SIZE, settings.IMAGE_MAX_PIXELS)
+        return image
@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connections
+from django.db.models import Q, Value
+
+
+class UserContextBackend(ModelBackend):
+    """
+        ModelBackend which loads the user of a request(AuthenticationMiddleware)
+        with the profile(nav image) and the names of the groups(has_group, permission helpers)
+        in one query, instead of a query for each of them.
+        https://docs.djangoproject.com/en/4.0/topics/auth/customizing/#writing-an-authentication-backend
+    """
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        users = UserModel._default_manager.select_related('profile')
+
+        if connections[users.db].vendor == 'postgresql':
+            users = users.annotate(group_names_list=ArrayAgg(
+                'groups__name', filter=Q(groups__isnull=False), default=Value([])))
+
+        try:
+            user = users.get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+
+        if hasattr(user, 'group_names_list'):
+            # read by library_project.utils.user_group_names.
+            user._group_names = set(user.group_names_list)
+        return user if self.user_can_authenticate(user) else None
@@ -1,34 +1,58 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from django.core.exceptions import ValidationError
-from library_project.utils import megabytes_to_bytes
+from django.db.models.functions import Lower
+from library_project.utils import ImageUploadMixin
 
 from .models import Profile
 
 
-def validate_max_size_in_MB(max_size, value):
-    filesize = value.size
-    if filesize > megabytes_to_bytes(max_size):
-        raise ValidationError(f'Max file size is {max_size:.2f} MB')
+def users_with_email(email, exclude_pk=None):
+    """
+        Users with the email in any case, on the unique lower(email) index
+        (migration 0014_user_email_lower_unique),
+        the email <> '' condition lets PostgreSQL use the partial index.
+    """
 
+    users = (
+        User.objects
+        .alias(email_lower=Lower('email'))
+        .filter(email_lower=email.lower())
+        .exclude(email='')
+    )
+    if exclude_pk is not None:
+        users = users.exclude(pk=exclude_pk)
+    return users
+
+
+def email_taken(email, exclude_pk=None):
+    """ Check if another user has the email, one indexed lookup. """
+
+    return users_with_email(email, exclude_pk).exists()
 
-class UserRegisterForm(UserCreationForm):
-    # email here because in AbstractUser, email is not required
-    email = forms.EmailField(
-        help_text="Email must be unique. Include '@' in email address.")
 
-    # def clean_field
+class UniqueEmailMixin:
+    """
+        Email used by no other user.
+        Two requests with the same email may both pass, the index rejects the second one,
+        check save_user_forms in users/views.py.
+    """
+
+    EMAIL_EXISTS = 'Email already exists.'
+
     def clean_email(self):
         # https://youtu.be/wVnQkKf-gHo?t=287
         email = self.cleaned_data.get('email')
-        # flat=True, to return a list, not a list with tuples.
-        database_emails = User.objects.values_list('email', flat=True)
-
-        if email in database_emails:
-            raise forms.ValidationError('Email already exists.')
+        if email_taken(email, exclude_pk=self.instance.pk):
+            raise forms.ValidationError(self.EMAIL_EXISTS)
         return email
 
+
+class UserRegisterForm(UniqueEmailMixin, UserCreationForm):
+    # email here because in AbstractUser, email is not required
+    email = forms.EmailField(
+        help_text="Email must be unique. Include '@' in email address.")
+
     class Meta:
         model = User
         fields = ['username', 'email', 'password1', 'password2']
@@ -46,38 +70,19 @@ class UserRegisterForm(UserCreationForm):
     #         raise forms.ValidationError( "username and password1 cannot be the same." )
 
 
-class UserUpdateForm(forms.ModelForm):
+class UserUpdateForm(UniqueEmailMixin, forms.ModelForm):
     # email here because in AbstractUser, email is not required
 
     email = forms.EmailField(
         help_text="Email must be unique. Include '@' in email address.")
 
-    def clean_email(self):
-        # https://youtu.be/wVnQkKf-gHo?t=287
-        email = self.cleaned_data.get('email')
-        user_current_email = self.instance.email
-        # flat=True, to return a list, not a list with tuples.
-        database_emails = User.objects.values_list('email', flat=True)
-
-        if email != user_current_email and email in database_emails:
-            raise forms.ValidationError('Email already exists.')
-        return email
-
     class Meta:
         model = User
         fields = ['username', 'email', 'first_name', 'last_name']
 
 
-class ProfileUpdateForm(forms.ModelForm):
+class ProfileUpdateForm(ImageUploadMixin, forms.ModelForm):
 
     class Meta:
         model = Profile
         fields = ['image']
-
-    IMAGE_MAX_SIZE = 5
-
-    def clean_image(self):
-        image = self.cleaned_data.get('image')
-        # func raises exception
-        validate_max_size_in_MB(self.IMAGE_MAX_SIZE, image)
-        return image
\ No newline at end of file
@@ -0,0 +1,102 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from users.forms import UserRegisterForm, users_with_email
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+        Time validation of the registration form(email check included)
+        with growing numbers of users, and fail if the email lookup
+        reads the whole users table(Seq Scan) instead of the lower(email) index.
+        Users are seeded in a transaction which is rolled back at the end.
+
+        python manage.py benchmark_registration --users 1000 10000 100000 1000000
+    """
+
+    help = 'Check that registration time does not grow with the number of users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+            help='Numbers of users to measure with.')
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Validations measured for every number of users.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN plans are checked on PostgreSQL only.')
+
+        self.repeat = options['repeat']
+        failed = []
+        try:
+            with transaction.atomic():
+                seeded = 0
+                for users_count in sorted(options['users']):
+                    self.seed(seeded, users_count)
+                    seeded = users_count
+                    failed += self.benchmark(users_count)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failed:
+            raise CommandError(f'Email lookup read the whole table with {", ".join(failed)} users.')
+        self.stdout.write(self.style.SUCCESS('Email lookups use the lower(email) index.'))
+
+    def seed(self, start, end):
+        # unusable password, hashing is not what is measured.
+        User.objects.bulk_create(
+            (User(username=f'benchmark-user-{index}', email=f'Benchmark-{index}@example.com',
+                  password='!')
+             for index in range(start, end)),
+            batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE auth_user')
+
+    def uses_seq_scan(self, plan):
+        if plan['Node Type'] == 'Seq Scan' and plan.get('Relation Name') == User._meta.db_table:
+            return True
+        return any(self.uses_seq_scan(child) for child in plan.get('Plans', []))
+
+    def benchmark(self, users_count):
+        data = {
+            'username': 'benchmark-new-user',
+            # taken in another case, the slowest path - the form is invalid.
+            'email': 'benchmark-0@EXAMPLE.com',
+            'password1': 'a-Long-password-1',
+            'password2': 'a-Long-password-1',
+        }
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            form = UserRegisterForm(data)
+            form.is_valid()
+            timings.append((time.perf_counter() - started) * 1000)
+        if 'email' not in form.errors:
+            raise CommandError('Email in another case was not rejected.')
+
+        plan = json.loads(users_with_email(data['email']).explain(format='json'))[0]['Plan']
+        return self.report(users_count, timings, self.uses_seq_scan(plan))
+
+    def report(self, users_count, timings, seq_scan):
+        """ Print the timings of one number of users, returns [users_count] if it failed. """
+
+        median = statistics.median(timings)
+        slowest = max(timings)
+        line = f'{users_count:>9} users: median {median:.2f}ms, max {slowest:.2f}ms'
+        if seq_scan:
+            self.stdout.write(self.style.ERROR(f'FAIL {line}, Seq Scan'))
+            return [str(users_count)]
+        self.stdout.write(f'ok   {line}')
+        return []
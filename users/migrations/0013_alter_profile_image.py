@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-18 17:45
+
+from django.db import migrations, models
+import library_project.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_profile_image_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='image',
+            field=models.ImageField(default='default_user.jpg', upload_to=library_project.utils.HashedUploadTo('profile_pics')),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+# Functional index on the contrib auth_user table, not expressible in Meta of User.
+# Empty emails(createsuperuser allows them) are left out, so that they may repeat.
+# Lookups must repeat the condition to use it, check users.forms.email_taken.
+CREATE_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS auth_user_email_lower_uniq
+ON auth_user (lower(email)) WHERE email <> ''
+"""
+
+DROP_INDEX = 'DROP INDEX IF EXISTS auth_user_email_lower_uniq'
+
+
+def check_duplicate_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='')
+        .values(email_lower=Lower('email'))
+        .annotate(users=Count('id'))
+        .filter(users__gt=1)
+        .values_list('email_lower', flat=True)[:20])
+    if duplicates:
+        raise RuntimeError(
+            'Change the emails used by more than one user before migrating: '
+            + ', '.join(duplicates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0013_alter_profile_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+# Books saved more than once by a user(double clicks before the constraint),
+# the oldest row is kept and the favourites counter of the book is decreased.
+REMOVE_DUPLICATES = """
+WITH removed AS (
+    DELETE FROM users_profilefavouritebooks duplicate
+    USING users_profilefavouritebooks kept
+    WHERE duplicate.user_id = kept.user_id
+        AND duplicate.book_id = kept.book_id
+        AND duplicate.id > kept.id
+    RETURNING duplicate.id, duplicate.book_id
+)
+UPDATE books_book
+SET favourites_count = GREATEST(favourites_count - removed_books.count, 0)
+FROM (SELECT book_id, count(DISTINCT id) AS count FROM removed GROUP BY book_id) removed_books
+WHERE books_book.id = removed_books.book_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0024_book_counters'),
+        ('users', '0014_user_email_lower_unique'),
+    ]
+
+    operations = [
+        migrations.RunSQL(REMOVE_DUPLICATES, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='profilefavouritebooks',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='unique_favourite_book'),
+        ),
+    ]
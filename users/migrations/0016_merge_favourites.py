@@ -0,0 +1,49 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+# Books saved in the old Profile.favourites M2M which are not in ProfileFavouriteBooks
+# are copied there and counted in Book.favourites_count(counted from ProfileFavouriteBooks only).
+MERGE_FAVOURITES = """
+WITH merged AS (
+    INSERT INTO users_profilefavouritebooks (user_id, book_id, created_at)
+    SELECT profile_id, book_id, now() FROM users_profile_favourites
+    ON CONFLICT (user_id, book_id) DO NOTHING
+    RETURNING book_id
+)
+UPDATE books_book
+SET favourites_count = favourites_count + merged_books.count,
+    neighbours_stale = true
+FROM (SELECT book_id, count(*) AS count FROM merged GROUP BY book_id) merged_books
+WHERE books_book.id = merged_books.book_id
+"""
+
+# Runs after the M2M table is created again.
+RESTORE_FAVOURITES = """
+INSERT INTO users_profile_favourites (profile_id, book_id)
+SELECT user_id, book_id FROM users_profilefavouritebooks
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0026_similar_books'),
+        ('users', '0015_unique_favourite_book'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profilefavouritebooks',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(MERGE_FAVOURITES, RESTORE_FAVOURITES),
+        migrations.RemoveField(
+            model_name='profile',
+            name='favourites',
+        ),
+        migrations.AddIndex(
+            model_name='profilefavouritebooks',
+            index=models.Index(fields=['user', 'created_at', 'book'], name='favourite_user_created_idx'),
+        ),
+    ]
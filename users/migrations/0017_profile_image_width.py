@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_merge_favourites'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_width',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,26 +1,25 @@
-from books.models import Book
+from books.models import Book, ProcessedImageFields
 from django.contrib.auth.models import User
 from django.db import models
-from library_project.utils import is_image_resizable
+from django.utils import timezone
+from library_project.utils import HashedUploadTo
 
 
-class Profile(models.Model):
+class Profile(ProcessedImageFields):
     # cascade -> if user is deleted, delete the profile too
     # but if we delete the profile, it won't delete the user
     # JUST ONE WAY thing , MAKE IT TWO WAY THING
 
     image = models.ImageField(
         default='default_user.jpg',
-        upload_to='profile_pics'
+        upload_to=HashedUploadTo('profile_pics')
     )
 
     user = models.OneToOneField(
         User, on_delete=models.CASCADE,
         primary_key=True)
 
-    # Could be done with another Model "FavouriteBook" if needed.
-    # Blank for admin not to be required.
-    favourites = models.ManyToManyField(Book, blank=True)
+    # Saved books - ProfileFavouriteBooks.
 
     # Could be done with another Model "Like" if needed.
     # https://stackoverflow.com/questions/2606194/django-error-message-add-a-related-name-argument-to-the-definition - related_name
@@ -31,8 +30,9 @@ class Profile(models.Model):
     # to apply changes -> make migrations(prepare SQL code) -> migrate(update the DB)
 
     def save(self, *args, **kwargs):
+        # resized by 'manage.py process_images' if changed, check ProcessedImageFields.
+        self.queue_image_processing()
         super().save(*args, **kwargs)
-        is_image_resizable(self.image.path)
 
     def __str__(self):
         return f'{self.user.username} Profile'
@@ -42,6 +42,19 @@ class ProfileFavouriteBooks(models.Model):
     
     user = models.ForeignKey(Profile, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    # order of the saved books(FavouritesView).
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            # saved once, INSERT ... ON CONFLICT DO NOTHING relies on it(users/toggles.py).
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_favourite_book'),
+        ]
+        indexes = [
+            # saved books of a user, newest first, read backwards by keyset pages.
+            models.Index(fields=['user', 'created_at', 'book'], name='favourite_user_created_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.user.username} Profile | {self.book.name} Book'
\ No newline at end of file
+        # ids, no queries for the profile and the book.
+        return f'{self.user_id} Profile | {self.book_id} Book'
\ No newline at end of file
@@ -1,3 +1,91 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.db import IntegrityError
 from django.test import TestCase
+from django.urls import reverse
+from library_project.utils import user_has_group
+
+from users.backends import UserContextBackend
+from users.forms import UserRegisterForm, UserUpdateForm, email_taken
+
+
+class TestUserContextBackend(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.user.groups.add(Group.objects.create(name='limited-CRUD'))
+
+    def test_user_is_loaded_with_profile_and_groups_in_one_query(self):
+        with self.assertNumQueries(1):
+            user = UserContextBackend().get_user(self.user.pk)
+            self.assertEqual(user.profile.pk, self.user.pk)
+            self.assertTrue(user_has_group(user, 'full-CRUD', 'limited-CRUD'))
+            self.assertFalse(user_has_group(user, 'full-CRUD'))
+
+    def test_user_without_groups(self):
+        user = User.objects.create_user(username='nogroups', password='12345')
+
+        with self.assertNumQueries(1):
+            self.assertFalse(user_has_group(UserContextBackend().get_user(user.pk), 'full-CRUD'))
+
+    def test_group_checks_of_a_request_use_the_loaded_groups(self):
+        self.client.login(username='testuser', password='12345')
+
+        # session, user with profile and groups, books(users are listed for full-CRUD only)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('website_admin_part'))
+        self.assertEqual(response.status_code, 200)
+
+
+class TestUniqueEmail(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='testuser', email='Test@Example.com', password='12345')
+
+    def register_data(self, email):
+        return {
+            'username': 'newuser',
+            'email': email,
+            'password1': 'a-Long-password-1',
+            'password2': 'a-Long-password-1',
+        }
+
+    def test_email_in_another_case_is_taken(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(email_taken('test@EXAMPLE.com'))
+        self.assertFalse(email_taken('other@example.com'))
+
+    def test_register_form_rejects_taken_email(self):
+        form = UserRegisterForm(self.register_data('TEST@example.com'))
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['email'], ['Email already exists.'])
+
+    def test_update_form_accepts_own_email(self):
+        form = UserUpdateForm(
+            {'username': 'testuser', 'email': 'test@example.com'}, instance=self.user)
+
+        self.assertTrue(form.is_valid())
+
+    def test_database_rejects_same_email_in_another_case(self):
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(username='other', email='TEST@example.com')
+
+    def test_concurrent_registration_becomes_form_error(self):
+        # the other request registered the email after this form was validated.
+        with patch('users.forms.email_taken', return_value=False):
+            response = self.client.post(reverse('register'), self.register_data('test@example.com'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].errors['email'], ['Email already exists.'])
+        self.assertFalse(User.objects.filter(username='newuser').exists())
+
+    def test_register(self):
+        response = self.client.post(reverse('register'), self.register_data('new@example.com'))
 
-# Create your tests here.
+        self.assertRedirects(response, reverse('login'))
+        self.assertTrue(User.objects.filter(username='newuser').exists())
@@ -0,0 +1,79 @@
+from books.models import Book
+from django.db import connection
+
+from users.models import Profile, ProfileFavouriteBooks
+
+# Row of the user and the book inserted, counter increased, in one statement.
+# Book which doesn't exist - nothing is inserted and no row returned.
+ADD = """
+WITH changed AS (
+    INSERT INTO {table} ({user_column}, book_id{created_column})
+    SELECT %(user_id)s, id{created_value} FROM {books} WHERE id = %(book_id)s
+    ON CONFLICT DO NOTHING
+    RETURNING book_id
+)
+UPDATE {books}
+SET {counter} = {counter} + (SELECT count(*) FROM changed),
+    neighbours_stale = neighbours_stale OR EXISTS (SELECT 1 FROM changed)
+WHERE id = %(book_id)s
+RETURNING {counter}
+"""
+
+REMOVE = """
+WITH changed AS (
+    DELETE FROM {table}
+    WHERE {user_column} = %(user_id)s AND book_id = %(book_id)s
+    RETURNING book_id
+)
+UPDATE {books}
+SET {counter} = GREATEST({counter} - (SELECT count(*) FROM changed), 0),
+    neighbours_stale = neighbours_stale OR EXISTS (SELECT 1 FROM changed)
+WHERE id = %(book_id)s
+RETURNING {counter}
+"""
+
+
+class BookToggle:
+    """
+        Like or save of a book set in one statement(PostgreSQL):
+        INSERT ... ON CONFLICT DO NOTHING or DELETE ... RETURNING in a CTE of the UPDATE
+        of the book counter. Double clicks and concurrent requests can't add a row twice
+        or count it twice, the unique constraint decides, the counter changes by the rows
+        really inserted or deleted.
+        https://www.postgresql.org/docs/current/queries-with.html#QUERIES-WITH-MODIFYING
+
+        Signals of books/signals.py are not sent for these rows, the counter
+        and Book.neighbours_stale are changed by the statement.
+    """
+
+    def __init__(self, model, user_column, counter, created_column=None):
+        self.model = model
+        self.user_column = user_column
+        self.counter = counter
+        # model default(timezone.now) is not a database default.
+        self.created_column = created_column
+
+    def sql(self, template):
+        quote = connection.ops.quote_name
+        return template.format(
+            table=quote(self.model._meta.db_table),
+            user_column=quote(self.user_column),
+            books=quote(Book._meta.db_table),
+            counter=quote(self.counter),
+            created_column=f', {quote(self.created_column)}' if self.created_column else '',
+            created_value=', now()' if self.created_column else '',
+        )
+
+    def set(self, user_id, book_id, active):
+        """ Add(active) or remove the row, returns the new count, None if there is no such book. """
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self.sql(ADD if active else REMOVE),
+                {'user_id': user_id, 'book_id': book_id})
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
+LIKE = BookToggle(Profile.likes.through, 'profile_id', 'likes_count')
+SAVE = BookToggle(ProfileFavouriteBooks, 'user_id', 'favourites_count', 'created_at')
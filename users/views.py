@@ -4,14 +4,39 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
 from django.contrib.messages.views import SuccessMessageMixin
-from django.shortcuts import get_object_or_404, redirect, render
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import redirect, render
 from django.urls import reverse, reverse_lazy
+from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, DeleteView, DetailView, ListView
-from library_project.utils import delete_profile_or_book_image, is_user_admin_or_profile_owner
-
-from users.models import Profile, ProfileFavouriteBooks
-
-from .forms import ProfileUpdateForm, UserRegisterForm, UserUpdateForm
+from library_project.identity import IdentityMapMixin, request_object
+from library_project.utils import (is_user_admin_or_profile_owner,
+                                   user_has_group)
+
+from users.models import Profile
+from users.toggles import LIKE, SAVE
+
+from .forms import (ProfileUpdateForm, UserRegisterForm, UserUpdateForm,
+                    email_taken)
+
+
+def save_user_forms(user_form, *forms):
+    """
+        Save the forms in one transaction.
+        False, with the error on the email field, if another user took the email
+        after the form was validated(unique lower(email) index).
+    """
+    try:
+        with transaction.atomic():
+            for form in (user_form, *forms):
+                form.save()
+    except IntegrityError:
+        if not email_taken(user_form.cleaned_data['email'], exclude_pk=user_form.instance.pk):
+            raise
+        user_form.add_error('email', user_form.EMAIL_EXISTS)
+        return False
+    return True
 
 
 # https://stackoverflow.com/questions/10018757/how-does-the-order-of-mixins-affect-the-derived-class
@@ -32,8 +57,15 @@ class UserRegisterView(SuccessMessageMixin, CreateView):
             return redirect('website_home')
         return super().dispatch(*args, **kwargs)
 
+    def form_valid(self, form):
+        if not save_user_forms(form):
+            return self.form_invalid(form)
+        self.object = form.instance
+        messages.success(self.request, self.get_success_message(form.cleaned_data))
+        return redirect(self.get_success_url())
+
 
-class UserDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class UserDeleteView(LoginRequiredMixin, UserPassesTestMixin, IdentityMapMixin, DeleteView):
     model = User
     template_name = 'users/confirm_delete.html'
     context_object_name = 'user_profile'
@@ -53,14 +85,15 @@ class UserDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     #     # OVERRIDE, SO THAT this method doesn't override user variable in templates!
     #     pass
 
-class UserProfileView(LoginRequiredMixin, DetailView):
+class UserProfileView(LoginRequiredMixin, IdentityMapMixin, DetailView):
     model = Profile
     template_name = 'users/profile_details.html'
 
 
 @login_required
 def user_profile_view(request, pk):
-    user = get_object_or_404(User, pk=pk)
+    # profile of the forms in the same query.
+    user = request_object(request, User.objects.select_related('profile'), pk)
     if request.method == 'POST':
         user_update_form = UserUpdateForm(request.POST, instance=user)
 
@@ -69,11 +102,9 @@ def user_profile_view(request, pk):
             request.FILES,
             instance=user.profile)
 
-        if user_update_form.is_valid() and profile_update_form.is_valid():
-            delete_profile_or_book_image(
-                instance=user.profile, form=profile_update_form)
-            user_update_form.save()
-            profile_update_form.save()
+        # previous image is queued for deletion in Profile.save.
+        if user_update_form.is_valid() and profile_update_form.is_valid() \
+                and save_user_forms(user_update_form, profile_update_form):
             messages.success(
                 request, f'Your account has been updated!')
             return redirect('profile', user.id)
@@ -85,7 +116,7 @@ def user_profile_view(request, pk):
         #     # Only superuser can edit his own profile.
         #     return redirect('books_library')
 
-        if request.user.is_superuser or request.user.id == pk or request.user.groups.filter(name='full-CRUD').exists():
+        if request.user.is_superuser or request.user.id == pk or user_has_group(request.user, 'full-CRUD'):
             user_update_form = UserUpdateForm(instance=user)
             profile_update_form = ProfileUpdateForm(instance=user.profile)
         else:
@@ -100,35 +131,33 @@ def user_profile_view(request, pk):
     return render(request, 'users/profile.html', context)
 
 
-@login_required
-def user_save_book_view(request, **kwargs):
-    # https://docs.djangoproject.com/en/4.0/topics/http/shortcuts/#get-object-or-404
-    # https://www.youtube.com/watch?v=H4QPHLmsZMU
-    book = get_object_or_404(Book, pk=kwargs.get('pk'))
-    profile = request.user.profile
-    saved_book = ProfileFavouriteBooks.objects.filter(
-        user_id=profile.user_id,
-        book_id=book.id
-    )
-
-    if saved_book.exists():
-        saved_book.delete()
-    else:
-        ProfileFavouriteBooks.objects.create(
-            user_id=profile.user_id,
-            book_id=book.id
-        )
+def book_toggle_view(request, pk, toggle, state):
+    """
+        POST {state: 'true' or 'false'} - the state wanted, not a switch,
+        so repeating a request(double click) changes nothing.
+        JSON {state: bool, 'count': int} for fetch(save_like_anchors.html),
+        redirect to the book for the form without JavaScript.
+    """
+    active = request.POST.get(state)
+    if active not in ('true', 'false'):
+        return HttpResponseBadRequest(f"'{state}' must be 'true' or 'false'.")
 
-    return redirect(book.get_absolute_url())
+    count = toggle.set(request.user.pk, pk, active == 'true')
+    if count is None:
+        raise Http404('No book found.')
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({state: active == 'true', 'count': count})
+    return redirect(Book.objects.only('slug').get(pk=pk).get_absolute_url())
 
 
 @login_required
-def user_like_book_view(request, **kwargs):
-    book = get_object_or_404(Book, pk=kwargs.get('pk'))
-    profile = request.user.profile
-    if profile.likes.filter(id=book.id).exists():
-        profile.likes.remove(book)
-    else:
-        profile.likes.add(book)
+@require_POST
+def user_save_book_view(request, pk):
+    return book_toggle_view(request, pk, SAVE, 'saved')
 
-    return redirect(book.get_absolute_url())
+
+@login_required
+@require_POST
+def user_like_book_view(request, pk):
+    return book_toggle_view(request, pk, LIKE, 'liked')
@@ -0,0 +1,169 @@
+import os
+import re
+from datetime import timedelta
+
+from books.models import Book
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from library_project.utils import (VARIANTS_DIRECTORY, delete_image_variants,
+                                   original_path)
+from users.models import Profile
+from website.models import MediaDeletion
+
+# books_pics/variants/cover-184w.webp -> cover
+VARIANT_STEM = re.compile(r'^(?P<stem>.+)-\d+w$')
+
+
+class Command(BaseCommand):
+    """
+        Delete uploaded files which are not referenced by any Book or Profile.
+        1. Files queued in MediaDeletion (replaced or deleted images).
+        2. With --scan, every file under the upload directories(and their originals
+           in IMAGE_ORIGINALS_ROOT) is compared with the image names in the DB,
+           read with a streamed cursor into a set.
+        Files younger than the grace period are kept, their rows may not be committed yet.
+
+        python manage.py collect_media --scan --dry-run
+    """
+
+    help = 'Delete orphaned book covers and profile pictures and their originals.'
+
+    MODELS = (Book, Profile)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scan', action='store_true',
+            help='Also compare all files in MEDIA_ROOT with the database.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only print what would be deleted.')
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Keep files queued or modified less than this many hours ago.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Files deleted at once.')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        deleted = self.collect_queued(cutoff)
+        if options['scan']:
+            deleted += self.collect_unreferenced(cutoff)
+
+        action = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(f'{action} {deleted} files.')
+
+    def referenced_names(self, names=None):
+        """
+            Image names used by any model.
+            Limited to given names or all of them with a server-side cursor(iterator),
+            so rows are not loaded in memory at once.
+        """
+
+        referenced = set()
+        for model in self.MODELS:
+            queryset = model.objects.all()
+            if names is not None:
+                queryset = queryset.filter(image__in=names)
+            referenced.update(
+                queryset.values_list('image', flat=True).iterator(chunk_size=5000))
+        return referenced
+
+    def delete_files(self, names):
+        for name in names:
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if self.dry_run:
+                self.stdout.write(f'Would delete {name}')
+                continue
+            for file_path in (path, original_path(name, settings.IMAGE_ORIGINALS_ROOT)):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            delete_image_variants(path)
+
+    def collect_queued(self, cutoff):
+        deleted = 0
+        queue = MediaDeletion.objects.filter(requested_at__lt=cutoff)
+        last_pk = 0
+
+        while True:
+            batch = list(queue.filter(pk__gt=last_pk).order_by('pk')[:self.batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            names = {deletion.name for deletion in batch}
+            # uploaded again with same name in the meantime.
+            orphans = names - self.referenced_names(names)
+            self.delete_files(orphans)
+            deleted += len(orphans)
+
+            if not self.dry_run:
+                MediaDeletion.objects.filter(pk__in=[deletion.pk for deletion in batch]).delete()
+
+        return deleted
+
+    def upload_directories(self):
+        """ Upload directories relative to MEDIA_ROOT(and IMAGE_ORIGINALS_ROOT). """
+
+        for model in self.MODELS:
+            yield model._meta.get_field('image').upload_to.directory
+
+    def old_files(self, directory, cutoff_timestamp):
+        if not os.path.isdir(directory):
+            return
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < cutoff_timestamp:
+                    yield entry
+
+    def unreferenced_files(self, cutoff, referenced):
+        """
+            Names of old files in upload directories(and their variants and originals)
+            not in referenced. Variants and originals are deleted with the name
+            of their image, check delete_files.
+        """
+
+        referenced_stems = {os.path.splitext(name)[0] for name in referenced}
+        cutoff_timestamp = cutoff.timestamp()
+
+        for directory in self.upload_directories():
+            media_directory = os.path.join(settings.MEDIA_ROOT, directory)
+            unreferenced = set()
+            for entry in self.old_files(media_directory, cutoff_timestamp):
+                name = os.path.join(directory, entry.name)
+                if name not in referenced:
+                    unreferenced.add(name)
+                    yield name
+
+            variants_directory = os.path.join(media_directory, VARIANTS_DIRECTORY)
+            for entry in self.old_files(variants_directory, cutoff_timestamp):
+                match = VARIANT_STEM.match(os.path.splitext(entry.name)[0])
+                stem = os.path.join(directory, match['stem'] if match else entry.name)
+                if stem not in referenced_stems:
+                    yield os.path.relpath(entry.path, settings.MEDIA_ROOT)
+
+            # same name as the processed image.
+            originals_directory = os.path.join(settings.IMAGE_ORIGINALS_ROOT, directory)
+            for entry in self.old_files(originals_directory, cutoff_timestamp):
+                name = os.path.join(directory, entry.name)
+                if name not in referenced and name not in unreferenced:
+                    yield name
+
+    def collect_unreferenced(self, cutoff):
+        referenced = self.referenced_names()
+        deleted = 0
+        batch = []
+
+        for name in self.unreferenced_files(cutoff, referenced):
+            batch.append(name)
+            if len(batch) == self.batch_size:
+                self.delete_files(batch)
+                deleted += len(batch)
+                batch = []
+
+        self.delete_files(batch)
+        return deleted + len(batch)
@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from books.models import Book
+from django.core.management.base import BaseCommand
+from library_project.images import process_pending_images, requeue_images
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    """
+        Worker that resizes uploaded book covers and profile pictures.
+        Book.save() and Profile.save() only mark the image as pending,
+        this command picks pending images up after the transaction is committed.
+
+        python manage.py process_images --workers 4
+        https://docs.djangoproject.com/en/4.0/howto/custom-management-commands/
+    """
+
+    help = 'Resize pending book covers and profile pictures in a process pool.'
+
+    MODELS = (Book, Profile)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of processes, defaults to the number of CPUs.')
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Images claimed from the database at once.')
+        parser.add_argument(
+            '--sleep', type=float, default=5,
+            help='Seconds to wait when there is nothing to process.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is empty instead of polling.')
+        parser.add_argument(
+            '--requeue', action='store_true',
+            help='Queue failed and interrupted images again before starting.')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            for model in self.MODELS:
+                count = requeue_images(model)
+                self.stdout.write(
+                    f'{model.__name__}: {count} images queued again.')
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                processed = 0
+                for model in self.MODELS:
+                    count = process_pending_images(
+                        model, executor, options['batch_size'])
+                    if count:
+                        self.stdout.write(
+                            f'{model.__name__}: {count} images processed.')
+                    processed += count
+
+                if not processed:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
@@ -0,0 +1,117 @@
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
+from books.models import Book
+from django.core.management.base import BaseCommand
+from library_project.images import (image_processing_options,
+                                    image_processing_version, reprocess_image,
+                                    save_ready_images)
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    """
+        Process again all uploaded images after IMAGE_SIZE or IMAGE_VARIANT_* settings change.
+        Every processed image stores the version of the options it was processed with,
+        so images which are up to date are skipped by the query, not by opening the file.
+        Images are made again from the uploads kept in IMAGE_ORIGINALS_ROOT(check process_image),
+        not from the resized files. Results are saved after every batch, an interrupted run continues
+        where it stopped. Images which fail keep their status and are printed.
+
+        python manage.py reprocess_images --workers 8
+    """
+
+    help = 'Resize all book covers and profile pictures processed with old settings.'
+
+    MODELS = {'book': Book, 'profile': Profile}
+
+    # Results of processed files kept for the next batches, cleared when full.
+    RESULT_CACHE_SIZE = 100_000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=self.MODELS.keys(), action='append',
+            help='Only reprocess images of given model, can be repeated.')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of processes, defaults to the number of CPUs.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Images read from the database and saved at once.')
+
+    def handle(self, *args, **options):
+        models = [self.MODELS[name] for name in options['model'] or self.MODELS]
+        processing_options = image_processing_options()
+
+        with Pool(processes=options['workers']) as pool:
+            for model in models:
+                self.reprocess(model, pool, processing_options,
+                               options['batch_size'])
+
+    def get_queryset(self, model, version):
+        """
+            Processed images with other version.
+            Pending images are left to 'manage.py process_images'.
+        """
+
+        return (
+            model.objects
+            .filter(image_status=model.IMAGE_STATUS_READY)
+            .exclude(image_version=version)
+            .exclude(image=model._meta.get_field('image').default)
+        )
+
+    def reprocess(self, model, pool, processing_options, batch_size):
+        version = image_processing_version(processing_options)
+        queryset = self.get_queryset(model, version)
+        total = queryset.count()
+        self.stdout.write(f'{model.__name__}: {total} images to reprocess.')
+
+        done = 0
+        last_pk = None
+        started = time.monotonic()
+        # (width, error) by image name.
+        results = {}
+
+        while True:
+            # keyset over pk, rows are updated while iterating.
+            batch = queryset.order_by('pk').only('pk', 'image')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            # imported books may share a file, it's processed once per run.
+            pks = defaultdict(list)
+            paths = {}
+            for instance in batch:
+                pks[instance.image.name].append(instance.pk)
+                paths[instance.image.name] = instance.image.path
+            if len(results) + len(pks) > self.RESULT_CACHE_SIZE:
+                results.clear()
+            items = [(name, path, processing_options)
+                     for name, path in paths.items() if name not in results]
+            for name, width, error in pool.imap_unordered(reprocess_image, items, chunksize=16):
+                results[name] = width, error
+
+            ready, failed = [], 0
+            for name, name_pks in pks.items():
+                width, error = results[name]
+                if error is None:
+                    ready.extend((pk, name, width) for pk in name_pks)
+                    continue
+                # the image processed with the old settings is still valid, its status is kept.
+                failed += len(name_pks)
+                for pk in name_pks:
+                    self.stderr.write(f'{model.__name__} {pk} {name}: {error}')
+
+            # rows with a new upload meanwhile are PENDING, left to 'manage.py process_images'.
+            save_ready_images(model, ready, model.IMAGE_STATUS_READY, processing_options)
+
+            done += len(batch)
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{model.__name__}: {done}/{total} ({rate:.0f} images/s), {failed} failed in batch.')
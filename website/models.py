@@ -1,3 +1,31 @@
 from django.db import models
+from django.utils import timezone
+from library_project.utils import is_default_image
 
-# Create your models here.
+
+class MediaDeletion(models.Model):
+    """
+        Uploaded file which is no longer needed.
+        Requests only add rows here, files are removed later by 'manage.py collect_media',
+        so that a rolled back transaction never loses a file which is still referenced.
+    """
+
+    name = models.CharField(max_length=255)
+
+    requested_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['requested_at']
+
+    @classmethod
+    def schedule(cls, *names):
+        """ Queue files by name(relative to MEDIA_ROOT), default images are never deleted. """
+
+        cls.objects.bulk_create([
+            cls(name=name)
+            for name in names
+            if name and not is_default_image(name)
+        ])
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,14 @@
+from books.models import Book
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from users.models import Profile
+
+from .models import MediaDeletion
+
+
+# post_delete is sent for every book deleted by CASCADE too(user deleted),
+# so their images don't stay in MEDIA_ROOT.
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Profile)
+def schedule_image_deletion(sender, instance, **kwargs):
+    MediaDeletion.schedule(instance.image.name)
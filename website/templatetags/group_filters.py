@@ -1,5 +1,6 @@
 from tokenize import group
 from django import template
+from library_project.utils import user_has_group
 
 register = template.Library()
 
@@ -9,5 +10,5 @@ def has_group(user, group_names):
     """
         Check if user has atleast one of the given group names.
     """
-    group_names = group_names.split(', ')
-    return user.groups.filter(name__in=group_names).exists()
+    # loaded with the user, check users.backends.UserContextBackend.
+    return user_has_group(user, *group_names.split(', '))
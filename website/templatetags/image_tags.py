@@ -0,0 +1,46 @@
+from django import template
+from django.conf import settings
+from library_project.images import (image_processing_options,
+                                    image_processing_version)
+from library_project.utils import is_default_image, variant_name
+
+register = template.Library()
+
+
+@register.inclusion_tag('website/tags/responsive_image.html')
+def responsive_image(instance, sizes, css_class='', alt=''):
+    """
+        <picture> with srcset of the image variants(check create_image_variants in utils),
+        so the browser downloads the smallest file which fits 'sizes'.
+        Falls back to plain <img> until the variants are created, also for images
+        processed with other settings(or before variants existed) until 'manage.py reprocess_images'.
+        https://developer.mozilla.org/en-US/docs/Learn/HTML/Multimedia_and_embedding/Responsive_images
+    """
+    image = instance.image
+    sources = []
+
+    has_variants = (
+        instance.image_status == instance.IMAGE_STATUS_READY
+        and not is_default_image(image)
+        and instance.image_version == image_processing_version(image_processing_options())
+    )
+    # larger variants are not created, check create_image_variants.
+    widths = [width for width in settings.IMAGE_VARIANT_WIDTHS if width <= instance.image_width]
+
+    if has_variants and widths:
+        for extension in settings.IMAGE_VARIANT_FORMATS:
+            urls = (
+                (instance.versioned_url(image.storage.url(
+                    variant_name(image.name, width, extension))), width)
+                for width in widths
+            )
+            srcset = ', '.join(f'{url} {width}w' for url, width in urls)
+            sources.append({'type': f'image/{extension}', 'srcset': srcset})
+
+    return {
+        'src': instance.image_url,
+        'sources': sources,
+        'sizes': sizes,
+        'css_class': css_class,
+        'alt': alt,
+    }
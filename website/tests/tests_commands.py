@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from books.models import Book
+from books.tests.fixtures import create_author, create_book, create_user
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from library_project.images import process_pending_images
+from library_project.utils import VARIANTS_DIRECTORY, original_path
+from PIL import Image
+from users.models import Profile
+from website.models import MediaDeletion
+
+MEDIA_ROOT = tempfile.mkdtemp()
+ORIGINALS_ROOT = tempfile.mkdtemp()
+
+
+def create_uploaded_image(name='test.jpg'):
+    content = BytesIO()
+    Image.new('RGB', (40, 40), 'white').save(content, 'JPEG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_ORIGINALS_ROOT=ORIGINALS_ROOT)
+class TestCollectMediaCommand(TestCase):
+    """
+        Requests only queue files for deletion,
+        'manage.py collect_media' deletes them.
+        --grace-hours=0 so that files created in the test are old enough.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(ORIGINALS_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='12345')
+        self.profile = self.user.profile
+        self.profile.image = create_uploaded_image('first.jpg')
+        self.profile.save()
+        self.first_image_path = self.profile.image.path
+
+    def collect_media(self, *args):
+        output = StringIO()
+        call_command('collect_media', '--grace-hours=0', *args, stdout=output)
+        return output.getvalue()
+
+    def test_replaced_image_is_queued_and_collected(self):
+        self.profile.image = create_uploaded_image('second.jpg')
+        self.profile.save()
+
+        self.assertTrue(MediaDeletion.objects.filter(
+            name=os.path.relpath(self.first_image_path, MEDIA_ROOT)).exists())
+        # not deleted in the request.
+        self.assertTrue(os.path.exists(self.first_image_path))
+
+        self.collect_media()
+
+        self.assertFalse(os.path.exists(self.first_image_path))
+        self.assertTrue(os.path.exists(self.profile.image.path))
+        self.assertEqual(MediaDeletion.objects.count(), 0)
+
+    def test_original_of_replaced_image_is_collected(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+        first_original = original_path(self.profile.image.name, ORIGINALS_ROOT)
+        self.assertTrue(os.path.exists(first_original))
+
+        self.profile.image = create_uploaded_image('second.jpg')
+        self.profile.save()
+        self.collect_media()
+
+        self.assertFalse(os.path.exists(first_original))
+
+    def test_image_of_deleted_user_is_collected(self):
+        self.user.delete()
+
+        self.collect_media()
+
+        self.assertFalse(os.path.exists(self.first_image_path))
+
+    def test_default_image_is_never_queued(self):
+        self.profile.image = 'default_user.jpg'
+        self.profile.save()
+        self.profile.delete()
+
+        self.assertFalse(MediaDeletion.objects.filter(
+            name='default_user.jpg').exists())
+
+    def test_scan_deletes_unreferenced_files(self):
+        orphan_path = os.path.join(MEDIA_ROOT, 'profile_pics', 'orphan.jpg')
+        with open(orphan_path, 'wb') as orphan:
+            orphan.write(b'orphan')
+
+        output = self.collect_media('--scan', '--dry-run')
+        self.assertIn('Would delete profile_pics/orphan.jpg', output)
+        self.assertTrue(os.path.exists(orphan_path))
+
+        self.collect_media('--scan')
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertTrue(os.path.exists(self.first_image_path))
+
+    def test_scan_deletes_unreferenced_originals(self):
+        orphan_path = original_path('profile_pics/orphan.jpg', ORIGINALS_ROOT)
+        os.makedirs(os.path.dirname(orphan_path), exist_ok=True)
+        with open(orphan_path, 'wb') as orphan:
+            orphan.write(b'orphan')
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            process_pending_images(Profile, executor, 10)
+        self.profile.refresh_from_db()
+        kept_original = original_path(self.profile.image.name, ORIGINALS_ROOT)
+
+        self.collect_media('--scan')
+
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertTrue(os.path.exists(kept_original))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_ORIGINALS_ROOT=ORIGINALS_ROOT,
+                   IMAGE_VARIANT_WIDTHS=[40, 80], IMAGE_VARIANT_FORMATS=['webp'])
+class TestReprocessImagesCommand(TestCase):
+    """
+        'manage.py reprocess_images', the process pool is replaced by map
+        in this process, so that the processed files can be counted.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(ORIGINALS_ROOT, ignore_errors=True)
+
+    def test_shared_file_is_processed_once(self):
+        os.makedirs(os.path.join(MEDIA_ROOT, 'books_pics'), exist_ok=True)
+        Image.new('RGB', (800, 1000), 'white').save(
+            os.path.join(MEDIA_ROOT, 'books_pics', 'shared.jpg'))
+        user, author = create_user(), create_author()
+        books = [create_book(author, user, title)
+                 for title in ('Dune', 'Dune Messiah', 'Children of Dune')]
+        Book.objects.filter(pk__in=[book.pk for book in books]).update(
+            image='books_pics/shared.jpg', image_status=Book.IMAGE_STATUS_READY, image_version='old')
+
+        with patch('website.management.commands.reprocess_images.Pool') as pool:
+            imap = pool.return_value.__enter__.return_value.imap_unordered
+            imap.side_effect = lambda function, items, chunksize: map(function, items)
+            call_command('reprocess_images', model=['book'], batch_size=2, stdout=StringIO())
+
+        items = [item for call in imap.call_args_list for item in call.args[1]]
+        self.assertEqual([name for name, _, _ in items], ['books_pics/shared.jpg'])
+        self.assertEqual(Book.objects.exclude(image_version='old').count(), 3)
+        variants = os.listdir(os.path.join(MEDIA_ROOT, 'books_pics', VARIANTS_DIRECTORY))
+        self.assertEqual(sorted(variants), ['shared-40w.webp', 'shared-80w.webp'])
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_SENDFILE=None)
+class TestServeMediaView(TestCase):
+    """
+        Uploaded files are served by website.views.serve_media,
+        Django streams them when MEDIA_SENDFILE is not set.
+    """
+
+    CONTENT = b'0123456789'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(MEDIA_ROOT, 'books_pics'), exist_ok=True)
+        for name in ('plain.jpg', 'cover.3f2a9c0d1b7e.jpg'):
+            with open(os.path.join(MEDIA_ROOT, 'books_pics', name), 'wb') as file:
+                file.write(cls.CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def media_url(self, name):
+        return reverse('media', kwargs={'path': f'books_pics/{name}'})
+
+    def test_file_response(self):
+        response = self.client.get(self.media_url('plain.jpg'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertIn('ETag', response)
+
+    def test_hashed_file_is_immutable(self):
+        response = self.client.get(self.media_url('cover.3f2a9c0d1b7e.jpg'))
+
+        self.assertEqual(response['Cache-Control'],
+                         'public, max-age=31536000, immutable')
+
+    def test_not_modified(self):
+        etag = self.client.get(self.media_url('plain.jpg'))['ETag']
+
+        response = self.client.get(
+            self.media_url('plain.jpg'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(
+            self.media_url('plain.jpg'), HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+    def test_suffix_range(self):
+        response = self.client.get(
+            self.media_url('plain.jpg'), HTTP_RANGE='bytes=-3')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'789')
+        self.assertEqual(response['Content-Range'], 'bytes 7-9/10')
+
+    def test_invalid_range_sends_whole_file(self):
+        response = self.client.get(
+            self.media_url('plain.jpg'), HTTP_RANGE='bytes=5-2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+
+    def test_range_not_satisfiable(self):
+        for byte_range in ('bytes=-0', 'bytes=10-', 'bytes=20-30'):
+            with self.subTest(byte_range=byte_range):
+                response = self.client.get(
+                    self.media_url('plain.jpg'), HTTP_RANGE=byte_range)
+
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */10')
+                self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.media_url('plain.jpg'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/books_pics/plain.jpg')
+        self.assertEqual(response.content, b'')
+
+    def test_original_uploads_are_not_served(self):
+        originals = os.path.join(MEDIA_ROOT, 'books_pics', 'originals')
+        os.makedirs(originals, exist_ok=True)
+        with open(os.path.join(originals, 'cover.3f2a9c0d1b7e.jpg'), 'wb') as file:
+            file.write(self.CONTENT)
+
+        response = self.client.get(self.media_url('originals/cover.3f2a9c0d1b7e.jpg'))
+        self.assertEqual(response.status_code, 404)
+
+        with override_settings(IMAGE_ORIGINALS_ROOT=os.path.join(MEDIA_ROOT, 'books_pics')):
+            response = self.client.get(self.media_url('plain.jpg'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_file_and_path_outside_media_root(self):
+        self.assertEqual(
+            self.client.get(self.media_url('missing.jpg')).status_code, 404)
+        self.assertEqual(
+            self.client.get('/media/../manage.py').status_code, 404)
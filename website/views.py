@@ -1,7 +1,23 @@
+import mimetypes
+import os
+import re
+
 from books.models import Book
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import redirect, render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 from django.views.generic import TemplateView
+from library_project.utils import (ORIGINALS_DIRECTORY, is_hashed_name,
+                                   user_has_group)
+
+# Range: bytes=0-499 or bytes=500- or bytes=-500, only a single range is supported.
+BYTES_RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
 
 
 class HomeView(TemplateView):
@@ -13,10 +29,122 @@ class AboutView(TemplateView):
 
 
 def admin_view(request):
-    if request.user.is_superuser or request.user.groups.filter(name__in=['full-CRUD', 'limited-CRUD']).exists():
+    if request.user.is_superuser or user_has_group(request.user, 'full-CRUD', 'limited-CRUD'):
         context = {
             'books': Book.objects.all().order_by('title', 'author'),
             'users': User.objects.all().order_by('username', 'email'),
         }
         return render(request, 'website/admin_part.html', context)
     return redirect('website_home')
+
+
+class RangeNotSatisfiable(Exception):
+    """ Range which starts at or after the end of the file, or the last 0 bytes. """
+
+
+def get_byte_range(request, etag, size):
+    """
+        (start, end) of the requested Range, end included.
+        None if the whole file should be sent, Range missing or invalid,
+        or If-Range doesn't match the current file.
+        Raises RangeNotSatisfiable if no byte of the file is in the Range.
+        https://developer.mozilla.org/en-US/docs/Web/HTTP/Range_requests
+        https://www.rfc-editor.org/rfc/rfc7233#section-2.1
+    """
+    match = BYTES_RANGE.match(request.headers.get('Range', ''))
+    if not match or request.headers.get('If-Range', etag) != etag:
+        return None
+
+    start, end = match['start'], match['end']
+    if not start and not end:
+        return None
+    if not start:
+        # last N bytes
+        if int(end) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(end), 0), size - 1
+    if end and int(start) > int(end):
+        return None
+    if int(start) >= size:
+        raise RangeNotSatisfiable
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+def is_original_upload(full_path):
+    """
+        Uploads as they were(IMAGE_ORIGINALS_ROOT) keep their EXIF, they are never served,
+        also when the directory is misconfigured inside MEDIA_ROOT.
+    """
+
+    parts = os.path.relpath(full_path, settings.MEDIA_ROOT).split(os.sep)
+    originals_root = os.path.realpath(settings.IMAGE_ORIGINALS_ROOT)
+    return ORIGINALS_DIRECTORY in parts or os.path.commonpath(
+        [os.path.realpath(full_path), originals_root]) == originals_root
+
+
+@require_safe
+def serve_media(request, path):
+    """
+        Uploaded files(MEDIA_ROOT) in production.
+        With MEDIA_SENDFILE set, only headers are sent and the front server(nginx, apache)
+        sends the file, Python workers don't stream the bytes.
+        Files with hash of the content in the name never change, so they are cached forever.
+        Original uploads are never served, check is_original_upload.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('File does not exist.')
+    if not os.path.isfile(full_path) or is_original_upload(full_path):
+        raise Http404('File does not exist.')
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    # 304 Not Modified if If-None-Match / If-Modified-Since match.
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+
+    if response is None:
+        if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+            # front server handles Range itself.
+            response = HttpResponse()
+            response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIX + path
+        elif settings.MEDIA_SENDFILE == 'x-sendfile':
+            response = HttpResponse()
+            response['X-Sendfile'] = full_path
+        else:
+            response = file_response(request, full_path, etag, stat.st_size)
+
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if is_hashed_name(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    return response
+
+
+def file_response(request, full_path, etag, size):
+    """ Whole file or the requested Range, streamed by Django. """
+
+    try:
+        byte_range = get_byte_range(request, etag, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        return FileResponse(open(full_path, 'rb'))
+
+    start, end = byte_range
+    with open(full_path, 'rb') as file:
+        file.seek(start)
+        response = HttpResponse(file.read(end - start + 1), status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response